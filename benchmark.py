@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Callable, Dict, List
+
+# 모의 OpenAI 서버 위에서 주요 흐름의 지연 시간과 rerun 횟수를 측정하는 벤치마크.
+# 실행: python benchmark.py --sizes 10,100,500 --history 10,200
+# 저장소/디스크 캐시는 끄고 측정하며, 앱 import 전에 환경 변수를 설정해야 함
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+# AppTest에서 스크립트 실행 횟수(= rerun 포함 실행 수)를 세기 위한 래퍼
+APP_RUNNER = """
+import runpy
+import streamlit as st
+st.session_state['_bench_runs'] = st.session_state.get('_bench_runs', 0) + 1
+runpy.run_path({path!r}, run_name="__main__")
+"""
+BENCH_API_KEY = "sk-benchmark"
+BENCH_PROFILE = {"age": 30, "gender": "남성", "height": 175, "weight": 70, "activity_level": "보통"}
+BENCH_DEFICIENCY = {"calories": 600, "protein": 30, "carbs": 50, "fat": 10}
+BASE_INGREDIENTS = ["달걀", "양파", "대파", "두부", "감자", "당근", "김치", "돼지고기", "밥", "애호박"]
+
+
+def build_inventory(size: int) -> List[Dict]:
+    now = datetime.now()
+    items = []
+    for i in range(size):
+        name = BASE_INGREDIENTS[i] if i < len(BASE_INGREDIENTS) else f"식재료{i}"
+        items.append({
+            "name": name,
+            "quantity": 10,
+            "unit": "개",
+            "added_date": now.isoformat(),
+            "expiry_date": (now + timedelta(days=1 + i % 14)).isoformat(),
+        })
+    return items
+
+
+def build_history(size: int) -> List[Dict]:
+    start = datetime.now() - timedelta(hours=8 * size)
+    return [{
+        "date": (start + timedelta(hours=8 * i)).isoformat(),
+        "recipe_name": f"식사{i}",
+        "nutrition": {"calories": 550, "protein": 20, "carbs": 70, "fat": 18},
+    } for i in range(size)]
+
+
+def build_receipt_image(width: int = 1200, height: int = 2400) -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(100, height - 100, 60):
+        draw.line([(100, y), (width - 100, y)], fill="black", width=3)
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def measure(repeat: int, func: Callable[[], object]) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(scenario: str, mode: str, inventory_size: int, history_size: int, timings: List[float], **extra) -> Dict:
+    row = {
+        "scenario": scenario,
+        "mode": mode,
+        "inventory": inventory_size,
+        "history": history_size,
+        "n": len(timings),
+        "p50_ms": statistics.median(timings),
+        "max_ms": max(timings),
+    }
+    row.update(extra)
+    return row
+
+
+def bench_client(app, base_url: str, inventory_size: int, history_size: int, repeat: int) -> List[Dict]:
+    from openai import OpenAI
+    # 응답 캐시 없이 매번 모의 서버까지 왕복
+    client = app.GPTClient(BENCH_API_KEY, client=OpenAI(api_key=BENCH_API_KEY, base_url=base_url))
+    inventory = build_inventory(inventory_size)
+    history = build_history(history_size)
+    rows = []
+
+    local_text = ", ".join(f"{item['name']} {item['quantity']}{item['unit']}" for item in inventory)
+    rows.append(summarize("text_add", "local", inventory_size, history_size,
+                          measure(repeat, lambda: client.parse_inventory_from_text(local_text))))
+    rows.append(summarize("text_add", "gpt", inventory_size, history_size,
+                          measure(repeat, lambda: client.parse_inventory_from_text(local_text + ", 우유 한 통"))))
+
+    receipt = build_receipt_image()
+    rows.append(summarize("receipt_add", "pipeline x4", inventory_size, history_size,
+                          measure(repeat, lambda: app.ReceiptPipeline(client).run([receipt] * 4))))
+
+    rows.append(summarize("recommend", "catalog", inventory_size, history_size, measure(
+        repeat, lambda: app.get_recipe_catalog().rank(inventory, BENCH_DEFICIENCY, history)
+    )))
+    rows.append(summarize("recommend", "gpt", inventory_size, history_size, measure(
+        repeat, lambda: client.recommend_recipes(inventory, BENCH_DEFICIENCY, history)
+    )))
+
+    def first_streamed():
+        for _ in client.stream_recipes(inventory, BENCH_DEFICIENCY, history):
+            break
+    rows.append(summarize("recommend", "gpt stream ttfr", inventory_size, history_size, measure(repeat, first_streamed)))
+
+    ingredients = [f"{name} 100g" for name in BASE_INGREDIENTS[:3]]
+
+    def cook():
+        result = client.check_recipe_sufficiency(inventory, ingredients)
+        if result['sufficient']:
+            client.update_inventory_after_cooking(inventory, ingredients)
+    rows.append(summarize("cook", "check+deduct", inventory_size, history_size, measure(repeat, cook)))
+
+    rows.append(summarize("profile_save", "local", inventory_size, history_size, measure(
+        repeat, lambda: app.NutritionCalculator.calculate(BENCH_PROFILE)
+    )))
+    return rows
+
+
+def new_app_test(inventory_size: int, history_size: int):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_string(APP_RUNNER.format(path=APP_PATH), default_timeout=120)
+    at.session_state['api_key'] = BENCH_API_KEY
+    at.run()
+    inventory = at.session_state['inventory']
+    for item in build_inventory(inventory_size):
+        inventory.add(item)
+    at.session_state['meal_history'] = build_history(history_size)
+    return at
+
+
+def app_action(at, action: Callable[[], None]):
+    # (소요 시간 ms, 실행된 스크립트 횟수)
+    runs_before = at.session_state['_bench_runs']
+    started = time.perf_counter()
+    action()
+    at.run()
+    elapsed = (time.perf_counter() - started) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return elapsed, at.session_state['_bench_runs'] - runs_before
+
+
+def click(at, label: str):
+    return lambda: next(button for button in at.button if button.label == label).click()
+
+
+def bench_app(inventory_size: int, history_size: int, repeat: int) -> List[Dict]:
+    import streamlit as st
+    rows = []
+
+    def scenario(name: str, page: str, prepare: Callable, action: Callable):
+        timings, reruns = [], []
+        for _ in range(repeat):
+            # 응답 캐시를 비워 매 회 같은 조건으로 측정
+            st.cache_resource.clear()
+            at = new_app_test(inventory_size, history_size)
+            at.sidebar.radio[0].set_value(page)
+            at.run()
+            prepare(at)
+            elapsed, runs = app_action(at, action(at))
+            timings.append(elapsed)
+            reruns.append(runs)
+        rows.append(summarize(name, "apptest", inventory_size, history_size, timings, reruns=max(reruns)))
+
+    def fill_text(at):
+        at.text_area[0].input("우유 1L, 두부 한 모")
+
+    def recommend_first(at):
+        click(at, "레시피 추천받기")()
+        at.run()
+
+    def noop(at):
+        pass
+
+    scenario("text_add", "재고 관리", fill_text, lambda at: click(at, "텍스트로 재고 추가"))
+    scenario("recommend", "메뉴 추천", noop, lambda at: click(at, "레시피 추천받기"))
+    scenario("cook", "메뉴 추천", recommend_first, lambda at: click(at, "이 레시피 사용"))
+    scenario("profile_save", "영양 분석", noop, lambda at: click(at, "프로필 저장 및 영양 목표 계산"))
+    scenario("page_render", "영양 분석", noop, lambda at: lambda: None)
+    return rows
+
+
+def print_table(rows: List[Dict]):
+    header = f"{'scenario':<14}{'mode':<18}{'inventory':>10}{'history':>9}{'p50 ms':>11}{'max ms':>11}{'reruns':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        reruns = row.get("reruns")
+        print(
+            f"{row['scenario']:<14}{row['mode']:<18}{row['inventory']:>10}{row['history']:>9}"
+            f"{row['p50_ms']:>11.1f}{row['max_ms']:>11.1f}{'' if reruns is None else reruns:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="모의 OpenAI 서버 기반 tAIste 지연 시간 벤치마크")
+    parser.add_argument("--sizes", default="10,100,500", help="재고 품목 수 목록 (쉼표 구분)")
+    parser.add_argument("--history", default="10,200", help="식사 기록 수 목록 (쉼표 구분)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="모의 서버 응답 지연(초)")
+    parser.add_argument("--ttft", type=float, default=0.0, help="모의 서버 스트리밍 첫 토큰 지연(초)")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="모의 서버 스트리밍 청크 지연(초)")
+    parser.add_argument("--skip-app", action="store_true", help="AppTest 시나리오 생략 (GPTClient 직접 호출만)")
+    parser.add_argument("--json", dest="json_path", default="", help="결과를 JSON lines로 저장할 경로")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import mock_openai_server
+    server, base_url = mock_openai_server.start_server(
+        mock_openai_server.MockConfig(latency=args.latency, ttft=args.ttft, chunk_delay=args.chunk_delay)
+    )
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["TAISTE_DB"] = ""
+    os.environ["TAISTE_CACHE_DB"] = ""
+    import streamlit_app as app
+
+    sizes = [int(v) for v in args.sizes.split(",") if v.strip()]
+    histories = [int(v) for v in args.history.split(",") if v.strip()]
+    rows = []
+    for inventory_size in sizes:
+        for history_size in histories:
+            rows += bench_client(app, base_url, inventory_size, history_size, args.repeat)
+            if not args.skip_app:
+                rows += bench_app(inventory_size, history_size, args.repeat)
+
+    print_table(rows)
+    print(f"\n모의 서버 요청: {server.config.requests}건 {server.config.by_kind}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
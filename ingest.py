@@ -0,0 +1,320 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+# 영수증 사진 폴더나 구매 목록 텍스트 파일을 UI 없이 재고로 일괄 입력하는 스크립트.
+# 실행: python ingest.py receipts/ purchases.txt --user alice --store
+#       python ingest.py receipts/ --user alice --output items.jsonl --concurrency 8
+# 사용자 ID는 앱 주소의 ?uid= 값이다. 앱은 브라우저마다 임의의 ID를 만들므로 반드시 지정해야 한다.
+# 처리를 마친 입력은 체크포인트 파일에 기록되므로, 중단된 뒤 같은 명령으로 다시 실행하면 이어서 처리한다.
+# --store 는 기존 재고를 다시 쓰지 않고 품목별로 추가하므로 앱을 쓰는 중에도 실행할 수 있다 (앱에는 다시 접속하면 보임).
+# 유통기한이 이미 지난 품목(지난 영수증 일괄 입력)은 재고에 넣지 않고 지출 내역에만 기록한다.
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+TEXT_EXTENSIONS = {".txt"}
+# 텍스트 한 줄 = 한 번의 구매. "2026-03-01 달걀 10개, 우유 1L" 처럼 앞에 날짜를 붙일 수 있음
+DATE_PREFIX = re.compile(r"^(?P<date>\d{4}-\d{2}-\d{2})[\t ]+(?P<text>.+)$")
+DEFAULT_CHECKPOINT = "ingest_checkpoint.txt"
+# 이 개수만큼 처리할 때마다 결과를 기록하고 체크포인트를 갱신
+DEFAULT_FLUSH_EVERY = 20
+
+
+def image_unit(path: str, use_mtime: bool) -> Dict:
+    # 영수증 날짜는 파일 수정 시각으로 추정 (스캔/촬영 직후 옮겨 둔 경우)
+    date = datetime.fromtimestamp(os.path.getmtime(path)) if use_mtime else None
+    return {"key": f"image:{os.path.abspath(path)}", "kind": "image", "path": path, "line": None, "date": date}
+
+
+def text_units(path: str) -> Iterator[Dict]:
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            date = None
+            match = DATE_PREFIX.match(line)
+            if match:
+                date, line = datetime.fromisoformat(match.group("date")), match.group("text")
+            # 줄 내용이 바뀌면 다시 처리하도록 키에 내용 해시를 포함
+            digest = hashlib.md5(line.encode("utf-8")).hexdigest()[:8]
+            yield {
+                "key": f"text:{os.path.abspath(path)}:{lineno}:{digest}",
+                "kind": "text", "path": path, "line": lineno, "text": line, "date": date,
+            }
+
+
+def discover(sources: List[str], use_mtime: bool) -> Iterator[Dict]:
+    # 폴더는 하위까지 이름순으로 훑고, 파일은 확장자로 영수증 이미지/텍스트 목록을 구분
+    for source in sources:
+        if os.path.isdir(source):
+            for dirpath, dirnames, filenames in os.walk(source):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    extension = os.path.splitext(filename)[1].lower()
+                    if extension in IMAGE_EXTENSIONS:
+                        yield image_unit(path, use_mtime)
+                    elif extension in TEXT_EXTENSIONS:
+                        yield from text_units(path)
+        elif os.path.splitext(source)[1].lower() in IMAGE_EXTENSIONS:
+            yield image_unit(source, use_mtime)
+        else:
+            yield from text_units(source)
+
+
+def describe(unit: Dict) -> str:
+    return f"{unit['path']}:{unit['line']}" if unit['line'] else unit['path']
+
+
+class Checkpoint:
+    # 처리를 마친 입력 키를 한 줄씩 추가 기록하는 파일
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path) and not restart:
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "w" if restart else "a", encoding="utf-8") if path else None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def mark(self, keys: List[str]):
+        self.done.update(keys)
+        if self._file is not None and keys:
+            self._file.write("".join(f"{key}\n" for key in keys))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class JsonlSink:
+    def __init__(self, path: str, user_id: str):
+        self.user_id = user_id
+        self._file = sys.stdout if path == "-" else open(path, "a", encoding="utf-8")
+
+    def write(self, unit: Dict, items: List[Dict], expenses: List[Dict]):
+        self._file.write(json.dumps({
+            "user_id": self.user_id,
+            "source": unit['path'],
+            "line": unit['line'],
+            "kind": unit['kind'],
+            "date": unit['date'].isoformat() if unit['date'] else None,
+            "items": items,
+            "expenses": expenses,
+        }, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class StoreSink:
+    # 저장소의 재고에 품목별로 추가하고 지출 내역을 기록 (묶음마다 하나의 트랜잭션).
+    # 재고 전체를 읽어 다시 쓰지 않으므로 앱 세션이 그사이 저장한 변경을 덮어쓰지 않음
+    def __init__(self, storage, user_id: str):
+        self.storage = storage
+        self.user_id = user_id
+        self.pending_items = []
+        self.pending_expenses = []
+
+    def write(self, unit: Dict, items: List[Dict], expenses: List[Dict]):
+        self.pending_items.extend(items)
+        self.pending_expenses.extend(expenses)
+
+    def flush(self):
+        if not self.pending_items and not self.pending_expenses:
+            return
+        self.storage.write_batch(self.user_id, new_inventory=self.pending_items, new_expenses=self.pending_expenses)
+        self.pending_items = []
+        self.pending_expenses = []
+
+    def close(self):
+        pass
+
+
+def process(app, gpt_client, unit: Dict, options: Dict) -> List[Dict]:
+    if unit['kind'] == "image":
+        with open(unit['path'], "rb") as f:
+            processed = app.preprocess_receipt_image(f.read(), **options['preprocess'])
+        return gpt_client.parse_inventory_from_image(processed['data'], mime=processed['mime'], detail=options['detail'])
+    return gpt_client.parse_inventory_from_text(unit['text'])
+
+
+def ingest(app, gpt_client, units: Iterator[Dict], sinks: List, checkpoint: Checkpoint, concurrency: int,
+           options: Dict, flush_every: int = DEFAULT_FLUSH_EVERY) -> Dict:
+    stats = {"units": 0, "skipped": 0, "failed": 0, "items": 0, "expired": 0, "expense": 0.0}
+    today, _ = app.InventoryEngine.expiry_window(0)
+    done_keys = []
+
+    def flush():
+        # 결과를 먼저 기록한 뒤 체크포인트를 갱신 (중간에 멈추면 마지막 묶음만 다시 처리)
+        for sink in sinks:
+            sink.flush()
+        checkpoint.mark(done_keys)
+        done_keys.clear()
+
+    in_flight = {}
+    exhausted = False
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest")
+    try:
+        while True:
+            # 진행 중인 작업을 concurrency의 두 배까지만 유지해 큰 폴더도 메모리를 일정하게 사용
+            while not exhausted and len(in_flight) < concurrency * 2:
+                unit = next(units, None)
+                if unit is None:
+                    exhausted = True
+                elif unit['key'] in checkpoint:
+                    stats['skipped'] += 1
+                else:
+                    in_flight[pool.submit(process, app, gpt_client, unit, options)] = unit
+            if not in_flight:
+                break
+
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                unit = in_flight.pop(future)
+                try:
+                    items = future.result()
+                except Exception as e:
+                    # 실패한 입력은 체크포인트에 남기지 않아 다음 실행에서 다시 시도
+                    stats['failed'] += 1
+                    print(f"실패 {describe(unit)}: {e}", file=sys.stderr)
+                    continue
+                new_items, new_expenses, _ = app.ReceiptPipeline.merge_results([items], now=unit['date'])
+                # 지난 영수증에서 유통기한이 이미 지난 품목은 재고에서 빼고 지출 내역에만 남김
+                fresh = [item for item in new_items if (app.InventoryEngine.expiry_timestamp(item) or today) >= today]
+                stats['expired'] += len(new_items) - len(fresh)
+                new_items = fresh
+                for sink in sinks:
+                    sink.write(unit, new_items, new_expenses)
+                done_keys.append(unit['key'])
+                stats['units'] += 1
+                stats['items'] += len(new_items)
+                stats['expense'] += sum(expense['amount'] for expense in new_expenses)
+
+            if len(done_keys) >= flush_every:
+                flush()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        flush()
+    return stats
+
+
+def print_summary(stats: Dict, metrics, elapsed: float):
+    rows = metrics.summary()
+    calls = sum(row['calls'] - row['cache_hits'] for row in rows)
+    cache_hits = sum(row['cache_hits'] for row in rows)
+    tokens = sum(row['prompt_tokens'] + row['completion_tokens'] for row in rows)
+    cost = sum(row['cost_usd'] for row in rows)
+    elapsed = max(elapsed, 1e-9)
+    print(
+        f"처리 {stats['units']}건 (건너뜀 {stats['skipped']}, 실패 {stats['failed']}), "
+        f"품목 {stats['items']}개 (유통기한 지나 제외 {stats['expired']}개), 지출 {stats['expense']:,.0f}원",
+        file=sys.stderr
+    )
+    print(
+        f"소요 {elapsed:.1f}s, {stats['units'] / elapsed:.2f}건/s, {stats['items'] / elapsed:.2f} items/s",
+        file=sys.stderr
+    )
+    print(
+        f"API 호출 {calls}회 (캐시 {cache_hits}회), 토큰 {tokens:,} ({tokens / elapsed:,.1f} tokens/s), 예상 비용 ${cost:.4f}",
+        file=sys.stderr
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="영수증 사진 폴더/구매 목록 텍스트를 재고로 일괄 입력")
+    parser.add_argument("sources", nargs="+", help="영수증 이미지 폴더, 이미지 파일 또는 텍스트 목록 파일")
+    parser.add_argument("--user", required=True, help="재고를 추가할 사용자 ID (앱 주소의 ?uid= 값)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", ""), help="기본: OPENAI_API_KEY")
+    parser.add_argument("--output", default="", help="결과를 JSON lines로 추가 기록할 경로 ('-'는 표준 출력)")
+    parser.add_argument("--store", action="store_true", help="영구 저장소(TAISTE_DB)의 재고/지출 내역에 반영")
+    parser.add_argument("--db", default=None, help="저장소 경로 (기본: TAISTE_DB 또는 taiste.db)")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 처리할 입력 수")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="처리 완료 기록 파일 (빈 값이면 사용 안 함)")
+    parser.add_argument("--restart", action="store_true", help="체크포인트를 비우고 처음부터 처리")
+    parser.add_argument("--flush-every", type=int, default=DEFAULT_FLUSH_EVERY, help="결과 기록/체크포인트 갱신 간격 (건)")
+    parser.add_argument("--purchase-date", choices=["mtime", "now"], default="mtime",
+                        help="날짜가 없는 영수증의 구매일: 파일 수정 시각 또는 현재 시각")
+    parser.add_argument("--max-edge", type=int, default=None, help="영수증 이미지 최대 해상도 (긴 변, px)")
+    parser.add_argument("--image-format", choices=["JPEG", "WEBP", "PNG"], default=None)
+    parser.add_argument("--quality", type=int, default=None)
+    parser.add_argument("--no-crop", action="store_true", help="영수증 영역 자동 자르기 끄기")
+    parser.add_argument("--detail", choices=["auto", "low", "high"], default=None, help="이미지 분석 정밀도")
+    args = parser.parse_args()
+
+    if not args.output and not args.store:
+        parser.error("--output 또는 --store 중 하나 이상을 지정하세요.")
+    if args.db is not None:
+        # 앱 모듈이 import 시점에 환경 변수를 읽으므로 먼저 설정
+        os.environ["TAISTE_DB"] = args.db
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import streamlit_app as app
+
+    if not args.api_key:
+        parser.error("--api-key 또는 OPENAI_API_KEY가 필요합니다.")
+    storage = None
+    if args.store:
+        if not app.STORAGE_DB_PATH:
+            parser.error("--store 를 쓰려면 --db 또는 TAISTE_DB로 저장소 경로를 지정하세요.")
+        storage = app.Storage(app.STORAGE_DB_PATH)
+
+    user_id = args.user
+    preprocess = {"crop": not args.no_crop}
+    for option, value in (("max_edge", args.max_edge), ("image_format", args.image_format), ("quality", args.quality)):
+        if value is not None:
+            preprocess[option] = value
+    options = {"preprocess": preprocess, "detail": args.detail or app.RECEIPT_IMAGE_DETAIL}
+
+    metrics = app.CallMetrics(maxlen=None)
+    gpt_client = app.GPTClient(
+        args.api_key,
+        cache=app.ResponseCache(db_path=app.CACHE_DB_PATH),
+        client=app.ClientRegistry().get(args.api_key),
+        metrics=metrics
+    )
+
+    sinks = []
+    if args.output:
+        sinks.append(JsonlSink(args.output, user_id))
+    if storage is not None:
+        sinks.append(StoreSink(storage, user_id))
+    checkpoint = Checkpoint(args.checkpoint, restart=args.restart)
+
+    started = time.perf_counter()
+    try:
+        stats = ingest(
+            app, gpt_client, discover(args.sources, args.purchase_date == "mtime"), sinks, checkpoint,
+            max(1, args.concurrency), options, max(1, args.flush_every)
+        )
+    except KeyboardInterrupt:
+        print("중단됨. 같은 명령으로 다시 실행하면 이어서 처리합니다.", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        checkpoint.close()
+        for sink in sinks:
+            sink.close()
+    print_summary(stats, metrics, time.perf_counter() - started)
+    if storage is not None:
+        print(f"앱에서 확인: 앱 주소 뒤에 ?uid={user_id} 를 붙여 접속하세요.")
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# 로컬에서 Chat Completions API를 흉내 내는 테스트용 서버.
+# 앱/벤치마크를 OPENAI_BASE_URL=http://127.0.0.1:8765/v1 로 실행하면 네트워크 없이 동작한다.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MOCK_MODELS = ["gpt-4o", "gpt-4o-mini"]
+
+# Structured Outputs 사용 시 배열 응답을 감싸는 키 (streamlit_app.RESPONSE_SCHEMAS와 동일)
+RESPONSE_WRAPPERS = {
+    "parse_inventory_from_text": "items",
+    "parse_inventory_from_image": "items",
+    "update_inventory_after_cooking": "items",
+    "recommend_recipes": "recipes",
+    "recommend_nutrient_rich_recipes": "recipes",
+}
+# response_format이 없을 때 프롬프트 문구로 요청 종류를 구분
+PROMPT_MARKERS = [
+    ("JSON 스키마에 맞는 올바른 JSON으로 고쳐", "repair"),
+    ("텍스트에서 식재료 정보를 추출", "parse_inventory_from_text"),
+    ("영수증 이미지에서 식재료", "parse_inventory_from_image"),
+    ("어떻게 계산되었는지", "explain_nutrition_target"),
+    ("요리 레시피", "recommend_recipes"),
+    ("만들 수 있는지", "check_recipe_sufficiency"),
+    ("남은 재고를 계산", "update_inventory_after_cooking"),
+    ("부족한 영양소를 효과적으로 보충", "recommend_nutrient_rich_recipes"),
+]
+RECEIPT_ITEMS = [
+    {"name": "달걀", "quantity": 10, "unit": "개", "price": 4500},
+    {"name": "우유", "quantity": 1, "unit": "L", "price": 2800},
+    {"name": "양파", "quantity": 3, "unit": "개", "price": 3000},
+    {"name": "두부", "quantity": 1, "unit": "개", "price": 1500},
+]
+INVENTORY_ITEM_PATTERN = re.compile(r"^(?P<name>.+?)\s+(?P<quantity>\d+(?:\.\d+)?)(?P<unit>g|kg|ml|L|개)")
+
+
+class MockConfig:
+    def __init__(self, latency: float = 0.0, ttft: float = 0.0, chunk_delay: float = 0.0, chunk_size: int = 16,
+                 error_rate: float = 0.0, error_status: int = 500, malformed_rate: float = 0.0, fenced: bool = False,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.chunk_size = max(1, chunk_size)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.fenced = fenced
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.by_kind: Dict[str, int] = {}
+
+    def count(self, kind: str):
+        with self.lock:
+            self.requests += 1
+            self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+
+class MockResponder:
+    @staticmethod
+    def prompt_text(messages: List[Dict]) -> str:
+        parts = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                parts.append(content)
+            elif isinstance(content, list):
+                parts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+        return "\n".join(parts)
+
+    @staticmethod
+    def request_kind(body: Dict, prompt: str) -> str:
+        for marker, kind in PROMPT_MARKERS:
+            if marker in prompt:
+                if kind == "repair":
+                    # 형식 수정 요청은 원래 메서드의 스키마 이름으로 응답 형태를 정함
+                    schema_name = ((body.get("response_format") or {}).get("json_schema") or {}).get("name")
+                    return f"repair:{schema_name}" if schema_name else kind
+                return kind
+        schema_name = ((body.get("response_format") or {}).get("json_schema") or {}).get("name")
+        return schema_name or "unknown"
+
+    @staticmethod
+    def field(prompt: str, label: str) -> str:
+        # "라벨: 값" 부터 빈 줄 전까지 (여러 줄 값 포함)
+        match = re.search(rf"^{re.escape(label)}:[ \t]*(.*?)(?:\n[ \t]*\n|\Z)", prompt, re.MULTILINE | re.DOTALL)
+        return match.group(1).strip() if match else ""
+
+    @staticmethod
+    def parse_inventory(text: str) -> List[Dict]:
+        items = []
+        for fragment in re.sub(r"\(외 \d+개 품목 생략\)", "", text).split(","):
+            match = INVENTORY_ITEM_PATTERN.match(fragment.strip())
+            if match:
+                items.append({"name": match.group("name"), "quantity": float(match.group("quantity")), "unit": match.group("unit")})
+        return items
+
+    @staticmethod
+    def recipe(index: int, ingredients: List[str], with_reason: bool = False) -> Dict:
+        recipe = {
+            "name": f"모의 레시피 {index + 1}",
+            "nutrition": {"calories": 450 + index * 50, "protein": 25, "carbs": 50, "fat": 15},
+            "ingredients": ingredients or ["달걀 100g", "양파 100g"],
+            "steps": ["재료를 손질한다.", "팬에 볶는다.", "그릇에 담는다."],
+            "youtube_query": f"모의 레시피 {index + 1}",
+        }
+        if with_reason:
+            recipe["reason"] = "부족한 영양소를 보충할 수 있는 메뉴입니다."
+            recipe["missing_ingredients"] = []
+        return recipe
+
+    @staticmethod
+    def repair(kind: str, prompt: str):
+        # 복구 요청에 담긴 깨진 응답의 닫히지 않은 괄호를 닫아 원래 내용을 그대로 돌려줌
+        method = kind.split(":", 1)[1]
+        text = prompt.split("텍스트:\n", 1)[-1].strip()
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+        closers, in_string, escaped = [], False, False
+        for char in text:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                closers.append("}" if char == "{" else "]")
+            elif char in "}]" and closers:
+                closers.pop()
+        try:
+            data = json.loads(text + "".join(reversed(closers)))
+        except json.JSONDecodeError:
+            return MockResponder.payload(method, "")
+        if isinstance(data, dict) and method in RESPONSE_WRAPPERS and RESPONSE_WRAPPERS[method] in data:
+            data = data[RESPONSE_WRAPPERS[method]]
+        return data
+
+    @staticmethod
+    def payload(kind: str, prompt: str):
+        if kind.startswith("repair:"):
+            return MockResponder.repair(kind, prompt)
+        if kind == "parse_inventory_from_text":
+            text = MockResponder.field(prompt, "텍스트")
+            names = [fragment.split()[0] for fragment in re.split(r"[,\n]", text) if fragment.strip()]
+            return [{"name": name, "quantity": 1, "unit": "개"} for name in names]
+        if kind == "parse_inventory_from_image":
+            return [dict(item) for item in RECEIPT_ITEMS]
+        if kind == "explain_nutrition_target":
+            return {"explanation": "기초대사량에 활동량 계수를 곱해 하루 에너지 필요량을 구했습니다."}
+        if kind == "check_recipe_sufficiency":
+            return {"sufficient": True, "missing_items": []}
+        if kind == "update_inventory_after_cooking":
+            return MockResponder.parse_inventory(MockResponder.field(prompt, "현재 재고"))
+        if kind in ("recommend_recipes", "recommend_nutrient_rich_recipes"):
+            match = re.search(r"(\d+)\s*(?:개를|가지를)", prompt)
+            count = int(match.group(1)) if match else 3
+            if kind == "recommend_recipes":
+                # 임박 재료(수량 포함) 다음 줄에 나머지 재고 이름만 옴
+                urgent = MockResponder.field(prompt, "유통기한 임박 재료(우선 사용)").split("\n", 1)[0]
+                names = [item['name'] for item in MockResponder.parse_inventory(urgent)]
+                others = re.sub(r"\(외 \d+개 품목 생략\)", "", MockResponder.field(prompt, "그 밖의 보유 식재료").split("\n", 1)[0])
+                names += [name.strip() for name in others.split(",") if name.strip() and name.strip() != "없음"]
+            else:
+                names = [item['name'] for item in MockResponder.parse_inventory(MockResponder.field(prompt, "현재 보유 재고"))]
+            ingredients = [f"{name} 100g" for name in names[:4]]
+            return [MockResponder.recipe(i, ingredients, kind == "recommend_nutrient_rich_recipes") for i in range(count)]
+        return []
+
+    @staticmethod
+    def content(kind: str, prompt: str, body: Dict, config: MockConfig) -> str:
+        data = MockResponder.payload(kind, prompt)
+        method = kind.split(":", 1)[1] if kind.startswith("repair:") else kind
+        if body.get("response_format") and method in RESPONSE_WRAPPERS:
+            data = {RESPONSE_WRAPPERS[method]: data}
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+        if config.fenced and not body.get("response_format"):
+            text = f"```json\n{text}\n```"
+        if not kind.startswith("repair") and config.roll(config.malformed_rate):
+            # 닫는 괄호를 잘라 앱의 복구 경로를 태움 (복구 요청 자체는 정상 응답)
+            text = text.rstrip("`\n]}")
+        return text
+
+    @staticmethod
+    def usage(prompt: str, content: str) -> Dict:
+        prompt_tokens = max(1, len(prompt) // 2)
+        completion_tokens = max(1, len(content) // 2)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data: Dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": model, "object": "model", "created": 0, "owned_by": "mock"} for model in MOCK_MODELS]
+            })
+            return
+        self._send_json(404, {"error": {"message": f"not found: {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"not found: {self.path}", "type": "invalid_request_error"}})
+            return
+
+        config = self.config
+        prompt = MockResponder.prompt_text(body.get("messages", []))
+        kind = MockResponder.request_kind(body, prompt)
+        config.count(kind)
+
+        if config.roll(config.error_rate):
+            time.sleep(config.ttft)
+            self._send_json(config.error_status, {
+                "error": {"message": "injected error", "type": "server_error" if config.error_status >= 500 else "rate_limit_error"}
+            })
+            return
+
+        content = MockResponder.content(kind, prompt, body, config)
+        usage = MockResponder.usage(prompt, content)
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", MOCK_MODELS[0])
+        created = int(time.time())
+
+        if not body.get("stream"):
+            time.sleep(config.latency)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(config.ttft)
+
+        def event(choices: List[Dict], extra: Optional[Dict] = None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": choices}
+            chunk.update(extra or {})
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+
+        event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        for start in range(0, len(content), config.chunk_size):
+            event([{"index": 0, "delta": {"content": content[start:start + config.chunk_size]}, "finish_reason": None}])
+            if config.chunk_delay:
+                time.sleep(config.chunk_delay)
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            event([], {"usage": usage})
+        self._write_chunk("data: [DONE]\n\n")
+        self._write_chunk("")
+
+
+def start_server(config: Optional[MockConfig] = None, host: str = DEFAULT_HOST, port: int = 0):
+    # 백그라운드 스레드에서 서버를 띄우고 (서버, base_url)을 반환. port=0이면 빈 포트를 사용
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.config = handler.config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tAIste용 OpenAI Chat Completions 모의 서버")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="일반 응답 지연(초)")
+    parser.add_argument("--ttft", type=float, default=0.0, help="스트리밍 첫 토큰까지 지연(초)")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="스트리밍 청크 사이 지연(초)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="스트리밍 청크당 글자 수")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="오류 응답 비율 (0~1)")
+    parser.add_argument("--error-status", type=int, default=500, help="주입할 HTTP 상태 코드 (예: 429, 500)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="깨진 JSON 응답 비율 (0~1)")
+    parser.add_argument("--fenced", action="store_true", help="response_format이 없을 때 ```json 코드 블록으로 감싸기")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency, ttft=args.ttft, chunk_delay=args.chunk_delay, chunk_size=args.chunk_size,
+        error_rate=args.error_rate, error_status=args.error_status, malformed_rate=args.malformed_rate,
+        fenced=args.fenced, seed=args.seed
+    )
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"모의 OpenAI 서버: http://{args.host}:{args.port}/v1")
+    print(f"앱 실행 예: OPENAI_BASE_URL=http://{args.host}:{args.port}/v1 streamlit run streamlit_app.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"처리한 요청: {config.requests}건 {config.by_kind}")
+
+
+if __name__ == "__main__":
+    main()
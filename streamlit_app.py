@@ -1,18 +1,62 @@
 import streamlit as st
-from openai import OpenAI
+from openai import NOT_GIVEN, AsyncOpenAI, AuthenticationError, OpenAI, PermissionDeniedError, Timeout
 from datetime import datetime, timedelta
 import json
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
+import asyncio
 import base64
+import bisect
+import functools
+import hashlib
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from PIL import Image
+import numpy as np
+from PIL import Image, ImageFilter, ImageOps, ImageStat
+from streamlit import runtime
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+DEFAULT_USER_ID = "user_001"
+# 사용자가 바뀌면 비우고 저장소에서 다시 읽어오는 세션 키
+USER_STATE_KEYS = (
+    'user_profile', 'inventory', 'nutrition_status', 'expenses', 'meal_history', 'daily_intake', 'expense_summary',
+    'recommended_recipes', 'nutrient_recipes', 'selected_recipe_index', '_persisted', '_inventory_rows', '_state_bytes'
+)
 
 class StateManager:
     @staticmethod
-    def initialize():
+    def resolve_user_id() -> str:
+        # URL의 uid 쿼리 파라미터를 사용자 키로 사용 (새로고침해도 유지됨)
+        user_id = st.query_params.get("uid")
+        if not user_id:
+            user_id = st.session_state.get('user_id') or uuid.uuid4().hex[:12]
+            st.query_params["uid"] = user_id
+        return user_id
+
+    @staticmethod
+    def initialize(storage: Optional["Storage"] = None, user_id: str = DEFAULT_USER_ID):
+        if st.session_state.get('user_id') != user_id:
+            for key in USER_STATE_KEYS:
+                if key in st.session_state:
+                    del st.session_state[key]
+            st.session_state.user_id = user_id
+        
+        stored_profile = None
+        if 'user_profile' not in st.session_state or 'nutrition_status' not in st.session_state:
+            stored_profile = storage.load_profile(user_id) if storage else None
+        
         if 'user_profile' not in st.session_state:
             st.session_state.user_profile = {
-                "user_id": "user_001",
+                "user_id": user_id,
                 "name": "",
                 "age": 25,
                 "gender": "male",
@@ -21,9 +65,14 @@ class StateManager:
                 "activity_level": "moderate",
                 "daily_calories": 2000
             }
+            if stored_profile:
+                st.session_state.user_profile.update(stored_profile[0])
         
         if 'inventory' not in st.session_state:
-            st.session_state.inventory = []
+            items, rows = storage.load_inventory_rows(user_id) if storage else ([], [])
+            st.session_state.inventory = InventoryStore(items)
+            # 이 세션이 읽어 온 저장소 행. 저장할 때 이 행만 바꾸므로 그사이 ingest.py가 추가한 재고는 남음
+            st.session_state._inventory_rows = rows
         
         if 'nutrition_status' not in st.session_state:
             st.session_state.nutrition_status = {
@@ -33,21 +82,2248 @@ class StateManager:
                 "deficiency": {"calories": 0, "protein": 0, "carbs": 0, "fat": 0},
                 "last_updated": datetime.now().isoformat()
             }
+            if stored_profile and stored_profile[1]:
+                st.session_state.nutrition_status['daily_target'] = stored_profile[1]
         
         if 'expenses' not in st.session_state:
-            st.session_state.expenses = []
+            st.session_state.expenses = storage.load_recent_expenses(user_id, HOT_EXPENSE_LIMIT) if storage else []
         
         if 'meal_history' not in st.session_state:
-            st.session_state.meal_history = []
+            st.session_state.meal_history = storage.load_recent_meals(user_id, HOT_MEAL_LIMIT) if storage else []
+        
+        if 'daily_intake' not in st.session_state:
+            st.session_state.daily_intake = NutritionTracker.build_daily_intake(
+                st.session_state.meal_history,
+                st.session_state.nutrition_status['period_days']
+            )
+            NutritionTracker.refresh(st.session_state.daily_intake, st.session_state.nutrition_status)
+        
+        if 'expense_summary' not in st.session_state:
+            # 저장소가 있으면 전체 기간 집계를, 없으면 세션의 지출 내역으로 집계를 만든 뒤 이후로는 증분 갱신
+            summary = storage.load_expense_summary(user_id) if storage else ExpenseLedger.build(st.session_state.expenses)
+            for meal in st.session_state.meal_history:
+                ExpenseLedger.add_meal(summary, meal)
+            st.session_state.expense_summary = summary
             
         if 'selected_recipe_index' not in st.session_state:
             st.session_state.selected_recipe_index = None
+        
+        if 'sufficiency_tolerance' not in st.session_state:
+            st.session_state.sufficiency_tolerance = SUFFICIENCY_TOLERANCE
+        
+        if '_persisted' not in st.session_state:
+            # 저장소에 반영된 상태. 변경된 부분만 실행 끝에 한 번에 기록
+            st.session_state._persisted = StateManager._snapshot()
+
+    @staticmethod
+    def _fingerprint(value) -> str:
+        return hashlib.md5(json.dumps(value, ensure_ascii=False, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def _snapshot(state=None) -> Dict:
+        state = st.session_state if state is None else state
+        return {
+            "profile": StateManager._fingerprint([
+                state['user_profile'], state['nutrition_status']['daily_target']
+            ]),
+            "inventory": StateManager._fingerprint(state['inventory'].to_list(include_id=True)),
+            "meal_count": len(state['meal_history']),
+            "expense_count": len(state['expenses']),
+        }
+
+    @staticmethod
+    def persist(storage: Optional["Storage"], state=None):
+        # state를 넘기면 현재 세션이 아닌 다른 세션의 상태를 기록 (유휴 세션 정리용)
+        state = st.session_state if state is None else state
+        if storage is None or '_persisted' not in state:
+            return
+        
+        previous = state['_persisted']
+        current = StateManager._snapshot(state)
+        if current == previous:
+            return
+        
+        rows = storage.write_batch(
+            state['user_id'],
+            profile=state['user_profile'] if current['profile'] != previous['profile'] else None,
+            daily_target=state['nutrition_status']['daily_target'] if current['profile'] != previous['profile'] else None,
+            inventory=state['inventory'].to_list(include_id=True) if current['inventory'] != previous['inventory'] else None,
+            inventory_rows=state['_inventory_rows'] if '_inventory_rows' in state else None,
+            new_meals=state['meal_history'][previous['meal_count']:],
+            new_expenses=state['expenses'][previous['expense_count']:]
+        )
+        if rows is not None:
+            state['_inventory_rows'] = rows
+        state['_persisted'] = current
+
+# -------------------------------------------------------------------------
+# 영구 저장소 (SQLite)
+# -------------------------------------------------------------------------
+STORAGE_DB_PATH = os.environ.get("TAISTE_DB", "taiste.db")
+# 세션에 올려두는 최근 기록 개수 (나머지는 저장소에만 보관)
+HOT_MEAL_LIMIT = 200
+HOT_EXPENSE_LIMIT = 200
+INVENTORY_COLUMNS = ("name", "quantity", "unit", "added_date", "expiry_date")
+# 기록 테이블 -> 저장된 개수를 나타내는 _persisted 항목 (테이블 이름은 세션 키와 같음)
+HISTORY_TABLES = {"meal_history": "meal_count", "expenses": "expense_count"}
+
+class Storage:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    profile TEXT NOT NULL,
+                    daily_target TEXT,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS inventory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    quantity REAL NOT NULL,
+                    unit TEXT NOT NULL,
+                    added_date TEXT,
+                    expiry_date TEXT,
+                    extra TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_inventory_user_name ON inventory(user_id, name);
+                CREATE INDEX IF NOT EXISTS idx_inventory_user_expiry ON inventory(user_id, expiry_date);
+                CREATE TABLE IF NOT EXISTS expenses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    items TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses(user_id, date);
+                CREATE TABLE IF NOT EXISTS expense_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    expense_id INTEGER NOT NULL,
+                    user_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    quantity REAL,
+                    unit TEXT,
+                    price REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_expense_items_expense ON expense_items(expense_id);
+                CREATE TABLE IF NOT EXISTS expense_totals (
+                    user_id TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    PRIMARY KEY (user_id, period, bucket)
+                );
+                CREATE TABLE IF NOT EXISTS ingredient_prices (
+                    user_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    unit TEXT NOT NULL,
+                    display_name TEXT NOT NULL,
+                    last_price REAL NOT NULL,
+                    last_date TEXT NOT NULL,
+                    min_price REAL NOT NULL,
+                    total_price REAL NOT NULL,
+                    total_quantity REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, name, unit)
+                );
+                CREATE TABLE IF NOT EXISTS meal_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    recipe_name TEXT NOT NULL,
+                    nutrition TEXT NOT NULL,
+                    extra TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_meal_history_user_date ON meal_history(user_id, date);
+            """)
+            self._backfill_expense_totals(conn)
+
+    def _backfill_expense_totals(self, conn):
+        # 집계 테이블이 생기기 전에 쌓인 지출 내역을 한 번만 집계
+        if conn.execute("SELECT 1 FROM expense_totals LIMIT 1").fetchone():
+            return
+        rows = conn.execute("SELECT user_id, date, amount FROM expenses ORDER BY id").fetchall()
+        by_user = {}
+        for user_id, date, amount in rows:
+            by_user.setdefault(user_id, []).append({'date': date, 'amount': amount})
+        for user_id, expenses in by_user.items():
+            self._apply_expense_delta(conn, user_id, ExpenseLedger.build(expenses))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load_profile(self, user_id: str):
+        # (프로필, 일일 목표) 또는 None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT profile, daily_target FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0]), json.loads(row[1]) if row[1] else None
+
+    def load_inventory(self, user_id: str) -> List[Dict]:
+        return self.load_inventory_rows(user_id)[0]
+
+    def load_inventory_rows(self, user_id: str):
+        # (재고 항목, 저장소 행 ID 목록)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, name, quantity, unit, added_date, expiry_date, extra FROM inventory WHERE user_id = ? ORDER BY id",
+                (user_id,)
+            ).fetchall()
+        items = []
+        for row in rows:
+            item = dict(zip(INVENTORY_COLUMNS, row[1:6]))
+            if row[6]:
+                item.update(json.loads(row[6]))
+            items.append(item)
+        return items, [row[0] for row in rows]
+
+    @staticmethod
+    def _insert_inventory(conn, user_id: str, items: List[Dict]) -> List[int]:
+        # 항목마다 한 행씩 추가하고 새 행 ID를 반환
+        return [
+            conn.execute(
+                "INSERT INTO inventory (user_id, name, quantity, unit, added_date, expiry_date, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, item['name'], float(item['quantity']), item['unit'], item.get('added_date'), item.get('expiry_date'),
+                 json.dumps({k: v for k, v in item.items() if k not in INVENTORY_COLUMNS}, ensure_ascii=False))
+            ).lastrowid
+            for item in items
+        ]
+
+    def load_recent_meals(self, user_id: str, limit: int) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date, recipe_name, nutrition, extra FROM meal_history WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [self._meal(row) for row in reversed(rows)]
+
+    def load_recent_expenses(self, user_id: str, limit: int) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                # 지난 영수증을 나중에 일괄 입력해도 목록이 날짜순이 되도록 날짜 기준으로 정렬
+                "SELECT id, date, amount, items FROM expenses WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+            return self._expenses(conn, reversed(rows))
+
+    @staticmethod
+    def _meal(row) -> Dict:
+        date, recipe_name, nutrition, extra = row
+        meal = {'date': date, 'recipe_name': recipe_name, 'nutrition': json.loads(nutrition)}
+        if extra:
+            meal.update(json.loads(extra))
+        return meal
+
+    @staticmethod
+    def _expenses(conn, rows) -> List[Dict]:
+        rows = list(rows)
+        line_items = {}
+        if rows:
+            item_rows = conn.execute(
+                "SELECT expense_id, name, quantity, unit, price FROM expense_items "
+                f"WHERE expense_id IN ({', '.join('?' * len(rows))}) ORDER BY id",
+                [row[0] for row in rows]
+            ).fetchall()
+            for expense_id, name, quantity, unit, price in item_rows:
+                line_items.setdefault(expense_id, []).append({'name': name, 'quantity': quantity, 'unit': unit, 'price': price})
+        return [
+            {'date': date, 'amount': amount, 'items': items, 'line_items': line_items.get(expense_id, [])}
+            for expense_id, date, amount, items in rows
+        ]
+
+    # 기록 목록 화면에서 메모리의 최근 기록을 넘어서는 페이지를 읽을 때 사용 (start, end는 YYYY-MM-DD, 양 끝 포함)
+    @staticmethod
+    def _date_range(start: str, end: str):
+        return start, (datetime.fromisoformat(end) + timedelta(days=1)).date().isoformat()
+
+    def first_history_date(self, table: str, user_id: str) -> Optional[str]:
+        if table not in HISTORY_TABLES:
+            raise ValueError(table)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT MIN(date) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def count_history(self, table: str, user_id: str, start: str, end: str) -> int:
+        if table not in HISTORY_TABLES:
+            raise ValueError(table)
+        with self._connect() as conn:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE user_id = ? AND date >= ? AND date < ?",
+                (user_id, *self._date_range(start, end))
+            ).fetchone()[0]
+
+    def load_meal_page(self, user_id: str, start: str, end: str, offset: int, limit: int) -> List[Dict]:
+        # 기간 내 식사 기록을 최신순으로 offset부터 limit개
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date, recipe_name, nutrition, extra FROM meal_history WHERE user_id = ? AND date >= ? AND date < ? "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                (user_id, *self._date_range(start, end), limit, offset)
+            ).fetchall()
+        return [self._meal(row) for row in rows]
+
+    def load_expense_page(self, user_id: str, start: str, end: str, offset: int, limit: int) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, date, amount, items FROM expenses WHERE user_id = ? AND date >= ? AND date < ? "
+                "ORDER BY date DESC, id DESC LIMIT ? OFFSET ?",
+                (user_id, *self._date_range(start, end), limit, offset)
+            ).fetchall()
+            return self._expenses(conn, rows)
+
+    def load_expense_summary(self, user_id: str) -> Dict:
+        # 전체 지출 내역을 훑지 않고 집계 테이블만 읽음
+        summary = ExpenseLedger.empty()
+        with self._connect() as conn:
+            for period, bucket, amount in conn.execute(
+                "SELECT period, bucket, amount FROM expense_totals WHERE user_id = ?", (user_id,)
+            ):
+                if period == "total":
+                    summary['total'] = amount
+                else:
+                    summary[period][bucket] = amount
+            for row in conn.execute(
+                "SELECT name, unit, display_name, last_price, last_date, min_price, total_price, total_quantity, count "
+                "FROM ingredient_prices WHERE user_id = ?", (user_id,)
+            ):
+                summary['prices'].setdefault(row[0], {})[row[1]] = dict(zip(PRICE_ENTRY_FIELDS, row[2:]))
+        return summary
+
+    def _apply_expense_delta(self, conn, user_id: str, delta: Dict):
+        # 새 지출분의 집계를 기존 집계에 더함 (최근가는 구매일이 더 늦을 때만 교체)
+        totals = [("total", "all", delta['total'])]
+        for period in EXPENSE_PERIODS:
+            totals += [(period, bucket, amount) for bucket, amount in delta[period].items()]
+        conn.executemany(
+            "INSERT INTO expense_totals (user_id, period, bucket, amount) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id, period, bucket) DO UPDATE SET amount = amount + excluded.amount",
+            [(user_id, period, bucket, amount) for period, bucket, amount in totals]
+        )
+        conn.executemany(
+            "INSERT INTO ingredient_prices (user_id, name, unit, display_name, last_price, last_date, min_price, "
+            "total_price, total_quantity, count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id, name, unit) DO UPDATE SET "
+            "display_name = CASE WHEN excluded.last_date >= last_date THEN excluded.display_name ELSE display_name END, "
+            "last_price = CASE WHEN excluded.last_date >= last_date THEN excluded.last_price ELSE last_price END, "
+            "last_date = MAX(last_date, excluded.last_date), min_price = MIN(min_price, excluded.min_price), "
+            "total_price = total_price + excluded.total_price, total_quantity = total_quantity + excluded.total_quantity, "
+            "count = count + excluded.count",
+            [
+                (user_id, name, unit, *(entry[field] for field in PRICE_ENTRY_FIELDS))
+                for name, units in delta['prices'].items() for unit, entry in units.items()
+            ]
+        )
+
+    def write_batch(self, user_id: str, profile: Optional[Dict] = None, daily_target: Optional[Dict] = None,
+                    inventory: Optional[List[Dict]] = None, inventory_rows: Optional[List[int]] = None,
+                    new_inventory: List[Dict] = (), new_meals: List[Dict] = (), new_expenses: List[Dict] = ()) -> Optional[List[int]]:
+        # 한 번의 실행에서 바뀐 내용을 하나의 트랜잭션으로 기록.
+        # inventory: 세션의 재고 목록으로 inventory_rows(세션이 읽어 온 행)를 바꾸고 새 행 ID를 반환. 행 목록이 없으면 전체를 바꿈
+        # new_inventory: 기존 행은 그대로 두고 항목별로 추가 (같은 재료는 다음에 읽을 때 InventoryStore가 합침)
+        now = datetime.now().isoformat()
+        row_ids = None
+        with self._connect() as conn:
+            if profile is not None:
+                conn.execute(
+                    "INSERT INTO users (user_id, profile, daily_target, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, "
+                    "daily_target = excluded.daily_target, updated_at = excluded.updated_at",
+                    (user_id, json.dumps(profile, ensure_ascii=False),
+                     json.dumps(daily_target, ensure_ascii=False) if daily_target else None, now)
+                )
+            if inventory is not None:
+                if inventory_rows is None:
+                    conn.execute("DELETE FROM inventory WHERE user_id = ?", (user_id,))
+                else:
+                    conn.executemany("DELETE FROM inventory WHERE id = ? AND user_id = ?", [(row, user_id) for row in inventory_rows])
+                row_ids = self._insert_inventory(conn, user_id, inventory)
+            if new_inventory:
+                self._insert_inventory(conn, user_id, new_inventory)
+            if new_meals:
+                conn.executemany(
+                    "INSERT INTO meal_history (user_id, date, recipe_name, nutrition, extra) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (user_id, meal['date'], meal['recipe_name'], json.dumps(meal['nutrition'], ensure_ascii=False),
+                         json.dumps({k: v for k, v in meal.items() if k not in ('date', 'recipe_name', 'nutrition')}, ensure_ascii=False))
+                        for meal in new_meals
+                    ]
+                )
+            if new_expenses:
+                for exp in new_expenses:
+                    expense_id = conn.execute(
+                        "INSERT INTO expenses (user_id, date, amount, items) VALUES (?, ?, ?, ?)",
+                        (user_id, exp['date'], exp['amount'], exp['items'])
+                    ).lastrowid
+                    conn.executemany(
+                        "INSERT INTO expense_items (expense_id, user_id, name, quantity, unit, price) VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            (expense_id, user_id, line['name'], line.get('quantity'), line.get('unit'), line.get('price'))
+                            for line in exp.get('line_items', [])
+                        ]
+                    )
+                self._apply_expense_delta(conn, user_id, ExpenseLedger.build(new_expenses))
+        return row_ids
+
+@st.cache_resource
+def get_storage() -> Optional[Storage]:
+    # TAISTE_DB를 빈 값으로 두면 저장소 없이 세션 메모리만 사용
+    return Storage(STORAGE_DB_PATH) if STORAGE_DB_PATH else None
+
+# -------------------------------------------------------------------------
+# 영양 섭취 집계
+# -------------------------------------------------------------------------
+NUTRIENT_KEYS = ("calories", "protein", "carbs", "fat")
+
+class NutritionTracker:
+    @staticmethod
+    def _window_start(period_days: int, today: Optional[datetime] = None) -> str:
+        today = today or datetime.now()
+        return (today - timedelta(days=period_days - 1)).strftime("%Y-%m-%d")
+
+    @staticmethod
+    def build_daily_intake(meal_history: List[Dict], period_days: int, today: Optional[datetime] = None) -> Dict:
+        # 기간 내 식사만 뒤에서부터 훑어 일별 합계를 만든다 (세션 시작 시 1회)
+        window_start = NutritionTracker._window_start(period_days, today)
+        daily_intake = {}
+        for meal in reversed(meal_history):
+            if meal['date'][:10] < window_start:
+                break
+            NutritionTracker.add_meal(daily_intake, meal)
+        return daily_intake
+
+    @staticmethod
+    def add_meal(daily_intake: Dict, meal: Dict):
+        date_key = meal['date'][:10]
+        totals = daily_intake.setdefault(date_key, {k: 0 for k in NUTRIENT_KEYS})
+        for k in NUTRIENT_KEYS:
+            totals[k] += float(meal['nutrition'].get(k, 0) or 0)
+
+    @staticmethod
+    def refresh(daily_intake: Dict, nutrition_status: Dict, today: Optional[datetime] = None):
+        # 기간을 벗어난 날짜를 제거하고, 남은 기간 데이터로만 평균/부족량을 다시 계산
+        window_start = NutritionTracker._window_start(nutrition_status['period_days'], today)
+        for date_key in [d for d in daily_intake if d < window_start]:
+            del daily_intake[date_key]
+
+        days_count = len(daily_intake)
+        if days_count > 0:
+            avg_nutrition = {
+                k: sum(d[k] for d in daily_intake.values()) / days_count for k in NUTRIENT_KEYS
+            }
+        else:
+            avg_nutrition = {k: 0 for k in NUTRIENT_KEYS}
+        nutrition_status['daily_average'] = avg_nutrition
+
+        target = nutrition_status['daily_target']
+        if days_count > 0:
+            nutrition_status['deficiency'] = {
+                k: max(0, target[k] - avg_nutrition.get(k, 0)) for k in target.keys()
+            }
+        else:
+            nutrition_status['deficiency'] = {k: 0 for k in target.keys()}
+        nutrition_status['last_updated'] = datetime.now().isoformat()
+
+    @staticmethod
+    def record_meal(meal: Dict):
+        st.session_state.meal_history.append(meal)
+        NutritionTracker.add_meal(st.session_state.daily_intake, meal)
+        NutritionTracker.refresh(st.session_state.daily_intake, st.session_state.nutrition_status)
+
+# -------------------------------------------------------------------------
+# 지출 집계
+# -------------------------------------------------------------------------
+EXPENSE_PERIODS = ("daily", "weekly", "monthly")
+# 재료별 가격 기록 항목. 단가는 기준 단위(g/ml/개)당 원
+PRICE_ENTRY_FIELDS = ("name", "last", "last_date", "min", "total_price", "total_quantity", "count")
+BASE_UNITS = {"mass": "g", "volume": "ml", "count": "개"}
+# 단가 표시 기준량 (100g, 100ml, 1개 당)
+PRICE_DISPLAY_QUANTITY = {"g": 100, "ml": 100, "개": 1}
+# 지출 차트에 표시할 최근 구간 수
+EXPENSE_CHART_BUCKETS = {"daily": 30, "weekly": 12, "monthly": 12}
+
+class ExpenseLedger:
+    @staticmethod
+    def empty() -> Dict:
+        return {
+            "total": 0.0, "daily": {}, "weekly": {}, "monthly": {},
+            "prices": {}, "meals": {"count": 0, "total": 0.0}
+        }
+
+    @staticmethod
+    def buckets(date: str) -> Dict:
+        year, week, _ = datetime.fromisoformat(date[:10]).isocalendar()
+        return {"daily": date[:10], "weekly": f"{year}-W{week:02d}", "monthly": date[:7]}
+
+    @staticmethod
+    def unit_price(line: Dict):
+        # (재료 키, 기준 단위, 기준 단위 수량, 가격) 또는 단가를 알 수 없으면 None
+        unit = line.get('unit')
+        try:
+            quantity, price = float(line.get('quantity') or 0), float(line.get('price') or 0)
+        except (TypeError, ValueError):
+            return None
+        if unit not in UNIT_TABLE or quantity <= 0 or price <= 0:
+            return None
+        dimension, factor = UNIT_TABLE[unit]
+        return InventoryEngine.normalize_name(line['name']), BASE_UNITS[dimension], quantity * factor, price
+
+    @staticmethod
+    def add_expense(summary: Dict, expense: Dict):
+        amount = float(expense['amount'] or 0)
+        summary['total'] += amount
+        for period, bucket in ExpenseLedger.buckets(expense['date']).items():
+            summary[period][bucket] = summary[period].get(bucket, 0) + amount
+
+        for line in expense.get('line_items', []):
+            priced = ExpenseLedger.unit_price(line)
+            if priced is None:
+                continue
+            key, unit, quantity, price = priced
+            unit_price = price / quantity
+            entry = summary['prices'].setdefault(key, {}).get(unit)
+            if entry is None:
+                summary['prices'][key][unit] = {
+                    "name": line['name'], "last": unit_price, "last_date": expense['date'], "min": unit_price,
+                    "total_price": price, "total_quantity": quantity, "count": 1
+                }
+                continue
+            if expense['date'] >= entry['last_date']:
+                entry.update(name=line['name'], last=unit_price, last_date=expense['date'])
+            entry['min'] = min(entry['min'], unit_price)
+            entry['total_price'] += price
+            entry['total_quantity'] += quantity
+            entry['count'] += 1
+
+    @staticmethod
+    def build(expenses: List[Dict]) -> Dict:
+        summary = ExpenseLedger.empty()
+        for expense in expenses:
+            ExpenseLedger.add_expense(summary, expense)
+        return summary
+
+    @staticmethod
+    def add_meal(summary: Dict, meal: Dict):
+        if meal.get('cost') is not None:
+            summary['meals']['count'] += 1
+            summary['meals']['total'] += float(meal['cost'])
+
+    @staticmethod
+    def record_expenses(expenses: List[Dict]):
+        st.session_state.expenses.extend(expenses)
+        for expense in expenses:
+            ExpenseLedger.add_expense(st.session_state.expense_summary, expense)
+
+    @staticmethod
+    def lookup_price(prices: Dict, name: str) -> Optional[Dict]:
+        # find_item_index와 같은 이름 규칙. {기준 단위: 가격 기록}
+        known = InventoryEngine.best_match(InventoryEngine.normalize_name(name), prices)
+        return prices[known] if known is not None else None
+
+    @staticmethod
+    def meal_cost(ingredients: List[str], prices: Dict) -> Optional[int]:
+        # 재료별 평균 단가로 한 끼 재료비를 추정. 가격 기록이 있는 재료가 하나도 없으면 None
+        total, priced = 0.0, False
+        for ingredient in ingredients:
+            parsed = InventoryEngine.parse_ingredient(ingredient)
+            entries = ExpenseLedger.lookup_price(prices, parsed['name']) if parsed else None
+            for unit, entry in (entries or {}).items():
+                quantity = InventoryEngine.convert(parsed['quantity'], parsed['unit'], unit, parsed['name'])
+                if quantity is not None:
+                    total += quantity * entry['total_price'] / entry['total_quantity']
+                    priced = True
+                    break
+        return round(total) if priced else None
+
+    @staticmethod
+    def recent_buckets(summary: Dict, period: str, count: int) -> List:
+        # 차트용 (구간, 금액) 목록. 구간 키는 날짜 문자열이므로 정렬 순서가 곧 시간 순서
+        return sorted(summary[period].items())[-count:]
+
+# -------------------------------------------------------------------------
+# 영양 목표 계산
+# -------------------------------------------------------------------------
+ACTIVITY_FACTORS = {
+    "매우 적음": 1.2, "적음": 1.375, "보통": 1.55, "활동적": 1.725, "매우 활동적": 1.9,
+    "sedentary": 1.2, "light": 1.375, "moderate": 1.55, "active": 1.725, "very_active": 1.9,
+}
+ACTIVITY_LEVELS = ["매우 적음", "적음", "보통", "활동적", "매우 활동적"]
+GENDER_ALIASES = {"남성": "male", "남": "male", "male": "male", "여성": "female", "여": "female", "female": "female"}
+# 칼로리 대비 탄수화물/단백질/지방 비율 (기본 목표 2000kcal -> 75g/275g/66.7g 과 동일)
+MACRO_SPLIT = {"protein": 0.15, "carbs": 0.55, "fat": 0.30}
+KCAL_PER_GRAM = {"protein": 4, "carbs": 4, "fat": 9}
+
+class NutritionCalculator:
+    @staticmethod
+    def profile_key(profile: Dict):
+        return (
+            int(profile['age']),
+            GENDER_ALIASES.get(profile['gender'], "male"),
+            float(profile['height']),
+            float(profile['weight']),
+            profile['activity_level'],
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _calculate(age: int, gender: str, height: float, weight: float, activity_level: str) -> tuple:
+        # Mifflin-St Jeor 기초대사량 x 활동 계수
+        bmr = 10 * weight + 6.25 * height - 5 * age + (5 if gender == "male" else -161)
+        calories = bmr * ACTIVITY_FACTORS.get(activity_level, ACTIVITY_FACTORS["보통"])
+        macros = tuple(round(calories * MACRO_SPLIT[k] / KCAL_PER_GRAM[k], 1) for k in ("protein", "carbs", "fat"))
+        return (round(calories),) + macros
+
+    @staticmethod
+    def calculate(profile: Dict) -> Dict:
+        calories, protein, carbs, fat = NutritionCalculator._calculate(*NutritionCalculator.profile_key(profile))
+        return {"calories": calories, "protein": protein, "carbs": carbs, "fat": fat}
+
+# -------------------------------------------------------------------------
+# GPT 응답 캐시
+# -------------------------------------------------------------------------
+# 메서드별 캐시 유지 시간(초). 0이면 캐시하지 않음
+CACHE_TTL = {
+    "parse_inventory_from_text": 24 * 3600,
+    "parse_inventory_from_image": 24 * 3600,
+    "explain_nutrition_target": 30 * 24 * 3600,
+    "recommend_recipes": 10 * 60,
+    "recommend_nutrient_rich_recipes": 10 * 60,
+    "update_inventory_after_cooking": 3600,
+    "check_recipe_sufficiency": 3600,
+}
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_DISK_ENTRIES = 5000
+CACHE_DB_PATH = os.environ.get("TAISTE_CACHE_DB", "")
+
+class ResponseCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, db_path: str = "", max_disk_entries: int = CACHE_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache(accessed_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    @staticmethod
+    def _normalize_content(content):
+        # 텍스트는 공백을 정규화하고, 이미지는 데이터 URL 대신 해시만 키에 반영
+        if isinstance(content, str):
+            return re.sub(r"\s+", " ", content).strip()
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if part.get("type") == "image_url":
+                    url = part["image_url"]["url"]
+                    parts.append({"type": "image_url", "sha256": hashlib.sha256(url.encode()).hexdigest(),
+                                  "detail": part["image_url"].get("detail")})
+                elif part.get("type") == "text":
+                    parts.append({"type": "text", "text": ResponseCache._normalize_content(part["text"])})
+                else:
+                    parts.append(part)
+            return parts
+        return content
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List[Dict], **extra) -> str:
+        normalized = [
+            {"role": m["role"], "content": ResponseCache._normalize_content(m["content"])}
+            for m in messages
+        ]
+        payload = json.dumps(
+            {"model": model, "temperature": temperature, "messages": normalized, "extra": extra},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.db_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    with self._lock:
+                        self.disk_hits += 1
+                        self._put_memory(key, row[0], row[1])
+                    return row[0]
+                if row:
+                    conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str, ttl: float):
+        if ttl <= 0:
+            return
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM response_cache WHERE key IN ("
+                    "SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+
+    def _put_memory(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM response_cache")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0
+            }
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(db_path=CACHE_DB_PATH)
+
+class JSONArrayStreamParser:
+    # 스트리밍 중인 JSON 배열에서 최상위 객체가 닫히는 즉시 파싱
+    def __init__(self):
+        self.started = False
+        self.closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+        # JSON으로 읽지 못한 객체의 원문 (스트림이 끝난 뒤 한꺼번에 고침)
+        self.invalid = []
+
+    def feed(self, chunk: str) -> List[Any]:
+        completed = []
+        for ch in chunk:
+            if self.closed:
+                break
+            if not self.started:
+                # ```json 같은 앞부분은 배열 시작 전까지 무시
+                if ch == "[":
+                    self.started = True
+                continue
+
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                elif ch == "]":
+                    self.closed = True
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    text = "".join(self._buffer)
+                    self._buffer = []
+                    try:
+                        completed.append(json.loads(text))
+                    except ValueError:
+                        self.invalid.append(text)
+        return completed
+
+# -------------------------------------------------------------------------
+# 로컬 재고 계산
+# -------------------------------------------------------------------------
+# 단위 -> (차원, 기준 단위로의 환산 계수). 질량은 g, 부피는 ml, 개수는 개 기준
+UNIT_TABLE = {
+    "g": ("mass", 1.0),
+    "kg": ("mass", 1000.0),
+    "ml": ("volume", 1.0),
+    "L": ("volume", 1000.0),
+    "개": ("count", 1.0),
+}
+UNIT_ALIASES = {
+    "g": "g", "그램": "g", "gram": "g", "grams": "g",
+    "kg": "kg", "킬로": "kg", "킬로그램": "kg",
+    "ml": "ml", "밀리리터": "ml", "cc": "ml",
+    "l": "L", "리터": "L",
+    "개": "개", "알": "개", "쪽": "개", "대": "개", "모": "개", "송이": "개", "마리": "개", "장": "개", "통": "개", "ea": "개",
+    "키로": "kg", "팩": "개", "봉": "개", "봉지": "개", "병": "개", "캔": "개", "단": "개", "줄": "개", "포기": "개",
+}
+# 계량 단위는 ml로 환산
+MEASURE_UNITS = {"큰술": 15.0, "스푼": 15.0, "작은술": 5.0, "티스푼": 5.0, "컵": 200.0}
+# 식재료 1개당 평균 무게(g)
+AVERAGE_WEIGHTS = {
+    "양파": 200, "감자": 150, "당근": 150, "달걀": 50, "대파": 80, "마늘": 5,
+    "고구마": 200, "토마토": 150, "방울토마토": 15, "오이": 200, "애호박": 300, "파프리카": 150,
+    "피망": 100, "청양고추": 10, "고추": 10, "두부": 300, "사과": 200, "바나나": 120,
+    "레몬": 100, "양배추": 1000, "배추": 2000, "무": 1000, "새송이버섯": 80, "표고버섯": 20,
+    "가지": 150, "브로콜리": 300, "닭다리": 150, "소시지": 50, "어묵": 30,
+}
+INGREDIENT_SYNONYMS = {"계란": "달걀", "파": "대파", "닭알": "달걀"}
+# 재료 이름 뒤에 붙으면 다른 식재료(가공품)가 되는 말. "고추" -> "고추장", "감자" -> "감자전분"
+COMPOUND_SUFFIXES = ("장", "가루", "분말", "전분", "즙", "소스", "기름", "청", "액", "젓", "엑기스", "페이스트", "시럽", "잼", "칩")
+# 액체와 고체 간 환산 시 사용하는 밀도(g/ml)
+DEFAULT_DENSITY = 1.0
+# 재고에 없어도 항상 있다고 보는 기본 양념류
+PANTRY_STAPLES = {"물", "소금", "후추", "설탕", "식용유"}
+# 양념류. 재고에 없어도 이 양(g/ml) 이하로 조금 쓰는 경우는 만들 수 있다고 봄 (간장 1큰술 = 15ml)
+SEASONINGS = {
+    "간장", "진간장", "국간장", "양조간장", "된장", "고추장", "쌈장", "고춧가루", "참기름", "들기름", "올리브유",
+    "식초", "맛술", "미림", "올리고당", "물엿", "꿀", "굴소스", "케첩", "마요네즈", "머스터드", "깨", "통깨", "참깨",
+    "깨소금", "생강", "다진마늘", "후춧가루", "액젓", "멸치액젓", "까나리액젓", "새우젓", "다시다", "치킨스톡",
+}
+SEASONING_SMALL_AMOUNT = 30
+# 재료 이름 앞에 붙는 손질 방법. 이름을 재고와 맞출 때 떼어냄 ("다진 마늘" -> "마늘")
+PREP_MODIFIERS = {
+    "다진", "간", "썬", "채", "채썬", "송송", "어슷", "어슷썬", "깍둑", "깍둑썬", "얇게", "굵게", "잘게", "곱게",
+    "으깬", "삶은", "데친", "볶은", "구운", "불린", "손질한", "깐", "껍질", "벗긴", "씻은", "자른", "찢은", "냉동",
+}
+# 이 말이 붙은 재료("참기름 약간")는 없어도 만들 수 있는 선택 재료로 봄
+OPTIONAL_AMOUNT_WORDS = ("약간", "조금", "적당량", "적당히", "취향껏", "기호에", "선택", "꼬집")
+# 재고 충분 여부 판단 시 허용하는 부족 비율 (0.1 = 필요량의 90%만 있어도 충분)
+SUFFICIENCY_TOLERANCE = 0.1
+# 냉장 보관 기준 식재료별 기본 유통기한(일). 표에 없는 재료는 DEFAULT_SHELF_LIFE_DAYS
+SHELF_LIFE_DAYS = {
+    "닭고기": 2, "닭가슴살": 2, "닭다리": 2, "돼지고기": 3, "소고기": 3, "다짐육": 2,
+    "고등어": 2, "연어": 2, "새우": 2, "오징어": 2, "생선": 2,
+    "햄": 14, "소시지": 14, "베이컨": 7, "어묵": 5,
+    "두부": 5, "우유": 7, "요거트": 14, "치즈": 30, "버터": 60, "달걀": 21,
+    "콩나물": 3, "숙주": 2, "시금치": 3, "상추": 4, "양상추": 5, "깻잎": 5, "부추": 4,
+    "버섯": 5, "새송이버섯": 7, "표고버섯": 7, "브로콜리": 5, "대파": 7, "애호박": 7,
+    "오이": 7, "가지": 7, "토마토": 7, "방울토마토": 7, "파프리카": 7, "피망": 7, "고추": 10,
+    "양배추": 14, "배추": 14, "무": 14, "당근": 21, "고구마": 21,
+    "양파": 30, "감자": 30, "마늘": 30, "김치": 60,
+    "바나나": 5, "아보카도": 4, "사과": 30, "레몬": 21,
+    "밥": 2, "식빵": 5, "떡": 3,
+}
+DEFAULT_SHELF_LIFE_DAYS = 7
+# 유통기한이 이 일수 안에 끝나는 재료를 '임박'으로 표시하고 추천에 우선 활용
+EXPIRY_SOON_DAYS = 3
+# 레시피 추천 프롬프트에 수량/남은 일수와 함께 보내는 임박 재료 수
+RECOMMEND_URGENT_COUNT = 5
+
+INGREDIENT_PATTERN = re.compile(
+    r"^\s*(?P<name>.+?)\s*(?P<quantity>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:[.,]\d+)?(?:/\d+)?)\s*(?P<unit>[A-Za-z가-힣]+)?\s*(?:\(.*\))?\s*$"
+)
+# 이름 끝에 붙은 포장 단위 용량 ("닭가슴살 1kg 2팩"의 "1kg")
+PACK_SIZE_PATTERN = re.compile(r"^(?P<name>.+?)\s*(?P<quantity>\d+(?:\.\d+)?)\s*(?P<unit>[A-Za-z가-힣]+)$")
+# 쉼표(숫자 사이의 쉼표 제외), 줄바꿈, 세미콜론, 가운뎃점으로 항목을 구분
+INVENTORY_TEXT_SEPARATOR = re.compile(r"(?<!\d),|,(?!\d)|[\n;·]")
+
+class InventoryEngine:
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        key = re.sub(r"\s+", "", str(name)).lower()
+        return INGREDIENT_SYNONYMS.get(key, key)
+
+    @staticmethod
+    def base_name(name: str) -> str:
+        # 앞에 붙은 손질 방법을 뗀 재료 이름 ("송송 썬 대파" -> "대파"). 한 단어만 남으면 그대로
+        words = str(name).split()
+        while len(words) > 1 and (words[0] in PREP_MODIFIERS or words[0].endswith("썬")):
+            words.pop(0)
+        return " ".join(words)
+
+    @staticmethod
+    def is_minor_seasoning(name: str, parsed: Optional[Dict]) -> bool:
+        # 수량이 없거나 적은 양념은 재고와 엄격하게 비교하지 않음
+        key = InventoryEngine.normalize_name(InventoryEngine.base_name(name))
+        if key not in SEASONINGS:
+            return False
+        if parsed is None:
+            return True
+        return parsed['unit'] in ("g", "ml") and parsed['quantity'] <= SEASONING_SMALL_AMOUNT
+
+    @staticmethod
+    def name_match(key: str, other: str) -> int:
+        # 같은 재료로 볼 수 있으면 기준 이름의 길이, 아니면 0 (정규화된 이름끼리 비교).
+        # 정확히 같거나, 한쪽이 다른 쪽 이름 뒤에 부위/품종을 덧붙인 경우("돼지고기" -> "돼지고기앞다리살")만 인정
+        if key == other:
+            return len(key)
+        base, extended = (key, other) if len(key) < len(other) else (other, key)
+        if len(base) < 2 or not extended.startswith(base):
+            return 0
+        if extended[len(base):].startswith(COMPOUND_SUFFIXES):
+            return 0
+        return len(base)
+
+    @staticmethod
+    def best_match(key: str, candidates) -> Optional[str]:
+        # 정확히 일치하는 이름을 우선하고, 없으면 name_match로 가장 길게 겹치는 이름
+        if key in candidates:
+            return key
+        best, best_len = None, 0
+        for candidate in candidates:
+            length = InventoryEngine.name_match(key, candidate)
+            if length > best_len:
+                best, best_len = candidate, length
+        return best
+
+    @staticmethod
+    def normalize_unit(unit: Optional[str]) -> Optional[str]:
+        if not unit:
+            return None
+        unit = unit.strip()
+        if unit in MEASURE_UNITS:
+            return unit
+        return UNIT_ALIASES.get(unit.lower(), UNIT_ALIASES.get(unit))
+
+    @staticmethod
+    def parse_quantity(text: str) -> float:
+        if re.fullmatch(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?", text):
+            # 1,500 처럼 천 단위 구분 쉼표
+            return float(text.replace(",", ""))
+        text = text.replace(",", ".")
+        if "/" in text:
+            numerator, denominator = text.split("/", 1)
+            return float(numerator) / float(denominator)
+        return float(text)
+
+    @staticmethod
+    def parse_ingredient(text: str) -> Optional[Dict]:
+        # "양파 150g", "간장 1큰술", "달걀 2개 (약 100g)" 형태를 {name, quantity, unit}으로 변환
+        match = INGREDIENT_PATTERN.match(str(text))
+        if not match:
+            return None
+        unit = InventoryEngine.normalize_unit(match.group("unit"))
+        if match.group("unit") and unit is None:
+            return None
+        quantity = InventoryEngine.parse_quantity(match.group("quantity"))
+        if unit in MEASURE_UNITS:
+            quantity, unit = quantity * MEASURE_UNITS[unit], "ml"
+        name = match.group("name").strip()
+        pack = PACK_SIZE_PATTERN.match(name)
+        if pack and (unit is None or UNIT_TABLE[unit][0] == "count"):
+            # "닭가슴살 1kg 2팩" -> 닭가슴살 2kg. 개수 단위 앞의 용량(무게/부피)을 수량에 곱함
+            pack_unit = InventoryEngine.normalize_unit(pack.group("unit"))
+            if pack_unit in UNIT_TABLE and UNIT_TABLE[pack_unit][0] != "count":
+                name = pack.group("name")
+                quantity, unit = quantity * InventoryEngine.parse_quantity(pack.group("quantity")), pack_unit
+        return {"name": name, "quantity": quantity, "unit": unit or "개"}
+
+    @staticmethod
+    def parse_inventory_text(text: str):
+        # "달걀 10개, 우유 1L, 양파 3개" 같은 입력을 재고 항목으로 변환.
+        # (파싱된 항목, 로컬에서 해석하지 못한 조각) 반환
+        items, unparsed = [], []
+        for fragment in INVENTORY_TEXT_SEPARATOR.split(text):
+            fragment = fragment.strip(" \t-•")
+            if not fragment:
+                continue
+            parsed = InventoryEngine.parse_ingredient(fragment)
+            if parsed is None or parsed['unit'] not in UNIT_TABLE or parsed['quantity'] <= 0:
+                unparsed.append(fragment)
+                continue
+            quantity = parsed['quantity']
+            if float(quantity).is_integer():
+                quantity = int(quantity)
+            items.append({"name": parsed['name'], "quantity": quantity, "unit": parsed['unit']})
+        return items, unparsed
+
+    @staticmethod
+    def ingredient_name(text: str, parsed: Optional[Dict] = None) -> str:
+        if parsed:
+            return parsed['name']
+        tokens = InventoryEngine.base_name(text).split()
+        return tokens[0] if tokens else ""
+
+    @staticmethod
+    def format_quantity(quantity: float, unit: str) -> str:
+        return f"{quantity:g}{unit}"
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def shelf_life(name: str) -> int:
+        # "돼지고기 앞다리살" -> 돼지고기 처럼 같은 재료로 볼 수 있는 이름 기준
+        known = InventoryEngine.best_match(InventoryEngine.normalize_name(name), SHELF_LIFE_DAYS)
+        return SHELF_LIFE_DAYS[known] if known is not None else DEFAULT_SHELF_LIFE_DAYS
+
+    @staticmethod
+    def default_expiry(name: str, added: Optional[datetime] = None) -> str:
+        return ((added or datetime.now()) + timedelta(days=InventoryEngine.shelf_life(name))).isoformat()
+
+    @staticmethod
+    def expiry_timestamp(item: Dict) -> Optional[float]:
+        try:
+            return datetime.fromisoformat(item['expiry_date']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def expiry_window(days: int, now: Optional[datetime] = None):
+        # (오늘 0시, days일 뒤 자정) 타임스탬프. 남은 일수는 날짜 단위로 셈
+        today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today.timestamp(), (today + timedelta(days=days + 1)).timestamp()
+
+    @staticmethod
+    def urgent_items(inventory: List[Dict], k: int = RECOMMEND_URGENT_COUNT, days: int = EXPIRY_SOON_DAYS,
+                     now: Optional[datetime] = None) -> List[Dict]:
+        # 색인이 없는 목록용. 기한이 지나지 않은 임박 재료 중 가장 급한 k개 (InventoryStore.expiring과 같은 순서)
+        start, end = InventoryEngine.expiry_window(days, now)
+        candidates = []
+        for item in inventory:
+            ts = InventoryEngine.expiry_timestamp(item)
+            if ts is not None and start <= ts < end:
+                candidates.append((ts, InventoryEngine.normalize_name(item['name']), item))
+        return [item for _, _, item in heapq.nsmallest(k, candidates, key=lambda entry: entry[:2])]
+
+    @staticmethod
+    def average_weight(name: str) -> Optional[float]:
+        known = InventoryEngine.best_match(InventoryEngine.normalize_name(name), AVERAGE_WEIGHTS)
+        return float(AVERAGE_WEIGHTS[known]) if known is not None else None
+
+    @staticmethod
+    def convert(quantity: float, from_unit: str, to_unit: str, name: str = "") -> Optional[float]:
+        if from_unit not in UNIT_TABLE or to_unit not in UNIT_TABLE:
+            return None
+        from_dim, from_factor = UNIT_TABLE[from_unit]
+        to_dim, to_factor = UNIT_TABLE[to_unit]
+        base = quantity * from_factor
+        if from_dim == to_dim:
+            return base / to_factor
+
+        # 서로 다른 차원은 g을 거쳐 환산
+        if from_dim == "count":
+            weight = InventoryEngine.average_weight(name)
+            if weight is None:
+                return None
+            grams = base * weight
+        elif from_dim == "volume":
+            grams = base * DEFAULT_DENSITY
+        else:
+            grams = base
+
+        if to_dim == "count":
+            weight = InventoryEngine.average_weight(name)
+            if weight is None:
+                return None
+            return grams / weight
+        if to_dim == "volume":
+            return grams / DEFAULT_DENSITY / to_factor
+        return grams / to_factor
+
+    @staticmethod
+    def find_item_index(inventory: List[Dict], name: str) -> Optional[int]:
+        key = InventoryEngine.normalize_name(InventoryEngine.base_name(name))
+        best_idx, best_len = None, 0
+        for idx, item in enumerate(inventory):
+            item_key = InventoryEngine.normalize_name(item['name'])
+            if item_key == key:
+                return idx
+            # "돼지고기" vs "돼지고기 앞다리살" 처럼 부위/품종만 덧붙은 경우 (고추 vs 고추장은 제외)
+            if InventoryEngine.name_match(key, item_key) and len(item_key) > best_len:
+                best_idx, best_len = idx, len(item_key)
+        return best_idx
+
+    @staticmethod
+    def round_remaining(quantity: float, unit: str) -> float:
+        if unit == "개":
+            # '개'는 0.5 단위로 내림 (예: 2.2개 -> 2개)
+            return math.floor(quantity * 2 + 1e-9) / 2
+        if unit in ("kg", "L"):
+            return round(quantity, 3)
+        return round(quantity, 1)
+
+    @staticmethod
+    def check_sufficiency(inventory: List[Dict], ingredients: List[str], tolerance: float = SUFFICIENCY_TOLERANCE):
+        # {sufficient, missing_items} 결과와 로컬에서 판단하지 못한 재료 목록을 반환
+        missing_items = []
+        unresolved = []
+
+        for ingredient in ingredients:
+            parsed = InventoryEngine.parse_ingredient(ingredient)
+            name = InventoryEngine.ingredient_name(ingredient, parsed)
+            if not name or InventoryEngine.normalize_name(InventoryEngine.base_name(name)) in PANTRY_STAPLES:
+                continue
+            if InventoryEngine.is_minor_seasoning(name, parsed):
+                # 간장 1큰술처럼 적은 양의 양념은 있는 것으로 봄
+                continue
+
+            idx = InventoryEngine.find_item_index(inventory, name)
+            if idx is None:
+                # 재고 이름과 맞추지 못한 재료("계육 300g", "닭고기 반 마리")는 GPT로 유연하게 판단.
+                # "참기름 약간"처럼 선택 재료로 적힌 것은 제외
+                if parsed or not any(word in ingredient for word in OPTIONAL_AMOUNT_WORDS):
+                    unresolved.append(ingredient)
+                continue
+            if parsed is None:
+                unresolved.append(ingredient)
+                continue
+
+            item = inventory[idx]
+            required = InventoryEngine.convert(parsed['quantity'], parsed['unit'], item['unit'], item['name'])
+            if required is None:
+                unresolved.append(ingredient)
+                continue
+
+            # 허용 오차만큼은 부족해도 만들 수 있다고 판단
+            if float(item['quantity']) < required * (1 - tolerance):
+                needed = InventoryEngine.format_quantity(parsed['quantity'], parsed['unit'])
+                owned = InventoryEngine.format_quantity(float(item['quantity']), item['unit'])
+                missing_items.append(f"{name} (필요: {needed}, 보유: {owned})")
+
+        return {"sufficient": not missing_items, "missing_items": missing_items}, unresolved
+
+    @staticmethod
+    def deduct(inventory: List[Dict], used_ingredients: List[str]):
+        # 차감 결과와 로컬에서 해석하지 못한 재료 목록을 반환
+        updated = [dict(item) for item in inventory]
+        unresolved = []
+
+        for ingredient in used_ingredients:
+            parsed = InventoryEngine.parse_ingredient(ingredient)
+            name = InventoryEngine.ingredient_name(ingredient, parsed)
+            if not name or InventoryEngine.normalize_name(InventoryEngine.base_name(name)) in PANTRY_STAPLES:
+                continue
+            idx = InventoryEngine.find_item_index(updated, name)
+            if idx is None:
+                # 적은 양념이나 "참기름 약간" 같은 선택 재료는 없으면 차감할 것이 없음.
+                # 그 밖에 재고 이름과 맞추지 못한 재료는 버리지 않고 GPT로 차감
+                optional = parsed is None and any(word in ingredient for word in OPTIONAL_AMOUNT_WORDS)
+                if not optional and not InventoryEngine.is_minor_seasoning(name, parsed):
+                    unresolved.append(ingredient)
+                continue
+            if parsed is None:
+                unresolved.append(ingredient)
+                continue
+
+            item = updated[idx]
+            used = InventoryEngine.convert(parsed['quantity'], parsed['unit'], item['unit'], item['name'])
+            if used is None:
+                unresolved.append(ingredient)
+                continue
+            if item['unit'] == "개":
+                # 일부만 사용해도 0.5개 단위로 올려서 차감 (예: 양파 150g -> 1개)
+                used = math.ceil(used * 2 - 1e-9) / 2
+
+            item['quantity'] = InventoryEngine.round_remaining(float(item['quantity']) - used, item['unit'])
+
+        updated = [item for item in updated if float(item['quantity']) > 0]
+        return updated, unresolved
+
+class InventoryStore:
+    # 정규화한 식재료 이름을 키로 하는 재고. 같은 재료는 단위를 환산해 합치고, 항목마다 고정 ID를 부여.
+    # 환산할 수 없는 단위(우유 1L와 2개)는 버리지 않고 단위별로 따로 보관
+    def __init__(self, items: Optional[List[Dict]] = None):
+        self._items = {}
+        self._keys_by_id = {}
+        # 이름 -> 항목 키 목록 (단위별 항목이 여러 개일 수 있음)
+        self._keys_by_name = {}
+        # (유통기한 타임스탬프, 키) 오름차순 목록. 임박 재료 조회는 이진 탐색 후 앞에서부터 k개만 읽음
+        self._expiry = []
+        self._expiry_ts = {}
+        for item in items or []:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def add(self, item: Dict) -> Dict:
+        name = InventoryEngine.normalize_name(item['name'])
+        for key in self._keys_by_name.get(name, []):
+            existing = self._items[key]
+            quantity = InventoryEngine.convert(float(item['quantity']), item['unit'], existing['unit'], existing['name'])
+            if quantity is not None:
+                break
+        else:
+            # 처음 들어온 재료이거나 기존 항목과 단위를 환산할 수 없으면 새 항목으로
+            new_item = dict(item)
+            new_item['id'] = new_item.get('id') or uuid.uuid4().hex[:8]
+            key = name if name not in self._items else f"{name}|{new_item['id']}"
+            self._items[key] = new_item
+            self._keys_by_id[new_item['id']] = key
+            self._keys_by_name.setdefault(name, []).append(key)
+            self._index(key)
+            return new_item
+
+        existing['quantity'] = InventoryEngine.round_remaining(float(existing['quantity']) + quantity, existing['unit'])
+        # 먼저 들어온 재고 기준으로 추가일/유통기한을 유지
+        for date_key in ('added_date', 'expiry_date'):
+            dates = [d for d in (existing.get(date_key), item.get(date_key)) if d]
+            if dates:
+                existing[date_key] = min(dates)
+        self._index(key)
+        return existing
+
+    def remove(self, item_id: str) -> Optional[Dict]:
+        key = self._keys_by_id.pop(item_id, None)
+        if key is None:
+            return None
+        self._unindex(key)
+        item = self._items.pop(key)
+        name = InventoryEngine.normalize_name(item['name'])
+        self._keys_by_name[name].remove(key)
+        if not self._keys_by_name[name]:
+            del self._keys_by_name[name]
+        return item
+
+    def replace_all(self, items: List[Dict]):
+        # 차감 결과처럼 전체 목록이 새로 주어져도 같은 재료(같은 단위)의 ID는 유지
+        previous = {}
+        for item in self._items.values():
+            previous.setdefault(InventoryEngine.normalize_name(item['name']), []).append(item)
+        self._items = {}
+        self._keys_by_id = {}
+        self._keys_by_name = {}
+        self._expiry = []
+        self._expiry_ts = {}
+        for item in items:
+            if not item.get('id'):
+                unit = InventoryEngine.normalize_unit(item['unit'])
+                candidates = previous.get(InventoryEngine.normalize_name(item['name']), [])
+                match = next((p for p in candidates if InventoryEngine.normalize_unit(p['unit']) == unit), None)
+                if match is None and len(candidates) == 1:
+                    match = candidates[0]
+                if match is not None and match['id'] not in self._keys_by_id:
+                    item = dict(item, id=match['id'])
+            self.add(item)
+
+    def to_list(self, include_id: bool = False) -> List[Dict]:
+        # 프롬프트/계산용 목록. 기본적으로 내부 ID는 제외
+        return InventoryStore._export(self._items.values(), include_id)
+
+    @staticmethod
+    def _export(items, include_id: bool) -> List[Dict]:
+        if include_id:
+            return [dict(item) for item in items]
+        return [{k: v for k, v in item.items() if k != 'id'} for item in items]
+
+    def _index(self, key: str):
+        self._unindex(key)
+        ts = InventoryEngine.expiry_timestamp(self._items[key])
+        if ts is not None:
+            bisect.insort(self._expiry, (ts, key))
+            self._expiry_ts[key] = ts
+
+    def _unindex(self, key: str):
+        ts = self._expiry_ts.pop(key, None)
+        if ts is not None:
+            del self._expiry[bisect.bisect_left(self._expiry, (ts, key))]
+
+    def expiring(self, days: int = EXPIRY_SOON_DAYS, limit: Optional[int] = None, now: Optional[datetime] = None,
+                 include_id: bool = False) -> List[Dict]:
+        # 오늘부터 days일 안에 유통기한이 끝나는 재료를 임박한 순서로. 이미 지난 재료는 expired()
+        start, end = InventoryEngine.expiry_window(days, now)
+        lo = bisect.bisect_left(self._expiry, start, key=lambda entry: entry[0])
+        hi = bisect.bisect_left(self._expiry, end, lo=lo, key=lambda entry: entry[0])
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return InventoryStore._export((self._items[key] for _, key in self._expiry[lo:hi]), include_id)
+
+    def expired(self, now: Optional[datetime] = None, include_id: bool = False) -> List[Dict]:
+        start, _ = InventoryEngine.expiry_window(0, now)
+        hi = bisect.bisect_left(self._expiry, start, key=lambda entry: entry[0])
+        return InventoryStore._export((self._items[key] for _, key in self._expiry[:hi]), include_id)
+
+# -------------------------------------------------------------------------
+# 재료 영양 계산
+# -------------------------------------------------------------------------
+# 식재료 100g당 (칼로리 kcal, 단백질 g, 탄수화물 g, 지방 g). 액체는 100ml 기준
+INGREDIENT_NUTRITION = {
+    "밥": (150, 2.7, 33, 0.3), "쌀": (360, 6.5, 79, 0.6), "당면": (350, 0.1, 86, 0.1),
+    "부침가루": (360, 9, 76, 1.5), "오트밀": (380, 13, 67, 7), "라면": (450, 9, 62, 18),
+    "국수": (290, 9, 60, 1), "식빵": (270, 9, 50, 4),
+    "김치": (30, 2, 5, 0.5), "양파": (37, 1, 8.5, 0.1), "대파": (27, 1.5, 6, 0.3),
+    "마늘": (130, 6.4, 28, 0.2), "감자": (77, 2, 17, 0.1), "고구마": (128, 1.4, 31, 0.2),
+    "당근": (41, 0.9, 10, 0.2), "애호박": (20, 1.2, 4, 0.2), "오이": (15, 0.7, 3.6, 0.1),
+    "토마토": (18, 0.9, 3.9, 0.2), "양상추": (15, 1, 3, 0.2), "양배추": (25, 1.3, 6, 0.1),
+    "배추": (13, 1.1, 2.2, 0.2), "무": (18, 0.7, 4, 0.1), "시금치": (23, 2.9, 3.6, 0.4),
+    "브로콜리": (34, 2.8, 7, 0.4), "콩나물": (30, 3.5, 3, 1), "파프리카": (26, 1, 6, 0.3),
+    "피망": (20, 0.9, 4.6, 0.2), "고추": (40, 2, 9, 0.4), "가지": (25, 1, 6, 0.2),
+    "새송이버섯": (30, 3, 6, 0.4), "표고버섯": (34, 2.2, 7, 0.5), "버섯": (25, 3, 4, 0.3),
+    "미역": (150, 20, 40, 3), "아보카도": (160, 2, 9, 15),
+    "사과": (52, 0.3, 14, 0.2), "바나나": (89, 1.1, 23, 0.3), "레몬": (29, 1.1, 9, 0.3),
+    "달걀": (143, 12.6, 0.7, 9.5), "두부": (84, 9, 2, 5), "우유": (65, 3.2, 4.8, 3.6),
+    "요거트": (97, 9, 4, 5), "치즈": (350, 22, 2, 28),
+    "닭가슴살": (110, 23, 0, 1.5), "닭고기": (190, 19, 0, 12), "닭다리": (200, 18, 0, 14),
+    "돼지고기": (250, 17, 0, 20), "소고기": (220, 19, 0, 16), "햄": (230, 14, 4, 18),
+    "소시지": (300, 12, 3, 27), "베이컨": (400, 14, 1, 38),
+    "고등어": (205, 19, 0, 14), "연어": (208, 20, 0, 13), "참치": (190, 25, 0, 10),
+    "어묵": (130, 10, 15, 3.5), "새우": (99, 24, 0.2, 0.3),
+    "견과류": (600, 18, 20, 52), "꿀": (304, 0.3, 82, 0),
+    "식용유": (884, 0, 0, 100), "올리브유": (884, 0, 0, 100), "참기름": (884, 0, 0, 100),
+    "버터": (717, 0.9, 0.1, 81), "간장": (60, 8, 6, 0), "된장": (190, 12, 23, 6),
+    "고추장": (220, 4, 46, 2), "굴소스": (60, 1.5, 12, 0.3), "케첩": (110, 1.2, 26, 0.2),
+    "마요네즈": (680, 1, 1, 75), "설탕": (387, 0, 100, 0), "소금": (0, 0, 0, 0), "물": (0, 0, 0, 0),
+}
+# 수량이 있는 재료 중 이 비율 이상을 표에서 찾았을 때만 계산값을 신뢰
+NUTRITION_MIN_COVERAGE = 0.8
+# 모델이 준 칼로리가 계산값과 이 비율 이상 차이 나면 계산값으로 교체
+NUTRITION_OVERRIDE_RATIO = 0.25
+
+class NutritionEstimator:
+    names = list(INGREDIENT_NUTRITION)
+    table = np.array([INGREDIENT_NUTRITION[name] for name in names], dtype=float)
+    column = {name: idx for idx, name in enumerate(names)}
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def lookup(name: str) -> Optional[int]:
+        # find_item_index와 같은 이름 규칙
+        known = InventoryEngine.best_match(InventoryEngine.normalize_name(name), NutritionEstimator.column)
+        return NutritionEstimator.column[known] if known is not None else None
+
+    @staticmethod
+    def grams_vector(ingredients: List[str]):
+        # 재료 목록 -> 표 항목별 g 벡터, 수량이 있는 재료 중 표에서 찾은 비율
+        grams = np.zeros(len(NutritionEstimator.names))
+        counted = resolved = 0
+        for ingredient in ingredients:
+            parsed = InventoryEngine.parse_ingredient(ingredient)
+            if parsed is None:
+                # "소금 약간"처럼 수량이 없는 재료는 계산에서 제외
+                continue
+            counted += 1
+            idx = NutritionEstimator.lookup(parsed['name'])
+            weight = InventoryEngine.convert(parsed['quantity'], parsed['unit'], "g", parsed['name'])
+            if idx is None or weight is None:
+                continue
+            grams[idx] += weight
+            resolved += 1
+        return grams, (resolved / counted if counted else 0.0)
+
+    @staticmethod
+    def estimate_many(ingredient_lists: List[List[str]]):
+        # 레시피 x 재료(g) 행렬과 100g당 영양표의 곱으로 한 번에 계산. (영양 행렬, 레시피별 인식 비율)
+        if not ingredient_lists:
+            return np.zeros((0, len(NUTRIENT_KEYS))), np.zeros(0)
+        vectors = [NutritionEstimator.grams_vector(ingredients) for ingredients in ingredient_lists]
+        grams = np.vstack([vector for vector, _ in vectors])
+        coverage = np.array([ratio for _, ratio in vectors])
+        return grams @ NutritionEstimator.table / 100.0, coverage
+
+    @staticmethod
+    def to_dict(values) -> Dict:
+        return {
+            k: int(round(v)) if k == "calories" else round(float(v), 1) for k, v in zip(NUTRIENT_KEYS, values)
+        }
+
+    @staticmethod
+    def estimate(ingredients: List[str]):
+        values, coverage = NutritionEstimator.estimate_many([ingredients])
+        return NutritionEstimator.to_dict(values[0]), float(coverage[0])
+
+    @staticmethod
+    def verify(recipe: Dict) -> Dict:
+        # 재료 대부분을 표에서 찾았고 모델의 칼로리가 크게 어긋나면 계산값으로 교체
+        estimated, coverage = NutritionEstimator.estimate(recipe.get('ingredients', []))
+        if coverage < NUTRITION_MIN_COVERAGE or estimated['calories'] <= 0:
+            return recipe
+        reported = float(recipe.get('nutrition', {}).get('calories', 0) or 0)
+        if abs(reported - estimated['calories']) <= estimated['calories'] * NUTRITION_OVERRIDE_RATIO:
+            return recipe
+        verified = dict(recipe)
+        verified['nutrition'] = estimated
+        verified['nutrition_source'] = "local"
+        return verified
+
+# -------------------------------------------------------------------------
+# 영수증 이미지 전처리
+# -------------------------------------------------------------------------
+RECEIPT_MAX_CONCURRENCY = 4
+RECEIPT_PREPROCESS_WORKERS = 4
+# 영수증 이미지 전처리 기본값
+RECEIPT_MAX_EDGE = 1600
+RECEIPT_IMAGE_FORMAT = "JPEG"
+RECEIPT_IMAGE_QUALITY = 80
+RECEIPT_IMAGE_DETAIL = "auto"
+IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+def _crop_to_receipt(gray: Image.Image) -> Image.Image:
+    # 배경보다 밝은 종이 영역을 축소본에서 찾아 원본 좌표로 잘라냄
+    probe = gray.copy()
+    probe.thumbnail((256, 256))
+    probe = probe.filter(ImageFilter.MedianFilter(5))
+    threshold = ImageStat.Stat(probe).mean[0]
+    bbox = probe.point(lambda p: 255 if p > threshold else 0).getbbox()
+    if not bbox:
+        return gray
+
+    scale_x = gray.width / probe.width
+    scale_y = gray.height / probe.height
+    left, top, right, bottom = bbox
+    margin = 4
+    box = (
+        max(0, int((left - margin) * scale_x)),
+        max(0, int((top - margin) * scale_y)),
+        min(gray.width, int((right + margin) * scale_x)),
+        min(gray.height, int((bottom + margin) * scale_y)),
+    )
+    # 너무 작게 잘리면 영수증을 잘못 찾은 것으로 보고 원본 유지
+    if (box[2] - box[0]) * (box[3] - box[1]) < 0.2 * gray.width * gray.height:
+        return gray
+    return gray.crop(box)
+
+def preprocess_receipt_image(image_bytes: bytes, max_edge: int = RECEIPT_MAX_EDGE, image_format: str = RECEIPT_IMAGE_FORMAT,
+                             quality: int = RECEIPT_IMAGE_QUALITY, crop: bool = True) -> Dict:
+    image = Image.open(BytesIO(image_bytes))
+    image = ImageOps.exif_transpose(image)
+
+    image.thumbnail((max_edge, max_edge))
+    gray = ImageOps.autocontrast(ImageOps.grayscale(image), cutoff=1)
+    if crop:
+        gray = _crop_to_receipt(gray)
+
+    buffered = BytesIO()
+    if image_format == "PNG":
+        gray.save(buffered, format="PNG", optimize=True)
+    else:
+        gray.save(buffered, format=image_format, quality=quality)
+    processed = buffered.getvalue()
+
+    return {
+        "data": base64.b64encode(processed).decode(),
+        "mime": IMAGE_MIME_TYPES[image_format],
+        "original_bytes": len(image_bytes),
+        "processed_bytes": len(processed),
+    }
+
+# -------------------------------------------------------------------------
+# GPT 호출 계측
+# -------------------------------------------------------------------------
+METRICS_BUFFER_SIZE = 2000
+# 모델별 100만 토큰당 가격(USD): (입력, 출력)
+MODEL_PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+class CallMetrics:
+    # 최근 GPT 호출 기록을 고정 크기 링 버퍼에 보관하고 호출 위치(메서드)별로 집계
+    def __init__(self, maxlen: int = METRICS_BUFFER_SIZE):
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate_cost(model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Optional[float]:
+        if model not in MODEL_PRICING or prompt_tokens is None:
+            return None
+        input_price, output_price = MODEL_PRICING[model]
+        return (prompt_tokens * input_price + (completion_tokens or 0) * output_price) / 1_000_000
+
+    @staticmethod
+    def percentile(values: List[float], pct: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def record(self, entry: Dict):
+        with self._lock:
+            self._records.append(entry)
+
+    def records(self) -> List[Dict]:
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def average_completion_tokens(self, method: str) -> Optional[float]:
+        # 같은 호출 위치의 지난 응답 길이로 출력 토큰을 어림 (기록이 없으면 None)
+        tokens = [r['completion_tokens'] for r in self.records()
+                  if r['method'] == method and not r['cached'] and r['completion_tokens']]
+        return sum(tokens) / len(tokens) if tokens else None
+
+    def summary(self) -> List[Dict]:
+        by_method = {}
+        for record in self.records():
+            by_method.setdefault(record['method'], []).append(record)
+
+        rows = []
+        for method, records in by_method.items():
+            live = [r for r in records if not r['cached']]
+            wall = [r['wall_ms'] for r in live]
+            ttft = [r['ttft_ms'] for r in live if r['ttft_ms'] is not None]
+            costs = [r['cost_usd'] for r in live if r['cost_usd'] is not None]
+            rows.append({
+                "method": method,
+                "calls": len(records),
+                "cache_hits": len(records) - len(live),
+                "p50_ms": self.percentile(wall, 50),
+                "p95_ms": self.percentile(wall, 95),
+                "p50_ttft_ms": self.percentile(ttft, 50),
+                "prompt_tokens": sum(r['prompt_tokens'] or 0 for r in live),
+                "completion_tokens": sum(r['completion_tokens'] or 0 for r in live),
+                "cost_usd": sum(costs),
+                "json_errors": sum(1 for r in records if r['json_error']),
+                "errors": sum(1 for r in records if r['error'] and not r['json_error']),
+            })
+        return sorted(rows, key=lambda row: row['calls'], reverse=True)
+
+    def to_jsonl(self) -> str:
+        return "\n".join(json.dumps(record, ensure_ascii=False) for record in self.records())
+
+@st.cache_resource
+def get_call_metrics() -> CallMetrics:
+    return CallMetrics()
+
+# -------------------------------------------------------------------------
+# 프롬프트 압축
+# -------------------------------------------------------------------------
+# 프롬프트에 넣는 재고 목록의 토큰 예산. 초과하면 유통기한이 임박한 재료부터 남김
+INVENTORY_TOKEN_BUDGET = {
+    "recommend_recipes": 400,
+    "recommend_nutrient_rich_recipes": 400,
+}
+# 이미지 한 장의 대략적인 입력 토큰 (detail=low 는 고정 85)
+IMAGE_TOKEN_ESTIMATE = {"low": 85, "auto": 765, "high": 1105}
+
+class PromptBuilder:
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        # 영문/숫자는 약 4자당 1토큰, 한글 등 비ASCII 문자는 약 1자당 1토큰으로 어림
+        ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+        return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+    @staticmethod
+    def estimate_messages(messages: List[Dict]) -> int:
+        total = 0
+        for message in messages:
+            content = message['content']
+            if isinstance(content, str):
+                total += PromptBuilder.estimate_tokens(content)
+                continue
+            for part in content:
+                if part.get('type') == 'text':
+                    total += PromptBuilder.estimate_tokens(part['text'])
+                elif part.get('type') == 'image_url':
+                    total += IMAGE_TOKEN_ESTIMATE.get(part['image_url'].get('detail', 'auto'), IMAGE_TOKEN_ESTIMATE['auto'])
+        return total
+
+    @staticmethod
+    def _days_left(item: Dict, today: datetime) -> Optional[int]:
+        try:
+            return (datetime.fromisoformat(item['expiry_date']).date() - today.date()).days
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def format_item(item: Dict, with_expiry: bool = False, today: Optional[datetime] = None) -> str:
+        quantity = item['quantity']
+        quantity_str = f"{quantity:g}" if isinstance(quantity, (int, float)) else str(quantity)
+        line = f"{item['name']} {quantity_str}{item['unit']}"
+        if with_expiry:
+            days_left = PromptBuilder._days_left(item, today or datetime.now())
+            if days_left is not None:
+                line += f"(D-{days_left})" if days_left >= 0 else "(기한지남)"
+        return line
+
+    @staticmethod
+    def compact_inventory(inventory: List[Dict], budget: Optional[int] = None, with_expiry: bool = False) -> str:
+        # 프롬프트에 필요한 이름/수량/단위만 "양파 3개, 우유 1L" 형태로 직렬화
+        today = datetime.now()
+        items = inventory
+        if budget is not None:
+            def expiry_rank(item):
+                # 임박한 재료 먼저, 기한이 지난 재료와 기한 정보가 없는 재료는 뒤로
+                days_left = PromptBuilder._days_left(item, today)
+                if days_left is None:
+                    return (2, 0)
+                return (1, -days_left) if days_left < 0 else (0, days_left)
+            items = sorted(inventory, key=expiry_rank)
+
+        lines, used = [], 0
+        for item in items:
+            line = PromptBuilder.format_item(item, with_expiry, today)
+            cost = PromptBuilder.estimate_tokens(line) + 1
+            if budget is not None and used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+
+        text = ", ".join(lines) if lines else "없음"
+        omitted = len(inventory) - len(lines)
+        if omitted > 0:
+            text += f" (외 {omitted}개 품목 생략)"
+        return text
+
+    @staticmethod
+    def compact_names(inventory: List[Dict], budget: Optional[int] = None) -> str:
+        # 수량 없이 재료 이름만 "양파, 감자, 당근" 형태로 직렬화
+        names, used = [], 0
+        for item in inventory:
+            cost = PromptBuilder.estimate_tokens(item['name']) + 1
+            if budget is not None and used + cost > budget:
+                break
+            names.append(item['name'])
+            used += cost
+
+        text = ", ".join(names) if names else "없음"
+        omitted = len(inventory) - len(names)
+        if omitted > 0:
+            text += f" (외 {omitted}개 품목 생략)"
+        return text
+
+# -------------------------------------------------------------------------
+# 응답 스키마 (Structured Outputs)
+# -------------------------------------------------------------------------
+REPAIR_MODEL = "gpt-4o-mini"
+
+class SchemaError(ValueError):
+    pass
+
+def _object_schema(properties: Dict) -> Dict:
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+def _array_schema(items: Dict) -> Dict:
+    return {"type": "array", "items": items}
+
+NUMBER_SCHEMA = {"type": "number"}
+STRING_SCHEMA = {"type": "string"}
+UNIT_SCHEMA = {"type": "string", "enum": list(UNIT_TABLE)}
+NUTRITION_SCHEMA = _object_schema({"calories": NUMBER_SCHEMA, "protein": NUMBER_SCHEMA, "carbs": NUMBER_SCHEMA, "fat": NUMBER_SCHEMA})
+INVENTORY_ITEM_SCHEMA = _object_schema({"name": STRING_SCHEMA, "quantity": NUMBER_SCHEMA, "unit": UNIT_SCHEMA})
+RECEIPT_ITEM_SCHEMA = _object_schema({"name": STRING_SCHEMA, "quantity": NUMBER_SCHEMA, "unit": UNIT_SCHEMA, "price": NUMBER_SCHEMA})
+RECIPE_SCHEMA = _object_schema({
+    "name": STRING_SCHEMA,
+    "nutrition": NUTRITION_SCHEMA,
+    "ingredients": _array_schema(STRING_SCHEMA),
+    "steps": _array_schema(STRING_SCHEMA),
+    "youtube_query": STRING_SCHEMA,
+})
+NUTRIENT_RECIPE_SCHEMA = _object_schema({
+    "name": STRING_SCHEMA,
+    "reason": STRING_SCHEMA,
+    "ingredients": _array_schema(STRING_SCHEMA),
+    "missing_ingredients": _array_schema(STRING_SCHEMA),
+    "steps": _array_schema(STRING_SCHEMA),
+    "nutrition": NUTRITION_SCHEMA,
+    "youtube_query": STRING_SCHEMA,
+})
+# 메서드 -> (최상위 객체에서 꺼낼 키, 스키마). Structured Outputs는 최상위가 객체여야 하므로 배열은 한 번 감쌈
+RESPONSE_SCHEMAS = {
+    "parse_inventory_from_text": ("items", _object_schema({"items": _array_schema(INVENTORY_ITEM_SCHEMA)})),
+    "parse_inventory_from_image": ("items", _object_schema({"items": _array_schema(RECEIPT_ITEM_SCHEMA)})),
+    "update_inventory_after_cooking": ("items", _object_schema({"items": _array_schema(INVENTORY_ITEM_SCHEMA)})),
+    "recommend_recipes": ("recipes", _object_schema({"recipes": _array_schema(RECIPE_SCHEMA)})),
+    "recommend_nutrient_rich_recipes": ("recipes", _object_schema({"recipes": _array_schema(NUTRIENT_RECIPE_SCHEMA)})),
+    "explain_nutrition_target": (None, _object_schema({"explanation": STRING_SCHEMA})),
+    "check_recipe_sufficiency": (None, _object_schema({"sufficient": {"type": "boolean"}, "missing_items": _array_schema(STRING_SCHEMA)})),
+}
+
+class ResponseValidator:
+    @staticmethod
+    def response_format(method: str) -> Optional[Dict]:
+        if method not in RESPONSE_SCHEMAS:
+            return None
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": method, "schema": RESPONSE_SCHEMAS[method][1], "strict": True}
+        }
+
+    @staticmethod
+    def item_schema(method: str) -> Optional[Dict]:
+        # 배열 응답의 원소 스키마 (스트리밍에서 객체 단위 검증용)
+        wrapper, schema = RESPONSE_SCHEMAS.get(method, (None, None))
+        return schema['properties'][wrapper]['items'] if wrapper else None
+
+    @staticmethod
+    def _to_number(value) -> float:
+        if isinstance(value, bool):
+            raise SchemaError(f"숫자가 아닙니다: {value!r}")
+        if isinstance(value, (int, float)):
+            return value
+        match = re.search(r"-?\d{1,3}(?:,\d{3})+(?:\.\d+)?|-?\d+(?:\.\d+)?", str(value))
+        if not match:
+            raise SchemaError(f"숫자가 아닙니다: {value!r}")
+        number = float(match.group().replace(",", ""))
+        return int(number) if number.is_integer() else number
+
+    @staticmethod
+    def coerce(schema: Dict, value):
+        kind = schema.get("type")
+        if kind == "object":
+            if not isinstance(value, dict):
+                raise SchemaError(f"객체가 아닙니다: {value!r}")
+            result = {}
+            for key, sub_schema in schema['properties'].items():
+                if key in value and value[key] is not None:
+                    result[key] = ResponseValidator.coerce(sub_schema, value[key])
+                else:
+                    result[key] = ResponseValidator.default(sub_schema)
+            return result
+        if kind == "array":
+            if isinstance(value, (str, dict)):
+                value = [value]
+            if not isinstance(value, list):
+                raise SchemaError(f"배열이 아닙니다: {value!r}")
+            return [ResponseValidator.coerce(schema['items'], v) for v in value]
+        if kind == "number":
+            return ResponseValidator._to_number(value)
+        if kind == "boolean":
+            if isinstance(value, str):
+                return value.strip().lower() in ("true", "yes", "1", "충분", "예")
+            return bool(value)
+        if kind == "string":
+            value = str(value).strip()
+            if "enum" in schema and value not in schema['enum']:
+                normalized = InventoryEngine.normalize_unit(value)
+                if normalized not in schema['enum']:
+                    raise SchemaError(f"허용되지 않는 값입니다: {value!r}")
+                value = normalized
+            return value
+        return value
+
+    @staticmethod
+    def default(schema: Dict):
+        kind = schema.get("type")
+        if kind == "object":
+            raise SchemaError("필수 객체가 없습니다")
+        return {"array": [], "number": 0, "boolean": False, "string": ""}.get(kind)
+
+    @staticmethod
+    def validate(method: str, data):
+        # 스키마에 맞게 형 변환 후, 감싼 배열은 다시 꺼내서 기존 반환 형태로 맞춤
+        if method not in RESPONSE_SCHEMAS:
+            return data
+        wrapper, schema = RESPONSE_SCHEMAS[method]
+        if wrapper and isinstance(data, list):
+            data = {wrapper: data}
+        data = ResponseValidator.coerce(schema, data)
+        return data[wrapper] if wrapper else data
+
+    @staticmethod
+    def repair_messages(method: str, content: str) -> List[Dict]:
+        schema = json.dumps(RESPONSE_SCHEMAS[method][1], ensure_ascii=False)
+        prompt = f"""다음 텍스트를 JSON 스키마에 맞는 올바른 JSON으로 고쳐주세요. 내용은 바꾸지 말고 형식만 수정하세요.
+
+스키마: {schema}
+
+텍스트:
+{content}"""
+        return [{"role": "user", "content": prompt}]
+
+# -------------------------------------------------------------------------
+# 로컬 레시피 카탈로그
+# -------------------------------------------------------------------------
+RECIPE_CATALOG_PATH = os.environ.get(
+    "TAISTE_RECIPES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipes.json")
+)
+RECIPE_RECOMMEND_COUNT = 3
+NUTRIENT_RECIPE_COUNT = 2
+# 최근 몇 끼의 식사와 겹치지 않게 할지
+RECENT_MEAL_WINDOW = 7
+# 점수 가중치: 부족 영양소 보충, 보유 재료 활용, 최근 식사와의 차별성, 유통기한 임박 재료 활용
+RECIPE_SCORE_WEIGHTS = {"coverage": 0.35, "overlap": 0.3, "novelty": 0.15, "urgency": 0.2}
+NUTRIENT_SCORE_WEIGHTS = {"coverage": 0.7, "overlap": 0.15, "novelty": 0.15}
+# 주재료(기본 양념 제외) 중 이 비율 이상을 보유한 레시피만 재고 기반 추천 후보로 인정
+RECIPE_MIN_OVERLAP = 0.5
+
+class RecipeCatalog:
+    def __init__(self, recipes: Optional[List[Dict]] = None):
+        self.recipes = list(recipes or [])
+        self.names = [InventoryEngine.normalize_name(recipe['name']) for recipe in self.recipes]
+        self.nutrition = np.array(
+            [[float(recipe['nutrition'].get(k, 0) or 0) for k in NUTRIENT_KEYS] for recipe in self.recipes],
+            dtype=float
+        ).reshape(len(self.recipes), len(NUTRIENT_KEYS))
+
+        # 레시피 x 재료 0/1 행렬. 점수 계산은 이 행렬에 대한 벡터 연산으로 처리
+        keys = [RecipeCatalog.ingredient_keys(recipe['ingredients']) for recipe in self.recipes]
+        self.vocabulary = sorted(set().union(*keys))
+        self.column = {key: idx for idx, key in enumerate(self.vocabulary)}
+        self.matrix = np.zeros((len(self.recipes), len(self.vocabulary)))
+        for row, recipe_keys in enumerate(keys):
+            self.matrix[row, [self.column[key] for key in recipe_keys]] = 1.0
+        self.sizes = np.maximum(self.matrix.sum(axis=1), 1.0)
+        # 레시피별 (재료 원문, 열). 카드에 부족한 재료를 원문 그대로 보여줄 때 사용
+        self.ingredient_columns = [
+            [(ingredient, self.column.get(RecipeCatalog.ingredient_key(ingredient))) for ingredient in recipe['ingredients']]
+            for recipe in self.recipes
+        ]
+        # 어휘 이름의 앞부분(2자 이상) -> 그 뒤에 부위/품종을 덧붙인 어휘의 열 ("돼지고기" -> "돼지고기앞다리살")
+        self.extensions = {}
+        for key, idx in self.column.items():
+            for end in range(2, len(key)):
+                if not key[end:].startswith(COMPOUND_SUFFIXES):
+                    self.extensions.setdefault(key[:end], []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    @staticmethod
+    def load(path: str) -> "RecipeCatalog":
+        if not path or not os.path.exists(path):
+            return RecipeCatalog()
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        schema = ResponseValidator.item_schema("recommend_recipes")
+        recipes = []
+        for entry in data:
+            try:
+                # 영양 정보가 없거나 재료와 맞지 않는 항목은 재료 기준 계산값으로 채움
+                recipes.append(NutritionEstimator.verify(ResponseValidator.coerce(schema, entry)))
+            except SchemaError:
+                continue
+        return RecipeCatalog(recipes)
+
+    @staticmethod
+    def ingredient_key(ingredient: str) -> str:
+        # 재고와 비교할 재료 이름 (손질 방법 제외). 기본 양념이거나 이름을 못 찾으면 ""
+        name = InventoryEngine.ingredient_name(ingredient, InventoryEngine.parse_ingredient(ingredient))
+        key = InventoryEngine.normalize_name(InventoryEngine.base_name(name)) if name else ""
+        return "" if key in PANTRY_STAPLES else key
+
+    @staticmethod
+    def ingredient_keys(ingredients: List[str]) -> set:
+        return {key for key in map(RecipeCatalog.ingredient_key, ingredients) if key}
+
+    def _inventory_vector(self, inventory: List[Dict]) -> np.ndarray:
+        # 재고 이름마다 같은 이름, 그 앞부분, 그 이름으로 시작하는 어휘만 찾아 표시 (find_item_index와 같은 기준)
+        vector = np.zeros(len(self.vocabulary))
+        for item in inventory:
+            key = InventoryEngine.normalize_name(item['name'])
+            columns = list(self.extensions.get(key, ()))
+            if key in self.column:
+                columns.append(self.column[key])
+            for end in range(2, len(key)):
+                if key[:end] in self.column and not key[end:].startswith(COMPOUND_SUFFIXES):
+                    columns.append(self.column[key[:end]])
+            vector[columns] = 1.0
+        return vector
+
+    def _recent_matrix(self, meal_history: List[Dict]):
+        # 최근 식사를 카탈로그 재료 공간으로 옮긴 행렬과 이름 목록
+        recent = meal_history[-RECENT_MEAL_WINDOW:] if meal_history else []
+        names = {InventoryEngine.normalize_name(meal['recipe_name']) for meal in recent}
+        rows = [self.matrix[idx] for idx, name in enumerate(self.names) if name in names]
+        if not rows:
+            return names, np.zeros((0, len(self.vocabulary)))
+        return names, np.vstack(rows)
+
+    def score(self, inventory: List[Dict], deficiency: Dict, meal_history: List[Dict], weights: Dict = RECIPE_SCORE_WEIGHTS,
+              owned: Optional[np.ndarray] = None):
+        # 레시피별 (종합 점수, 영양 보충률, 재료 보유율, 최근 식사 여부) 배열. owned는 미리 계산한 재고 벡터
+        if owned is None:
+            owned = self._inventory_vector(inventory)
+        overlap = self.matrix @ owned / self.sizes
+
+        gap = np.array([max(float(deficiency.get(k, 0) or 0), 0.0) for k in NUTRIENT_KEYS])
+        needed = gap > 0
+        if needed.any():
+            coverage = (np.minimum(self.nutrition[:, needed], gap[needed]) / gap[needed]).mean(axis=1)
+        else:
+            coverage = np.zeros(len(self.recipes))
+
+        recent_names, recent = self._recent_matrix(meal_history)
+        if len(recent):
+            shared = self.matrix @ recent.T
+            union = self.sizes[:, None] + recent.sum(axis=1)[None, :] - shared
+            novelty = 1.0 - (shared / np.maximum(union, 1.0)).max(axis=1)
+        else:
+            novelty = np.ones(len(self.recipes))
+        eaten = np.array([name in recent_names for name in self.names], dtype=bool)
+
+        total = weights['coverage'] * coverage + weights['overlap'] * overlap + weights['novelty'] * novelty
+        if weights.get('urgency'):
+            # 임박 재료 중 레시피가 사용하는 비율
+            urgent = self._inventory_vector(InventoryEngine.urgent_items(inventory))
+            total = total + weights['urgency'] * (self.matrix @ urgent) / max(urgent.sum(), 1.0)
+        return total, coverage, overlap, eaten
+
+    def rank(self, inventory: List[Dict], deficiency: Dict, meal_history: List[Dict], k: int = RECIPE_RECOMMEND_COUNT,
+             weights: Dict = RECIPE_SCORE_WEIGHTS, min_overlap: float = RECIPE_MIN_OVERLAP) -> List[Dict]:
+        if not self.recipes or k <= 0:
+            return []
+        owned = self._inventory_vector(inventory)
+        total, coverage, overlap, eaten = self.score(inventory, deficiency, meal_history, weights, owned)
+        candidates = np.flatnonzero((overlap >= min_overlap) & ~eaten)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-total[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-total[candidates], kind="stable")]
+        ranked = []
+        for idx in order:
+            recipe = json.loads(json.dumps(self.recipes[idx]))
+            # 재료 보유율 계산에 쓴 행렬에서 재고에 없는 재료를 그대로 꺼내 카드에 표시
+            recipe['missing_ingredients'] = [
+                ingredient for ingredient, column in self.ingredient_columns[idx] if column is not None and not owned[column]
+            ]
+            ranked.append(recipe)
+        return ranked
+
+    @staticmethod
+    def annotate_for_deficiency(recipe: Dict, deficiency: Dict, inventory: List[Dict]) -> Dict:
+        # 카탈로그 레시피에 영양 추천 카드용 reason / missing_ingredients를 채움
+        name_map = {"calories": "칼로리", "protein": "단백질", "carbs": "탄수화물", "fat": "지방"}
+        ratios = sorted(
+            ((min(1.0, float(recipe['nutrition'].get(k, 0) or 0) / v), k) for k, v in deficiency.items() if v > 0),
+            reverse=True
+        )
+        filled = [f"{name_map.get(k, k)} {ratio * 100:.0f}%" for ratio, k in ratios[:2] if ratio > 0]
+        result, _ = InventoryEngine.check_sufficiency(inventory, recipe['ingredients'])
+        annotated = dict(recipe)
+        annotated['reason'] = f"한 끼로 부족분의 {', '.join(filled)}를 채울 수 있습니다." if filled else "영양 균형을 위한 메뉴입니다."
+        annotated['missing_ingredients'] = result['missing_items']
+        return annotated
+
+@st.cache_resource
+def get_recipe_catalog() -> RecipeCatalog:
+    return RecipeCatalog.load(RECIPE_CATALOG_PATH)
+
+# -------------------------------------------------------------------------
+# OpenAI 클라이언트 풀
+# -------------------------------------------------------------------------
+OPENAI_TIMEOUT = float(os.environ.get("TAISTE_OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("TAISTE_OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_RETRIES = int(os.environ.get("TAISTE_OPENAI_MAX_RETRIES", "2"))
+# API 키 검증 결과 유지 시간(초)
+KEY_VALIDATION_TTL = 10 * 60
+
+class ClientRegistry:
+    # 프로세스 전역에서 API 키(해시)별로 OpenAI 클라이언트를 공유하여 연결을 재사용
+    def __init__(self):
+        self._clients = {}
+        self._validations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_hash(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    def get(self, api_key: str) -> OpenAI:
+        key = self.key_hash(api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                # 클라이언트 내부의 HTTP 연결 풀(keep-alive)을 재실행/세션 간에 재사용
+                client = OpenAI(
+                    api_key=api_key,
+                    timeout=Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                    max_retries=OPENAI_MAX_RETRIES
+                )
+                self._clients[key] = client
+            return client
+
+    def validate(self, api_key: str):
+        # (유효 여부, 오류 메시지). 유료 completion 대신 models 목록 조회로 확인하고 결과를 캐시
+        key = self.key_hash(api_key)
+        now = time.time()
+        with self._lock:
+            cached = self._validations.get(key)
+            if cached and cached[0] > now:
+                return cached[1], cached[2]
+
+        try:
+            self.get(api_key).models.list()
+            result = (True, "")
+        except (AuthenticationError, PermissionDeniedError) as e:
+            # 키 자체가 거부된 경우만 캐시. 공유 클라이언트는 다른 세션이 쓰고 있을 수 있으므로 닫지 않고 목록에서만 뺌
+            result = (False, str(e))
+            with self._lock:
+                self._clients.pop(key, None)
+        except Exception as e:
+            # 시간 초과/연결 오류 등 일시적인 실패는 캐시하지 않고 다음 입력 때 다시 확인
+            return False, str(e)
+
+        with self._lock:
+            self._validations[key] = (now + KEY_VALIDATION_TTL, result[0], result[1])
+        return result
+
+@st.cache_resource
+def get_client_registry() -> ClientRegistry:
+    return ClientRegistry()
+
+class GPTClient:
+    def __init__(self, api_key: str, cache: Optional[ResponseCache] = None, client: Optional[OpenAI] = None,
+                 metrics: Optional["CallMetrics"] = None):
+        self.api_key = api_key
+        self.client = client or OpenAI(api_key=api_key)
+        self.cache = cache
+        self.metrics = metrics
+        # 마지막으로 보낸(또는 캐시로 응답한) 요청의 예상 입력 토큰과, 형식 수정 호출까지 합친 실제 사용량
+        self.last_estimate = None
+        self.last_usage = None
+
+    def _lookup_cache(self, method: str, messages: List[Dict], temperature: float, model: str):
+        # (캐시 키, TTL, 캐시된 결과) 반환. 캐시를 쓰지 않으면 키는 None
+        self.last_estimate = {"method": method, "tokens": PromptBuilder.estimate_messages(messages)}
+        self.last_usage = {"prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "cached": False}
+        ttl = CACHE_TTL.get(method, 0)
+        if self.cache is None or ttl <= 0:
+            return None, ttl, None
+        key = ResponseCache.make_key(model, temperature, messages, method=method)
+        cached = self.cache.get(key)
+        return key, ttl, json.loads(cached) if cached is not None else None
+
+    def _store_cache(self, key: Optional[str], ttl: float, result: Any):
+        if key is not None:
+            self.cache.set(key, json.dumps(result, ensure_ascii=False), ttl)
+
+    @staticmethod
+    def _parse_json_content(content: str) -> Any:
+        content = content.strip()
+        content = content.replace("```json", "").replace("```", "").strip()
+        try:
+            return json.loads(content)
+        except ValueError:
+            # 앞뒤 설명문과 끝의 쉼표를 제거한 뒤 한 번 더 시도
+            starts = [i for i in (content.find("["), content.find("{")) if i >= 0]
+            end = max(content.rfind("]"), content.rfind("}"))
+            if not starts or end < min(starts):
+                raise
+            candidate = re.sub(r",\s*([\]}])", r"\1", content[min(starts):end + 1])
+            return json.loads(candidate)
+
+    def _decode(self, method: str, content: str) -> Any:
+        # 파싱/검증에 실패하면 저렴한 모델로 형식만 한 번 고쳐서 재시도
+        try:
+            return ResponseValidator.validate(method, self._parse_json_content(content))
+        except ValueError:
+            if method not in RESPONSE_SCHEMAS:
+                raise
+        repaired = self._request_repair(method, content)
+        return ResponseValidator.validate(method, self._parse_json_content(repaired))
+
+    def _request_repair(self, method: str, content: str) -> str:
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=REPAIR_MODEL,
+                messages=ResponseValidator.repair_messages(method, content),
+                temperature=0,
+                response_format=ResponseValidator.response_format(method)
+            )
+        except Exception as e:
+            self._record_call(f"{method}:repair", REPAIR_MODEL, started, error=e)
+            raise
+        self._record_call(f"{method}:repair", REPAIR_MODEL, started, usage=getattr(response, 'usage', None))
+        return response.choices[0].message.content
+
+    async def _decode_async(self, async_client, method: str, content: str) -> Any:
+        try:
+            return ResponseValidator.validate(method, self._parse_json_content(content))
+        except ValueError:
+            if method not in RESPONSE_SCHEMAS:
+                raise
+        started = time.perf_counter()
+        try:
+            response = await async_client.chat.completions.create(
+                model=REPAIR_MODEL,
+                messages=ResponseValidator.repair_messages(method, content),
+                temperature=0,
+                response_format=ResponseValidator.response_format(method)
+            )
+        except Exception as e:
+            self._record_call(f"{method}:repair", REPAIR_MODEL, started, error=e)
+            raise
+        self._record_call(f"{method}:repair", REPAIR_MODEL, started, usage=getattr(response, 'usage', None))
+        return ResponseValidator.validate(method, self._parse_json_content(response.choices[0].message.content))
+
+    def _record_call(self, method: str, model: str, started: float, cached: bool = False, ttft: Optional[float] = None,
+                     usage=None, json_error: bool = False, error: Optional[Exception] = None):
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) if usage is not None else None
+        completion_tokens = getattr(usage, 'completion_tokens', None) if usage is not None else None
+        cost = CallMetrics.estimate_cost(model, prompt_tokens, completion_tokens)
+        if self.last_usage is not None:
+            self.last_usage['cached'] = self.last_usage['cached'] or cached
+            self.last_usage['prompt_tokens'] += prompt_tokens or 0
+            self.last_usage['completion_tokens'] += completion_tokens or 0
+            self.last_usage['cost_usd'] += cost or 0.0
+        if self.metrics is None:
+            return
+        self.metrics.record({
+            "timestamp": datetime.now().isoformat(),
+            "method": method,
+            "model": model,
+            "cached": cached,
+            "wall_ms": (time.perf_counter() - started) * 1000,
+            "ttft_ms": (ttft - started) * 1000 if ttft is not None else None,
+            "estimated_prompt_tokens": self.last_estimate['tokens'] if self.last_estimate else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": cost,
+            "json_error": json_error,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+        })
+
+    def _request_json(self, method: str, messages: List[Dict], temperature: float, model: str = "gpt-4o") -> Any:
+        started = time.perf_counter()
+        key, ttl, cached = self._lookup_cache(method, messages, temperature, model)
+        if cached is not None:
+            self._record_call(method, model, started, cached=True)
+            return cached
+
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                response_format=ResponseValidator.response_format(method) or NOT_GIVEN
+            )
+        except Exception as e:
+            self._record_call(method, model, started, error=e)
+            raise
+
+        usage = getattr(response, 'usage', None)
+        try:
+            result = self._decode(method, response.choices[0].message.content)
+        except ValueError as e:
+            self._record_call(method, model, started, usage=usage, json_error=True, error=e)
+            raise
+        self._record_call(method, model, started, usage=usage)
+        self._store_cache(key, ttl, result)
+        return result
+
+    async def _request_json_async(self, async_client, method: str, messages: List[Dict], temperature: float, model: str = "gpt-4o") -> Any:
+        started = time.perf_counter()
+        key, ttl, cached = self._lookup_cache(method, messages, temperature, model)
+        if cached is not None:
+            self._record_call(method, model, started, cached=True)
+            return cached
+
+        try:
+            response = await async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                response_format=ResponseValidator.response_format(method) or NOT_GIVEN
+            )
+        except Exception as e:
+            self._record_call(method, model, started, error=e)
+            raise
+
+        usage = getattr(response, 'usage', None)
+        try:
+            result = await self._decode_async(async_client, method, response.choices[0].message.content)
+        except ValueError as e:
+            self._record_call(method, model, started, usage=usage, json_error=True, error=e)
+            raise
+        self._record_call(method, model, started, usage=usage)
+        self._store_cache(key, ttl, result)
+        return result
+
+    def _stream_json_array(self, method: str, messages: List[Dict], temperature: float, model: str = "gpt-4o"):
+        # JSON 배열 응답을 스트리밍으로 받아, 객체가 완성될 때마다 하나씩 yield
+        started = time.perf_counter()
+        key, ttl, cached = self._lookup_cache(method, messages, temperature, model)
+        if cached is not None:
+            self._record_call(method, model, started, cached=True)
+            yield from cached
+            return
+
+        parser = JSONArrayStreamParser()
+        item_schema = ResponseValidator.item_schema(method)
+        items = []
+        failed = []
+        ttft = None
+        usage = None
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                response_format=ResponseValidator.response_format(method) or NOT_GIVEN,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if getattr(chunk, 'usage', None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter()
+                for item in parser.feed(delta):
+                    if item_schema is not None:
+                        try:
+                            item = ResponseValidator.coerce(item_schema, item)
+                        except SchemaError:
+                            failed.append(json.dumps(item, ensure_ascii=False))
+                            continue
+                    items.append(item)
+                    yield item
+        except Exception as e:
+            self._record_call(method, model, started, ttft=ttft, usage=usage, error=e)
+            raise
+
+        failed += parser.invalid
+        self._record_call(method, model, started, ttft=ttft, usage=usage, json_error=not parser.closed or bool(failed))
+        if failed:
+            # 검증에 실패한 객체만 모아 비스트리밍 경로와 같은 방식으로 한 번 고친 뒤 이어서 내보냄
+            repaired = self._request_repair(method, "[" + ",\n".join(failed) + "]")
+            for item in ResponseValidator.validate(method, self._parse_json_content(repaired)):
+                items.append(item)
+                yield item
+        if parser.closed:
+            self._store_cache(key, ttl, items)
 
-class GPTClient:
-    def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
-    
     def parse_inventory_from_text(self, text: str) -> List[Dict]:
+        items, unparsed = InventoryEngine.parse_inventory_text(text)
+        if unparsed:
+            # 로컬에서 해석하지 못한 조각만 모아 한 번에 GPT로 파싱
+            items += self._parse_inventory_text_with_gpt("\n".join(unparsed))
+        return items
+
+    def _parse_inventory_text_with_gpt(self, text: str) -> List[Dict]:
         prompt = f"""다음 텍스트에서 식재료 정보를 추출해주세요.
         
 텍스트: {text}
@@ -60,17 +2336,13 @@ class GPTClient:
 
 단위는 "개", "g", "kg", "ml", "L" 중 하나를 사용하세요."""
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
+        return self._request_json(
+            "parse_inventory_from_text",
+            [{"role": "user", "content": prompt}],
             temperature=0.3
         )
-        
-        content = response.choices[0].message.content.strip()
-        content = content.replace("```json", "").replace("```", "").strip()
-        return json.loads(content)
     
-    def parse_inventory_from_image(self, image_data: str) -> List[Dict]:
+    def _image_messages(self, image_data: str, mime: str = "image/png", detail: str = RECEIPT_IMAGE_DETAIL) -> List[Dict]:
         prompt = """이 영수증 이미지에서 식재료와 수량 정보를 추출해주세요.
 
 **중요한 이름 규칙**: 
@@ -88,29 +2360,38 @@ class GPTClient:
 
 단위는 "개", "g", "kg", "ml", "L" 중 하나를 사용하세요."""
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{image_data}"
-                        }
+        return [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{mime};base64,{image_data}",
+                        "detail": detail
                     }
-                ]
-            }],
+                }
+            ]
+        }]
+
+    def parse_inventory_from_image(self, image_data: str, mime: str = "image/png", detail: str = RECEIPT_IMAGE_DETAIL) -> List[Dict]:
+        return self._request_json(
+            "parse_inventory_from_image",
+            self._image_messages(image_data, mime, detail),
+            temperature=0.3
+        )
+
+    async def parse_inventory_from_image_async(self, async_client, image_data: str, mime: str = "image/png",
+                                               detail: str = RECEIPT_IMAGE_DETAIL) -> List[Dict]:
+        return await self._request_json_async(
+            async_client,
+            "parse_inventory_from_image",
+            self._image_messages(image_data, mime, detail),
             temperature=0.3
         )
-        
-        content = response.choices[0].message.content.strip()
-        content = content.replace("```json", "").replace("```", "").strip()
-        return json.loads(content)
     
-    def calculate_nutrition_target(self, profile: Dict) -> Dict:
-        prompt = f"""다음 사용자 정보를 바탕으로 일일 권장 영양 섭취량을 계산해주세요.
+    def explain_nutrition_target(self, profile: Dict, target: Dict) -> str:
+        prompt = f"""다음 사용자의 일일 권장 영양 섭취량이 어떻게 계산되었는지 2~3문장으로 쉽게 설명해주세요.
 
 사용자 정보:
 - 나이: {profile['age']}세
@@ -119,36 +2400,44 @@ class GPTClient:
 - 몸무게: {profile['weight']}kg
 - 활동량: {profile['activity_level']}
 
+계산 결과 (Mifflin-St Jeor 기초대사량 x 활동 계수, 단백질 15% / 탄수화물 55% / 지방 30%):
+{json.dumps(target, ensure_ascii=False)}
+
 다음 JSON 형식으로만 응답해주세요 (다른 설명 없이):
-{{
-    "calories": 숫자,
-    "protein": 숫자,
-    "carbs": 숫자,
-    "fat": 숫자
-}}"""
+{{"explanation": "설명"}}"""
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
+        result = self._request_json(
+            "explain_nutrition_target",
+            [{"role": "user", "content": prompt}],
             temperature=0.3
         )
-        
-        content = response.choices[0].message.content.strip()
-        content = content.replace("```json", "").replace("```", "").strip()
-        return json.loads(content)
+        return result['explanation']
     
-    def recommend_recipes(self, inventory: List[Dict], nutrition_deficiency: Dict, meal_history: List[Dict]) -> List[Dict]:
-        inventory_str = ", ".join([f"{item['name']} {item['quantity']}{item['unit']}" for item in inventory])
+    def _recipe_messages(self, inventory: List[Dict], nutrition_deficiency: Dict, meal_history: List[Dict],
+                         count: int = RECIPE_RECOMMEND_COUNT, exclude: Optional[List[str]] = None,
+                         urgent: Optional[List[Dict]] = None) -> List[Dict]:
+        # 임박 재료 상위 k개만 수량/남은 일수와 함께 보내고, 나머지 재고는 이름만 보냄
+        if urgent is None:
+            urgent = InventoryEngine.urgent_items(inventory)
+        urgent_str = ", ".join(PromptBuilder.format_item(item, with_expiry=True) for item in urgent) or "없음"
+        urgent_keys = {InventoryEngine.normalize_name(item['name']) for item in urgent}
+        inventory_str = PromptBuilder.compact_names(
+            [item for item in inventory if InventoryEngine.normalize_name(item['name']) not in urgent_keys],
+            INVENTORY_TOKEN_BUDGET["recommend_recipes"]
+        )
         deficiency_str = ", ".join([f"{k}: {v:.1f}" for k, v in nutrition_deficiency.items() if v > 0])
         
         recent_meals = [meal['recipe_name'] for meal in meal_history[-7:]] if meal_history else []
         recent_meals_str = ", ".join(recent_meals) if recent_meals else "없음"
         
-        prompt = f"""다음 조건에 맞는 요리 레시피 3개를 추천해주세요.
+        exclude_str = f"\n이미 추천된 메뉴(제외): {', '.join(exclude)}" if exclude else ""
 
-보유 식재료: {inventory_str}
+        prompt = f"""다음 조건에 맞는 요리 레시피 {count}개를 추천해주세요.
+
+유통기한 임박 재료(우선 사용): {urgent_str}
+그 밖의 보유 식재료: {inventory_str}
 부족한 영양소: {deficiency_str}
-최근 7일 식사 기록: {recent_meals_str}
+최근 7일 식사 기록: {recent_meals_str}{exclude_str}
 
 다음 JSON 형식으로만 응답해주세요 (다른 설명 없이):
 [
@@ -163,27 +2452,125 @@ class GPTClient:
 ]
 
 **중요**: 
-- 레시피 재료의 단위는 가급적 '보유 식재료'의 단위와 맞춰주세요.
+- 레시피 재료의 단위는 가급적 '유통기한 임박 재료'의 단위와 맞춰주세요.
 - 고체 재료는 그램(g) 단위로 표시: "쌀 200g", "양파 150g", "달걀 50g" (1개 = 약 50g)
 - 액체 재료는 밀리리터(ml) 단위로 표시: "물 500ml", "우유 200ml", "간장 15ml"
+- 임박 재료의 (D-숫자)는 유통기한까지 남은 일수입니다. 남은 일수가 적은 재료부터 최대한 활용해주세요.
 
 보유한 식재료를 최대한 활용하고, 부족한 영양소를 보충할 수 있는 레시피를 추천해주세요.
 최근에 먹은 음식과 중복되지 않도록 해주세요."""
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
+        return [{"role": "user", "content": prompt}]
+
+    def recommend_recipes(self, inventory: List[Dict], nutrition_deficiency: Dict, meal_history: List[Dict],
+                          count: int = RECIPE_RECOMMEND_COUNT, exclude: Optional[List[str]] = None,
+                          urgent: Optional[List[Dict]] = None) -> List[Dict]:
+        recipes = self._request_json(
+            "recommend_recipes",
+            self._recipe_messages(inventory, nutrition_deficiency, meal_history, count, exclude, urgent),
             temperature=0.7
         )
-        
-        content = response.choices[0].message.content.strip()
-        content = content.replace("```json", "").replace("```", "").strip()
-        return json.loads(content)
+        return [NutritionEstimator.verify(recipe) for recipe in recipes]
+
+    def estimate_call(self, method: str, messages: List[Dict], model: str = "gpt-4o") -> Dict:
+        # 호출 전에 보여줄 예상치. 입력은 프롬프트로 어림하고, 출력은 지난 호출 기록이 있을 때만 반영
+        tokens = PromptBuilder.estimate_messages(messages)
+        completion = self.metrics.average_completion_tokens(method) if self.metrics else None
+        return {
+            "tokens": tokens,
+            "completion_tokens": completion,
+            "cost_usd": CallMetrics.estimate_cost(model, tokens, completion),
+        }
+
+    def estimate_recipes(self, inventory: List[Dict], nutrition_deficiency: Dict, meal_history: List[Dict],
+                         count: int = RECIPE_RECOMMEND_COUNT, urgent: Optional[List[Dict]] = None) -> Dict:
+        return self.estimate_call(
+            "recommend_recipes", self._recipe_messages(inventory, nutrition_deficiency, meal_history, count, urgent=urgent)
+        )
+
+    def stream_recipes(self, inventory: List[Dict], nutrition_deficiency: Dict, meal_history: List[Dict],
+                       count: int = RECIPE_RECOMMEND_COUNT, exclude: Optional[List[str]] = None,
+                       urgent: Optional[List[Dict]] = None):
+        for recipe in self._stream_json_array(
+            "recommend_recipes",
+            self._recipe_messages(inventory, nutrition_deficiency, meal_history, count, exclude, urgent),
+            temperature=0.7
+        ):
+            yield NutritionEstimator.verify(recipe)
+    
+    def check_recipe_sufficiency(self, inventory: List[Dict], ingredients: List[str], tolerance: float = SUFFICIENCY_TOLERANCE) -> Dict:
+        result, unresolved = InventoryEngine.check_sufficiency(inventory, ingredients, tolerance)
+        if not unresolved:
+            return result
+
+        targets = []
+        for ingredient in unresolved:
+            name = InventoryEngine.ingredient_name(ingredient, InventoryEngine.parse_ingredient(ingredient))
+            idx = InventoryEngine.find_item_index(inventory, name)
+            if idx is None:
+                # 재고 이름과 맞추지 못한 재료가 있으면 어떤 재고로 대신할 수 있는지 전체 재고로 판단
+                targets = inventory
+                break
+            if inventory[idx] not in targets:
+                targets.append(inventory[idx])
+
+        gpt_result = self._check_sufficiency_with_gpt(targets, unresolved)
+        missing_items = result['missing_items'] + list(gpt_result.get('missing_items', []))
+        return {
+            "sufficient": result['sufficient'] and bool(gpt_result.get('sufficient')),
+            "missing_items": missing_items
+        }
+
+    def _check_sufficiency_with_gpt(self, inventory: List[Dict], ingredients: List[str]) -> Dict:
+        prompt = f"""현재 재고로 이 레시피를 만들 수 있는지 엄격하게 확인하지 말고, 통상적인 식재료 무게를 고려하여 유연하게 판단해주세요.
+
+현재 재고: {PromptBuilder.compact_inventory(inventory)}
+레시피 재료: {json.dumps(ingredients, ensure_ascii=False)}
+
+**핵심 판단 기준 (단위 변환)**:
+1. 재고는 '개' 단위이고 레시피는 'g/ml' 단위일 경우, 아래 평균 무게를 기준으로 변환하여 판단하세요.
+    - 양파 1개 ≈ 200g, 감자 1개 ≈ 150g, 당근 1개 ≈ 150g, 달걀 1개 ≈ 50g, 대파 1대 ≈ 80g, 마늘 1쪽 ≈ 5g
+
+2. 예시: 
+    - 재고 '양파 1개' vs 레시피 '양파 150g' -> **충분함 (true)**
+    - 재고 '양파 1개' vs 레시피 '양파 300g' -> 부족함 (false)
+
+다음 JSON 형식으로만 응답해주세요:
+{{
+    "sufficient": true or false,
+    "missing_items": ["부족한 재료1 (필요: X, 보유: Y)", ...]
+}}"""
+
+        return self._request_json(
+            "check_recipe_sufficiency",
+            [{"role": "user", "content": prompt}],
+            temperature=0.3
+        )
     
     def update_inventory_after_cooking(self, inventory: List[Dict], used_ingredients: List[str]) -> List[Dict]:
+        updated_inventory, unresolved = InventoryEngine.deduct(inventory, used_ingredients)
+        if not unresolved:
+            return updated_inventory
+
+        # 로컬에서 환산할 수 없는 재료만 관련 재고와 함께 GPT로 계산.
+        # 재고 이름과 맞추지 못한 재료가 있으면 어느 재고에서 뺄지 전체 재고로 판단
+        target_indices = set()
+        for ingredient in unresolved:
+            name = InventoryEngine.ingredient_name(ingredient, InventoryEngine.parse_ingredient(ingredient))
+            idx = InventoryEngine.find_item_index(updated_inventory, name)
+            if idx is None:
+                target_indices = set(range(len(updated_inventory)))
+                break
+            target_indices.add(idx)
+
+        targets = [updated_inventory[idx] for idx in sorted(target_indices)]
+        rest = [item for idx, item in enumerate(updated_inventory) if idx not in target_indices]
+        return rest + self._update_inventory_with_gpt(targets, unresolved)
+
+    def _update_inventory_with_gpt(self, inventory: List[Dict], used_ingredients: List[str]) -> List[Dict]:
         prompt = f"""현재 재고에서 사용한 재료만큼 차감하여 남은 재고를 계산해주세요.
 
-현재 재고: {json.dumps(inventory, ensure_ascii=False)}
+현재 재고: {PromptBuilder.compact_inventory(inventory)}
 사용한 재료: {json.dumps(used_ingredients, ensure_ascii=False)}
 
 **계산 규칙**:
@@ -203,41 +2590,43 @@ class GPTClient:
 수량이 0 이하가 된 재료는 목록에서 제외해주세요.
 원래 단위(kg, L, 개)를 유지하되, 계산은 환산해서 해주세요."""
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
+        updated_items = self._request_json(
+            "update_inventory_after_cooking",
+            [{"role": "user", "content": prompt}],
             temperature=0.3
         )
         
-        content = response.choices[0].message.content.strip()
-        content = content.replace("```json", "").replace("```", "").strip()
-        updated_items = json.loads(content)
-        
         inventory_dict = {item['name']: item for item in inventory}
         
+        now = datetime.now()
         for item in updated_items:
             if item['name'] in inventory_dict:
-                item['added_date'] = inventory_dict[item['name']].get('added_date', datetime.now().isoformat())
-                item['expiry_date'] = inventory_dict[item['name']].get('expiry_date', (datetime.now() + timedelta(days=7)).isoformat())
+                item['added_date'] = inventory_dict[item['name']].get('added_date') or now.isoformat()
+                item['expiry_date'] = inventory_dict[item['name']].get('expiry_date') or InventoryEngine.default_expiry(item['name'], now)
             else:
-                item['added_date'] = datetime.now().isoformat()
-                item['expiry_date'] = (datetime.now() + timedelta(days=7)).isoformat()
+                item['added_date'] = now.isoformat()
+                item['expiry_date'] = InventoryEngine.default_expiry(item['name'], now)
         
         return updated_items
 
-    def recommend_nutrient_rich_recipes(self, deficiency: Dict, inventory: List[Dict]) -> List[Dict]:
+    def _nutrient_recipe_messages(self, deficiency: Dict, inventory: List[Dict], count: int = NUTRIENT_RECIPE_COUNT,
+                                  exclude: Optional[List[str]] = None) -> List[Dict]:
         deficiency_str = ", ".join([f"{k} {v:.1f} 부족" for k, v in deficiency.items()])
-        inventory_str = json.dumps(inventory, ensure_ascii=False)
+        inventory_str = PromptBuilder.compact_inventory(
+            inventory, INVENTORY_TOKEN_BUDGET["recommend_nutrient_rich_recipes"], with_expiry=True
+        )
         
-        prompt = f"""다음 부족한 영양소를 효과적으로 보충할 수 있는 요리 메뉴 2가지를 추천해주세요.
+        exclude_str = f"\n이미 추천된 메뉴(제외): {', '.join(exclude)}" if exclude else ""
+
+        prompt = f"""다음 부족한 영양소를 효과적으로 보충할 수 있는 요리 메뉴 {count}가지를 추천해주세요.
 
 부족한 상태: {deficiency_str}
-현재 보유 재고: {inventory_str}
+현재 보유 재고: {inventory_str}{exclude_str}
 
 조건:
 1. 부족한 영양소가 풍부한 식재료를 주재료로 사용해야 합니다.
 2. 각 메뉴가 왜 이 영양소 보충에 좋은지 'reason'에 한 문장으로 설명해주세요.
-3. 재료는 반드시 구체적인 수량(g, ml, 개)을 포함해주세요.
+3. 재료는 반드시 구체적인 수량(g, ml, 개)을 포함해주세요. (보유 재고의 D-숫자는 유통기한까지 남은 일수)
 4. **현재 보유 재고와 비교하여 부족한 재료가 있다면 'missing_ingredients' 리스트에 담아주세요.** (재고가 충분하면 빈 리스트)
 
 다음 JSON 형식으로만 응답해주세요 (다른 설명 없이):
@@ -254,15 +2643,563 @@ class GPTClient:
     ...
 ]"""
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
+        return [{"role": "user", "content": prompt}]
+
+    def estimate_nutrient_rich_recipes(self, deficiency: Dict, inventory: List[Dict], count: int = NUTRIENT_RECIPE_COUNT) -> Dict:
+        return self.estimate_call(
+            "recommend_nutrient_rich_recipes", self._nutrient_recipe_messages(deficiency, inventory, count)
         )
-        
-        content = response.choices[0].message.content.strip()
-        content = content.replace("```json", "").replace("```", "").strip()
-        return json.loads(content)
+
+    def stream_nutrient_rich_recipes(self, deficiency: Dict, inventory: List[Dict],
+                                     count: int = NUTRIENT_RECIPE_COUNT, exclude: Optional[List[str]] = None):
+        for recipe in self._stream_json_array(
+            "recommend_nutrient_rich_recipes",
+            self._nutrient_recipe_messages(deficiency, inventory, count, exclude),
+            temperature=0.7
+        ):
+            yield NutritionEstimator.verify(recipe)
+
+# -------------------------------------------------------------------------
+# 영수증 일괄 처리
+# -------------------------------------------------------------------------
+class ReceiptPipeline:
+    def __init__(self, gpt_client: GPTClient, max_concurrency: int = RECEIPT_MAX_CONCURRENCY, workers: int = RECEIPT_PREPROCESS_WORKERS,
+                 preprocess_options: Optional[Dict] = None, detail: str = RECEIPT_IMAGE_DETAIL):
+        self.gpt_client = gpt_client
+        self.max_concurrency = max(1, max_concurrency)
+        self.workers = max(1, workers)
+        self.preprocess_options = preprocess_options or {}
+        self.detail = detail
+        self.size_report = []
+
+    def _preprocess(self, image_bytes: bytes) -> Dict:
+        return preprocess_receipt_image(image_bytes, **self.preprocess_options)
+
+    def run(self, images: List[bytes]) -> List:
+        # 영수증별 파싱 결과(List[Dict]) 또는 예외를 입력 순서대로 반환
+        return asyncio.run(self._run(images))
+
+    async def _run(self, images: List[bytes]) -> List:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            async with AsyncOpenAI(api_key=self.gpt_client.api_key) as async_client:
+                async def process(image_bytes: bytes):
+                    # 이미지 변환은 스레드 풀에서, 비전 호출은 동시 실행 개수 제한 안에서 수행
+                    processed = await loop.run_in_executor(pool, self._preprocess, image_bytes)
+                    self.size_report.append((processed['original_bytes'], processed['processed_bytes']))
+                    async with semaphore:
+                        return await self.gpt_client.parse_inventory_from_image_async(
+                            async_client, processed['data'], mime=processed['mime'], detail=self.detail
+                        )
+
+                return await asyncio.gather(*(process(image) for image in images), return_exceptions=True)
+
+    @staticmethod
+    def merge_results(results: List, now: Optional[datetime] = None):
+        # 여러 영수증 결과를 한 번에 반영할 수 있도록 (재고 항목, 지출 내역, 오류) 로 합침
+        # now: 구매 시각 (지난 영수증을 일괄 입력할 때는 영수증 날짜 기준으로 유통기한 계산)
+        now = now or datetime.now()
+        new_items, new_expenses, errors = [], [], []
+        for idx, result in enumerate(results):
+            if isinstance(result, Exception):
+                errors.append((idx, result))
+                continue
+
+            total_expense = sum(item.get('price', 0) for item in result)
+            if total_expense > 0:
+                new_expenses.append({
+                    'date': now.isoformat(),
+                    'amount': total_expense,
+                    'items': ', '.join([item['name'] for item in result]),
+                    'line_items': [
+                        {'name': item['name'], 'quantity': item['quantity'], 'unit': item['unit'], 'price': item['price']}
+                        for item in result if item.get('price')
+                    ]
+                })
+
+            for item in result:
+                item['added_date'] = now.isoformat()
+                item['expiry_date'] = InventoryEngine.default_expiry(item['name'], now)
+                new_items.append(item)
+        return new_items, new_expenses, errors
+
+# -------------------------------------------------------------------------
+# 추천 미리 생성
+# -------------------------------------------------------------------------
+PREFETCH_WORKERS = 2
+# 사용자별로 한 시간 동안 미리 생성에 쓸 수 있는 최대 호출 수
+PREFETCH_MAX_PER_HOUR = 12
+
+class RecommendationPrefetcher:
+    def __init__(self, workers: int = PREFETCH_WORKERS, max_per_hour: int = PREFETCH_MAX_PER_HOUR):
+        # 스크립트 실행과 무관하게 살아 있는 스레드 풀에서 recommend_recipes를 미리 호출
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recipe-prefetch")
+        self.max_per_hour = max_per_hour
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, tuple] = {}
+        # 사용자별로 마지막에 결과를 넘겨준 입력. 입력이 바뀌기 전에는 다시 생성하지 않음
+        self._taken: Dict[str, str] = {}
+        self._submitted: Dict[str, deque] = {}
+
+    @staticmethod
+    def plan(inventory: List[Dict], deficiency: Dict, meal_history: List[Dict]):
+        # (카탈로그 추천, GPT로 채울 개수, 제외할 이름). 페이지와 미리 생성이 같은 계획을 쓰도록 한 곳에서 계산
+        recipes = get_recipe_catalog().rank(inventory, deficiency, meal_history, k=RECIPE_RECOMMEND_COUNT)
+        return recipes, RECIPE_RECOMMEND_COUNT - len(recipes), [recipe['name'] for recipe in recipes]
+
+    @staticmethod
+    def input_key(inventory: List[Dict], deficiency: Dict, meal_history: List[Dict], count: int, exclude: List[str]) -> str:
+        payload = {
+            "inventory": [(item['name'], item['quantity'], item['unit'], str(item.get('expiry_date', ''))[:10]) for item in inventory],
+            "deficiency": {k: round(float(v), 1) for k, v in deficiency.items()},
+            "recent": [meal['recipe_name'] for meal in meal_history[-RECENT_MEAL_WINDOW:]],
+            "count": count,
+            "exclude": exclude,
+        }
+        return hashlib.md5(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _within_quota(self, user_id: str) -> bool:
+        submitted = self._submitted.setdefault(user_id, deque())
+        now = time.time()
+        while submitted and now - submitted[0] > 3600:
+            submitted.popleft()
+        return len(submitted) < self.max_per_hour
+
+    def schedule(self, user_id: str, gpt_client: "GPTClient", inventory: List[Dict], deficiency: Dict, meal_history: List[Dict]) -> bool:
+        if not inventory:
+            return False
+        _, remaining, exclude = RecommendationPrefetcher.plan(inventory, deficiency, meal_history)
+        if remaining <= 0:
+            return False
+        key = RecommendationPrefetcher.input_key(inventory, deficiency, meal_history, remaining, exclude)
+
+        with self._lock:
+            job = self._jobs.get(user_id)
+            if (job is not None and job[0] == key) or self._taken.get(user_id) == key:
+                return False
+            if job is not None:
+                # 아직 시작 전이면 취소, 이미 실행 중이면 결과를 버리도록 새 작업으로 교체
+                job[1].cancel()
+            if not self._within_quota(user_id):
+                self._jobs.pop(user_id, None)
+                return False
+            self._submitted[user_id].append(time.time())
+            future = self.pool.submit(
+                gpt_client.recommend_recipes, list(inventory), dict(deficiency), list(meal_history[-RECENT_MEAL_WINDOW:]),
+                count=remaining, exclude=exclude
+            )
+            self._jobs[user_id] = (key, future)
+        return True
+
+    def take(self, user_id: str, inventory: List[Dict], deficiency: Dict, meal_history: List[Dict], count: int,
+             exclude: List[str], timeout: float = OPENAI_TIMEOUT) -> Optional[List[Dict]]:
+        # 입력이 같은 작업이 있으면 (진행 중이면 기다려서) 결과를 넘겨주고, 없으면 None
+        key = RecommendationPrefetcher.input_key(inventory, deficiency, meal_history, count, exclude)
+        with self._lock:
+            job = self._jobs.get(user_id)
+            if job is None or job[0] != key:
+                return None
+            del self._jobs[user_id]
+        try:
+            recipes = job[1].result(timeout=timeout)
+        except Exception:
+            return None
+        with self._lock:
+            self._taken[user_id] = key
+        return recipes
+
+@st.cache_resource
+def get_recommendation_prefetcher() -> RecommendationPrefetcher:
+    return RecommendationPrefetcher()
+
+# -------------------------------------------------------------------------
+# 사용자 상태 메모리 관리
+# -------------------------------------------------------------------------
+# 세션에 유지하는 목록의 최대 길이. 초과분은 저장소에 기록된 뒤 오래된 것부터 메모리에서 제거
+HISTORY_CAPS = {
+    "meal_history": HOT_MEAL_LIMIT,
+    "expenses": HOT_EXPENSE_LIMIT,
+}
+# 사용자 한 명이 상한을 넘으면 기록 목록을 이 길이까지 더 줄임
+USER_MEMORY_BUDGET = 512 * 1024
+HISTORY_MIN_WINDOW = 50
+# 이 시간 동안 실행이 없던 세션은 저장소에 기록하고 메모리에서 내림 (다음 접속 시 다시 읽어옴)
+SESSION_IDLE_SECONDS = 30 * 60
+# 전체 사용자 상태가 이 크기를 넘으면 오래 쉰 세션부터 내림. 단, 최근 이 시간 안에 실행된 세션은 제외
+PROCESS_MEMORY_BUDGET = 64 * 1024 * 1024
+SESSION_MIN_IDLE_SECONDS = 60
+
+class UserStateRegistry:
+    def __init__(self, idle_seconds: float = SESSION_IDLE_SECONDS, memory_budget: int = PROCESS_MEMORY_BUDGET):
+        self.idle_seconds = idle_seconds
+        self.memory_budget = memory_budget
+        self._lock = threading.Lock()
+        # session_id -> {user_id, state, bytes, last_seen, running}. 마지막 실행 순서(LRU)로 유지
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.evicted = 0
+
+    @staticmethod
+    def value_bytes(value) -> int:
+        if isinstance(value, InventoryStore):
+            value = value.to_list(include_id=True)
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    @staticmethod
+    def estimate_bytes(state) -> int:
+        # 기록 목록(식사/지출)은 끝에 추가만 되므로 목록별 (객체, 길이, 크기)를 보관해 새로 붙은 항목만 계산
+        cache = state['_state_bytes'] if '_state_bytes' in state else {}
+        total = 0
+        for key in USER_STATE_KEYS:
+            if key not in state or key == '_state_bytes':
+                continue
+            value = state[key]
+            if key in HISTORY_CAPS and isinstance(value, list):
+                cached = cache.get(key)
+                if cached and cached[0] is value and cached[1] <= len(value):
+                    size = cached[2] + sum(UserStateRegistry.value_bytes(entry) for entry in value[cached[1]:])
+                else:
+                    size = sum(UserStateRegistry.value_bytes(entry) for entry in value)
+                cache[key] = (value, len(value), size)
+            else:
+                # 프로필, 재고, 집계 등 크기가 정해진 값은 그대로 계산
+                size = UserStateRegistry.value_bytes(value)
+            total += size
+        state['_state_bytes'] = cache
+        return total
+
+    @staticmethod
+    def _trim(state, key: str, keep: int):
+        # 앞쪽 항목을 잘라내고, 이미 크기를 센 항목이면 보관한 크기에서도 뺌
+        value = state[key]
+        removed = len(value) - keep
+        cache = state['_state_bytes'] if '_state_bytes' in state else {}
+        cached = cache.get(key)
+        if cached and cached[0] is value and cached[1] <= len(value):
+            counted = min(removed, cached[1])
+            size = cached[2] - sum(UserStateRegistry.value_bytes(entry) for entry in value[:counted])
+            cache[key] = (value, cached[1] - counted, size)
+        del value[:removed]
+
+    @staticmethod
+    def truncate(state, budget: int = USER_MEMORY_BUDGET) -> int:
+        # 상한을 넘은 목록을 오래된 것부터 잘라내고 추정 크기를 반환
+        for key, cap in HISTORY_CAPS.items():
+            if key in state and len(state[key]) > cap:
+                UserStateRegistry._trim(state, key, cap)
+        size = UserStateRegistry.estimate_bytes(state)
+        if size > budget:
+            for key in ("meal_history", "expenses"):
+                if key in state and len(state[key]) > HISTORY_MIN_WINDOW:
+                    UserStateRegistry._trim(state, key, HISTORY_MIN_WINDOW)
+            size = UserStateRegistry.estimate_bytes(state)
+        if '_persisted' in state:
+            # 잘린 항목은 이미 저장소에 기록되었으므로 기준 개수도 맞춤
+            state['_persisted'] = dict(
+                state['_persisted'], meal_count=len(state['meal_history']), expense_count=len(state['expenses'])
+            )
+        return size
+
+    def begin(self):
+        # 실행 시작 시 호출. 실행 중인 세션은 다른 세션의 정리 대상에서 제외
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return
+        with self._lock:
+            entry = self._sessions.get(ctx.session_id)
+            if entry is not None:
+                entry['running'] = True
+                entry['last_seen'] = time.time()
+
+    def track(self, storage: Optional[Storage]):
+        # 현재 세션을 기록(실행 끝에 저장 후 호출)하고, 유휴/초과 세션을 정리
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return
+        # 저장소가 없으면 잘라낸 기록을 되살릴 수 없으므로 크기만 잼
+        if storage is None:
+            size = UserStateRegistry.estimate_bytes(st.session_state)
+        else:
+            size = UserStateRegistry.truncate(st.session_state)
+        with self._lock:
+            self._sessions.pop(ctx.session_id, None)
+            self._sessions[ctx.session_id] = {
+                "user_id": st.session_state.user_id,
+                # 실행마다 새로 만들어지는 래퍼이므로 가장 최근 것을 보관
+                "state": ctx.session_state,
+                "bytes": size,
+                "last_seen": time.time(),
+                "running": False,
+            }
+        self.evict(storage, ctx.session_id)
+
+    def evict(self, storage: Optional[Storage], current_session: Optional[str] = None) -> int:
+        # 저장소가 없으면 내린 상태를 되살릴 수 없으므로 정리하지 않음
+        if storage is None:
+            return 0
+        now = time.time()
+        with self._lock:
+            # 연결이 끊긴 세션은 목록에서만 제거
+            if runtime.exists():
+                active = runtime.get_instance().is_active_session
+                for session_id in [sid for sid in self._sessions if not active(sid)]:
+                    del self._sessions[session_id]
+            total = sum(entry['bytes'] for entry in self._sessions.values())
+            victims = []
+            for session_id, entry in self._sessions.items():
+                if session_id == current_session or not entry['bytes']:
+                    continue
+                idle = now - entry['last_seen']
+                # 실행 중 표시는 중단된 실행으로 남을 수 있으므로 유휴 한도까지만 인정
+                if entry['running'] and idle <= self.idle_seconds:
+                    continue
+                if idle > self.idle_seconds or (total > self.memory_budget and idle > SESSION_MIN_IDLE_SECONDS):
+                    victims.append((session_id, entry))
+                    total -= entry['bytes']
+
+        evicted = 0
+        for session_id, entry in victims:
+            # 고른 뒤 실행이 시작된 세션은 건너뜀. 내리는 동안 begin()이 끼어들지 않도록 잠금 안에서 처리
+            with self._lock:
+                if entry['running'] and time.time() - entry['last_seen'] <= self.idle_seconds:
+                    continue
+                state = entry['state']
+                StateManager.persist(storage, state)
+                for key in USER_STATE_KEYS:
+                    if key in state:
+                        del state[key]
+                entry['bytes'] = 0
+                self.evicted += 1
+                evicted += 1
+        return evicted
+
+    @staticmethod
+    def process_rss() -> Optional[int]:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def gauge(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            sessions = [
+                {
+                    "user_id": entry['user_id'],
+                    "bytes": entry['bytes'],
+                    "idle_seconds": now - entry['last_seen'],
+                    "resident": bool(entry['bytes']),
+                }
+                for entry in self._sessions.values()
+            ]
+            evicted = self.evicted
+        return {
+            "sessions": len(sessions),
+            "resident_sessions": sum(1 for s in sessions if s['resident']),
+            "users": len({s['user_id'] for s in sessions}),
+            "tracked_bytes": sum(s['bytes'] for s in sessions),
+            "budget_bytes": self.memory_budget,
+            "evicted": evicted,
+            "rss_bytes": UserStateRegistry.process_rss(),
+            "by_session": sessions,
+        }
+
+@st.cache_resource
+def get_user_state_registry() -> UserStateRegistry:
+    return UserStateRegistry()
+
+# -------------------------------------------------------------------------
+# 목록 페이지 나누기
+# -------------------------------------------------------------------------
+PAGE_SIZE_OPTIONS = [10, 20, 50, 100]
+# 항목 수가 이 값을 넘으면 기본 보기를 표 모드로
+TABLE_MODE_THRESHOLD = 50
+
+class ListView:
+    @staticmethod
+    def date_window(entries: List[Dict], start: str, end: str, field: str = 'date'):
+        # entries는 field 기준 오름차순(추가 순서)이므로 이진 탐색으로 기간 구간의 [lo, hi)만 구함
+        lo = bisect.bisect_left(entries, start, key=lambda entry: entry[field][:10])
+        hi = bisect.bisect_right(entries, end, key=lambda entry: entry[field][:10])
+        return lo, hi
+
+    @staticmethod
+    def date_filter(key: str, entries: List[Dict], field: str = 'date', first_date: Optional[str] = None):
+        # (lo, hi, 시작일, 종료일). first_date는 메모리에 없는 더 오래된 기록까지 고를 수 있게 할 때 사용
+        if not entries:
+            return 0, 0, None, None
+        first = datetime.fromisoformat(min(entries[0][field], first_date or entries[0][field])[:10]).date()
+        last = max(datetime.fromisoformat(entries[-1][field][:10]).date(), first)
+        # 위젯 값은 세션에 남으므로, 사용자가 끝 날짜를 직접 바꾸지 않았으면(지난 실행의 마지막 날짜 그대로)
+        # 이후에 추가된 기록까지 보이도록 끝 날짜를 새 마지막 날짜로 옮김
+        range_key = f"{key}_range"
+        bounds = st.session_state.get(f"{key}_range_bounds")
+        selected = st.session_state.get(range_key)
+        if not selected or bounds is None:
+            selected = (first, last)
+        else:
+            selected = tuple(selected) if isinstance(selected, (tuple, list)) else (selected,)
+            start = min(max(selected[0], first), last)
+            if len(selected) > 1:
+                end = last if selected[-1] == bounds[1] else min(max(selected[-1], start), last)
+                selected = (start, end)
+            else:
+                selected = (start,)
+        st.session_state[range_key] = selected
+        st.session_state[f"{key}_range_bounds"] = (first, last)
+        selected = st.date_input("기간", min_value=first, max_value=last, key=range_key)
+        # 시작일만 고른 상태에서는 하루치로 간주
+        if isinstance(selected, (tuple, list)):
+            start, end = (selected[0], selected[-1]) if selected else (first, last)
+        else:
+            start = end = selected
+        return (*ListView.date_window(entries, start.isoformat(), end.isoformat(), field), start.isoformat(), end.isoformat())
+
+    @staticmethod
+    def paginate(key: str, total: int):
+        # (시작, 끝, 표 모드 여부). 목록/표 모두 현재 페이지 구간만 그리도록 범위만 계산
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            mode = st.radio(
+                "보기", ["목록", "표"], horizontal=True, key=f"{key}_mode",
+                index=1 if total > TABLE_MODE_THRESHOLD else 0
+            )
+        with col2:
+            page_size = st.selectbox("페이지당 항목", PAGE_SIZE_OPTIONS, key=f"{key}_size")
+        pages = max(1, math.ceil(total / page_size))
+        # 삭제 등으로 페이지 수가 줄어든 경우 마지막 페이지로 맞춤
+        if st.session_state.get(f"{key}_page", 1) > pages:
+            st.session_state[f"{key}_page"] = pages
+        with col3:
+            page = st.number_input("페이지", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+        start = (page - 1) * page_size
+        end = min(start + page_size, total)
+        if total:
+            st.caption(f"총 {total:,}개 중 {start + 1:,}-{end:,}번째")
+        return start, end, mode == "표"
+
+    @staticmethod
+    def newest_first(entries: List[Dict], lo: int, hi: int, start: int, end: int) -> List[Dict]:
+        # entries[lo:hi]를 최신순으로 봤을 때 [start, end) 구간. 전체를 뒤집지 않고 필요한 만큼만 자름
+        if start >= end:
+            return []
+        return entries[max(lo, hi - end):hi - start][::-1]
+
+    @staticmethod
+    def history(key: str, table: str):
+        # (현재 페이지 항목(최신순), 표 모드 여부). 메모리에 둔 최근 기록으로 먼저 채우고,
+        # 그보다 오래된 페이지로 넘어가면 해당 구간만 저장소에서 읽음
+        storage = get_storage()
+        user_id = st.session_state.user_id
+        entries = st.session_state[table]
+        first_date = storage.first_history_date(table, user_id) if storage else None
+        lo, hi, start_date, end_date = ListView.date_filter(key, entries, first_date=first_date)
+        hot = hi - lo
+        total = hot
+        unsaved = 0
+        if storage and start_date:
+            # 아직 저장되지 않은 기록은 목록 끝에 있고, 저장된 기록은 메모리의 최근 구간 다음에 저장소에서 이어짐
+            unsaved = max(0, hi - max(lo, st.session_state._persisted[HISTORY_TABLES[table]]))
+            total = max(hot, storage.count_history(table, user_id, start_date, end_date) + unsaved)
+        start, end, table_mode = ListView.paginate(key, total)
+        page = ListView.newest_first(entries, lo, hi, start, min(end, hot))
+        if end > hot:
+            offset = max(start, hot)
+            load = storage.load_meal_page if table == "meal_history" else storage.load_expense_page
+            page += load(user_id, start_date, end_date, offset - unsaved, end - offset)
+        return page, table_mode
+
+# -------------------------------------------------------------------------
+# 부분 갱신 (fragment)
+# -------------------------------------------------------------------------
+# 프래그먼트 -> 화면에 그리는 세션 데이터. 데이터가 바뀌면 현재 페이지에서 이를 읽는 프래그먼트만 다시 그림
+FRAGMENT_DEPENDENCIES = {
+    "inventory_input": set(),
+    "expiring_items": {"inventory"},
+    "inventory_list": {"inventory"},
+    "expense_list": {"expenses", "meal_history"},
+    "profile": {"user_profile"},
+    "nutrition_summary": {"nutrition_status", "inventory", "nutrient_recipes"},
+    "meal_history": {"meal_history"},
+    "recommendations": {"inventory", "recommended_recipes", "selected_recipe_index"},
+}
+
+class FragmentScope:
+    # 실행 중인 프래그먼트 이름 (스크립트 실행 스레드별)
+    _local = threading.local()
+
+    @staticmethod
+    def fragment(name: str):
+        # FRAGMENT_DEPENDENCIES의 이름을 key로 쓰는 프래그먼트.
+        # 프래그먼트만 다시 실행될 때는 main()의 초기화/저장 단계를 거치지 않으므로 여기서 처리
+        def decorator(func):
+            @st.fragment(key=name)
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                fragment_run = not st.session_state.get('_full_run')
+                if fragment_run:
+                    get_user_state_registry().begin()
+                    # 유휴 세션 정리로 사용자 상태가 내려갔으면 저장소에서 다시 읽어옴
+                    StateManager.initialize(get_storage(), StateManager.resolve_user_id())
+                else:
+                    st.session_state._page_fragments.append(name)
+                FragmentScope._local.current = name
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    FragmentScope._local.current = None
+                    # 여러 프래그먼트를 함께 다시 실행하면 마지막 프래그먼트에서 한 번만 저장
+                    if fragment_run and FragmentScope._ends_run(name):
+                        storage = get_storage()
+                        StateManager.persist(storage)
+                        get_user_state_registry().track(storage)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _ends_run(name: str) -> bool:
+        queue = st.session_state.get('_rerun_queue')
+        if queue and queue[-1] != name:
+            return False
+        st.session_state.pop('_rerun_queue', None)
+        return True
+
+    @staticmethod
+    def on_click(*changed: str, action=None, args: tuple = ()):
+        # 위젯 콜백. 가벼운 변경은 action으로 여기서 처리하고, GPT 호출처럼 오래 걸리는 변경은
+        # 현재 프래그먼트 본문에서 처리. 현재 프래그먼트를 먼저, 바뀐 데이터를 읽는 프래그먼트를 그 뒤에 다시 실행
+        current = getattr(FragmentScope._local, 'current', None)
+
+        def callback():
+            if action is not None:
+                action(*args)
+            FragmentScope.rerun(current, *changed)
+        return callback
+
+    @staticmethod
+    def refresh():
+        # 현재 프래그먼트를 처음부터 다시 그림. 함께 다시 실행 중이던 뒤쪽 프래그먼트도 이어서 실행됨
+        if st.session_state.get('_full_run'):
+            st.rerun()
+        st.rerun(scope="fragment")
+
+    @staticmethod
+    def rerun(current: Optional[str], *changed: str):
+        page = st.session_state.get('_page_fragments', [])
+        if current not in page:
+            # 프래그먼트 밖의 위젯은 원래대로 전체를 다시 실행
+            return
+        readers = [name for name in page if name != current and FRAGMENT_DEPENDENCIES[name] & set(changed)]
+        targets = [current] + readers
+        st.session_state._rerun_queue = targets
+        try:
+            st.rerun(targets)
+        except StreamlitAPIException:
+            # 등록되지 않은 프래그먼트가 있으면 전체를 다시 실행
+            st.session_state.pop('_rerun_queue', None)
+            st.rerun()
 
 # -------------------------------------------------------------------------
 # UI 렌더링 함수
@@ -289,6 +3226,8 @@ def render_recipe_ui(gpt_client, recipe, index, key_suffix, origin_list_key=None
         
         with col2:
             st.subheader("영양 정보")
+            if recipe.get('nutrition_source') == "local":
+                st.caption("재료 기준으로 다시 계산한 값입니다")
             nutrition = recipe['nutrition']
             nutri_map = {"calories": "칼로리", "protein": "단백질", "carbs": "탄수화물", "fat": "지방"}
             unit_map = {"calories": "kcal", "protein": "g", "carbs": "g", "fat": "g"}
@@ -308,99 +3247,89 @@ def render_recipe_ui(gpt_client, recipe, index, key_suffix, origin_list_key=None
         
         with col_btn2:
             if show_use_btn:
-                if st.button("이 레시피 사용", key=f"use_{index}_{key_suffix}"):
+                if st.button("이 레시피 사용", key=f"use_{index}_{key_suffix}", on_click=FragmentScope.on_click(
+                    "inventory", "meal_history", "nutrition_status", "selected_recipe_index"
+                )):
                     with st.spinner("재고를 확인중입니다..."):
                         try:
-                            check_prompt = f"""현재 재고로 이 레시피를 만들 수 있는지 엄격하게 확인하지 말고, 통상적인 식재료 무게를 고려하여 유연하게 판단해주세요.
-
-현재 재고: {json.dumps(st.session_state.inventory, ensure_ascii=False)}
-레시피 재료: {json.dumps(recipe['ingredients'], ensure_ascii=False)}
-
-**핵심 판단 기준 (단위 변환)**:
-1. 재고는 '개' 단위이고 레시피는 'g/ml' 단위일 경우, 아래 평균 무게를 기준으로 변환하여 판단하세요.
-    - 양파 1개 ≈ 200g, 감자 1개 ≈ 150g, 당근 1개 ≈ 150g, 달걀 1개 ≈ 50g, 대파 1대 ≈ 80g, 마늘 1쪽 ≈ 5g
-
-2. 예시: 
-    - 재고 '양파 1개' vs 레시피 '양파 150g' -> **충분함 (true)**
-    - 재고 '양파 1개' vs 레시피 '양파 300g' -> 부족함 (false)
-
-다음 JSON 형식으로만 응답해주세요:
-{{
-    "sufficient": true or false,
-    "missing_items": ["부족한 재료1 (필요: X, 보유: Y)", ...]
-}}"""
-                            
-                            check_response = gpt_client.client.chat.completions.create(
-                                model="gpt-4o",
-                                messages=[{"role": "user", "content": check_prompt}],
-                                temperature=0.3
+                            check_result = gpt_client.check_recipe_sufficiency(
+                                st.session_state.inventory.to_list(),
+                                recipe['ingredients'],
+                                tolerance=st.session_state.sufficiency_tolerance
                             )
                             
-                            check_content = check_response.choices[0].message.content.strip()
-                            check_content = check_content.replace("```json", "").replace("```", "").strip()
-                            check_result = json.loads(check_content)
-                            
                             if not check_result['sufficient']:
                                 st.error(f"❌ 재고가 부족합니다! 부족한 재료: {', '.join(check_result['missing_items'])}")
                             else:
                                 with st.spinner("재고를 업데이트중입니다..."):
                                     updated_inventory = gpt_client.update_inventory_after_cooking(
-                                        st.session_state.inventory,
+                                        st.session_state.inventory.to_list(),
                                         recipe['ingredients']
                                     )
-                                    st.session_state.inventory = updated_inventory
+                                    st.session_state.inventory.replace_all(updated_inventory)
                                     
-                                    st.session_state.meal_history.append({
+                                    meal = {
                                         'date': datetime.now().isoformat(),
                                         'recipe_name': recipe['name'],
-                                        'nutrition': recipe['nutrition']
-                                    })
-                                    
-                                    daily_intake = {}
-                                    for meal in st.session_state.meal_history:
-                                        date_key = meal['date'][:10]
-                                        if date_key not in daily_intake:
-                                            daily_intake[date_key] = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
-                                        
-                                        daily_intake[date_key]['calories'] += meal['nutrition']['calories']
-                                        daily_intake[date_key]['protein'] += meal['nutrition']['protein']
-                                        daily_intake[date_key]['carbs'] += meal['nutrition']['carbs']
-                                        daily_intake[date_key]['fat'] += meal['nutrition']['fat']
-                                    
-                                    days_count = len(daily_intake)
-                                    if days_count > 0:
-                                        avg_nutrition = {
-                                            'calories': sum(d['calories'] for d in daily_intake.values()) / days_count,
-                                            'protein': sum(d['protein'] for d in daily_intake.values()) / days_count,
-                                            'carbs': sum(d['carbs'] for d in daily_intake.values()) / days_count,
-                                            'fat': sum(d['fat'] for d in daily_intake.values()) / days_count
-                                        }
-                                        st.session_state.nutrition_status['daily_average'] = avg_nutrition
-                                        
-                                        target = st.session_state.nutrition_status['daily_target']
-                                        st.session_state.nutrition_status['deficiency'] = {
-                                            k: max(0, target[k] - avg_nutrition[k]) for k in target.keys()
-                                        }
+                                        'nutrition': recipe['nutrition'],
+                                        'ingredients': recipe['ingredients']
+                                    }
+                                    # 재료별 평균 구매 단가로 계산한 한 끼 재료비
+                                    cost = ExpenseLedger.meal_cost(recipe['ingredients'], st.session_state.expense_summary['prices'])
+                                    if cost is not None:
+                                        meal['cost'] = cost
+                                    NutritionTracker.record_meal(meal)
+                                    ExpenseLedger.add_meal(st.session_state.expense_summary, meal)
                                     
                                     st.success("✅ 재고가 업데이트되었습니다!")
                                     
                                     if origin_list_key == 'recommended_recipes':
+                                        # 사용한 레시피만 남겨서 다시 그림
                                         st.session_state.selected_recipe_index = index
-                                        
-                                    st.rerun()
+                                        FragmentScope.refresh()
                         except Exception as e:
                             st.error(f"오류 발생: {str(e)}")
             
             if show_delete_btn:
-                if st.button("삭제", key=f"del_rec_{index}_{key_suffix}"):
-                    if origin_list_key and origin_list_key in st.session_state:
-                        st.session_state[origin_list_key] = []
-                        st.session_state.selected_recipe_index = None
-                        st.rerun()
+                st.button("삭제", key=f"del_rec_{index}_{key_suffix}", on_click=FragmentScope.on_click(
+                    origin_list_key, "selected_recipe_index", action=clear_recipes, args=(origin_list_key,)
+                ))
+
+def clear_recipes(origin_list_key: Optional[str]):
+    if origin_list_key and origin_list_key in st.session_state:
+        st.session_state[origin_list_key] = []
+        st.session_state.selected_recipe_index = None
+
+def render_call_estimate(estimate: Dict):
+    # 버튼 옆에 표시하는 호출 전 예상치 (로컬 카탈로그로 채워지면 실제 호출은 없거나 더 적음)
+    text = f"GPT 호출 시 예상 입력 약 {estimate['tokens']:,}토큰"
+    if estimate['completion_tokens']:
+        text += f" · 출력 약 {estimate['completion_tokens']:,.0f}토큰"
+    if estimate['cost_usd'] is not None:
+        text += f" · 약 ${estimate['cost_usd']:.4f}" + ("" if estimate['completion_tokens'] else " (입력 기준)")
+    st.caption(text)
+
+def render_call_usage(usage: Optional[Dict]):
+    # 호출 후 CallMetrics와 같은 기준으로 집계한 실제 사용량
+    if not usage:
+        return
+    if usage['cached'] and not usage['prompt_tokens']:
+        st.caption("실제 사용: 캐시된 응답 (토큰 사용 없음)")
+    elif usage['prompt_tokens']:
+        st.caption(
+            f"실제 사용: 입력 {usage['prompt_tokens']:,} · 출력 {usage['completion_tokens']:,}토큰 · ${usage['cost_usd']:.4f}"
+        )
 
 def render_inventory_page(gpt_client: GPTClient):
     st.header("🥗 냉장고 재고 관리")
     
+    render_inventory_input(gpt_client)
+    render_expiring_items()
+    render_inventory_list()
+    render_expense_list()
+
+@FragmentScope.fragment("inventory_input")
+def render_inventory_input(gpt_client: GPTClient):
     st.subheader("재고 추가")
     
     tab1, tab2 = st.tabs(["텍스트 입력", "영수증 사진"])
@@ -411,94 +3340,189 @@ def render_inventory_page(gpt_client: GPTClient):
             placeholder="예: 달걀 10개, 우유 1L, 양파 3개",
             height=100
         )
-        if st.button("텍스트로 재고 추가", type="primary"):
+        if st.button("텍스트로 재고 추가", type="primary", on_click=FragmentScope.on_click("inventory")):
             if text_input:
                 with st.spinner("식재료 정보를 분석중입니다..."):
                     try:
                         parsed_items = gpt_client.parse_inventory_from_text(text_input)
+                        now = datetime.now()
                         for item in parsed_items:
-                            item['added_date'] = datetime.now().isoformat()
-                            item['expiry_date'] = (datetime.now() + timedelta(days=7)).isoformat()
-                            st.session_state.inventory.append(item)
+                            item['added_date'] = now.isoformat()
+                            item['expiry_date'] = InventoryEngine.default_expiry(item['name'], now)
+                            st.session_state.inventory.add(item)
                         st.success(f"{len(parsed_items)}개 항목이 추가되었습니다!")
-                        st.rerun()
                     except Exception as e:
                         st.error(f"오류 발생: {str(e)}")
     
     with tab2:
-        uploaded_file = st.file_uploader("영수증 사진 업로드", type=['png', 'jpg', 'jpeg'])
-        if uploaded_file and st.button("영수증에서 재고 추가", type="primary"):
-            with st.spinner("영수증을 분석중입니다..."):
+        uploaded_files = st.file_uploader("영수증 사진 업로드", type=['png', 'jpg', 'jpeg'], accept_multiple_files=True)
+        max_concurrency = st.slider("동시 분석 개수", min_value=1, max_value=8, value=RECEIPT_MAX_CONCURRENCY)
+        with st.expander("이미지 전처리 설정", expanded=False):
+            max_edge = st.slider("최대 해상도 (긴 변, px)", min_value=512, max_value=3072, value=RECEIPT_MAX_EDGE, step=128)
+            image_format = st.selectbox("인코딩 형식", ["JPEG", "WEBP", "PNG"], index=0)
+            quality = st.slider("압축 품질", min_value=40, max_value=95, value=RECEIPT_IMAGE_QUALITY)
+            crop = st.checkbox("영수증 영역 자동 자르기", value=True)
+            detail = st.selectbox("이미지 분석 정밀도 (detail)", ["auto", "low", "high"], index=0)
+        
+        if st.session_state.get('last_receipt_report'):
+            before, after = st.session_state.last_receipt_report
+            st.caption(f"최근 업로드 전송 용량: {before / 1024:,.0f} KB → {after / 1024:,.0f} KB")
+        
+        if uploaded_files and st.button("영수증에서 재고 추가", type="primary", on_click=FragmentScope.on_click("inventory", "expenses")):
+            with st.spinner(f"영수증 {len(uploaded_files)}장을 분석중입니다..."):
                 try:
-                    image = Image.open(uploaded_file)
-                    buffered = BytesIO()
-                    image.save(buffered, format="PNG")
-                    image_data = base64.b64encode(buffered.getvalue()).decode()
-                    
-                    parsed_items = gpt_client.parse_inventory_from_image(image_data)
-                    
-                    total_expense = sum(item.get('price', 0) for item in parsed_items)
-                    if total_expense > 0:
-                        st.session_state.expenses.append({
-                            'date': datetime.now().isoformat(),
-                            'amount': total_expense,
-                            'items': ', '.join([item['name'] for item in parsed_items])
-                        })
-                    
-                    for item in parsed_items:
-                        item['added_date'] = datetime.now().isoformat()
-                        item['expiry_date'] = (datetime.now() + timedelta(days=7)).isoformat()
-                        st.session_state.inventory.append(item)
+                    pipeline = ReceiptPipeline(
+                        gpt_client,
+                        max_concurrency=max_concurrency,
+                        preprocess_options={"max_edge": max_edge, "image_format": image_format, "quality": quality, "crop": crop},
+                        detail=detail
+                    )
+                    results = pipeline.run([f.getvalue() for f in uploaded_files])
+                    new_items, new_expenses, errors = ReceiptPipeline.merge_results(results)
+                    if pipeline.size_report:
+                        st.session_state.last_receipt_report = (
+                            sum(before for before, _ in pipeline.size_report),
+                            sum(after for _, after in pipeline.size_report)
+                        )
                     
-                    st.success(f"{len(parsed_items)}개 항목이 추가되었습니다!")
-                    st.rerun()
+                    # 일부 영수증이 실패해도 성공한 결과는 반영. 이 프래그먼트 뒤에 재고/지출 목록이 다시 그려짐
+                    for idx, error in errors:
+                        st.error(f"{uploaded_files[idx].name} 분석 실패: {str(error)}")
+                    if new_items or new_expenses:
+                        for item in new_items:
+                            st.session_state.inventory.add(item)
+                        ExpenseLedger.record_expenses(new_expenses)
+                        st.success(f"{len(new_items)}개 항목이 추가되었습니다!")
                 except Exception as e:
                     st.error(f"오류 발생: {str(e)}")
-    
+
+@FragmentScope.fragment("expiring_items")
+def render_expiring_items():
+    inventory = st.session_state.inventory
+    if not inventory:
+        return
+    st.subheader("⏰ 유통기한 임박")
+    days = st.selectbox("기준", [1, 3, 7], index=[1, 3, 7].index(EXPIRY_SOON_DAYS),
+                        format_func=lambda d: f"{d}일 이내", key="expiry_days")
+    expired = inventory.expired(include_id=True)
+    expiring = inventory.expiring(days, include_id=True)
+    if not expired and not expiring:
+        st.caption("유통기한이 임박한 재료가 없습니다.")
+        return
+
+    today = datetime.now()
+    for item in expired + expiring:
+        days_left = PromptBuilder._days_left(item, today)
+        label = "기한 지남" if days_left < 0 else ("오늘까지" if days_left == 0 else f"D-{days_left}")
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            st.write(f"**{item['name']}** - {item['quantity']}{item['unit']} ({item['expiry_date'][:10]})")
+        with col2:
+            if days_left < 0:
+                st.error(label)
+            else:
+                st.warning(label)
+    if expiring:
+        st.caption("메뉴 추천 시 임박한 재료를 우선 활용합니다.")
+
+@FragmentScope.fragment("inventory_list")
+def render_inventory_list():
     st.subheader("현재 재고")
     if st.session_state.inventory:
-        for idx, item in enumerate(st.session_state.inventory):
-            col1, col2, col3 = st.columns([3, 1, 1])
-            with col1:
-                st.write(f"**{item['name']}** - {item['quantity']}{item['unit']}")
-            with col2:
-                st.write(f"추가: {item['added_date'][:10]}")
-            with col3:
-                if st.button("삭제", key=f"del_{idx}"):
-                    st.session_state.inventory.pop(idx)
-                    st.rerun()
+        items = st.session_state.inventory.to_list(include_id=True)
+        start, end, table_mode = ListView.paginate("inventory_view", len(items))
+        if table_mode:
+            st.dataframe(
+                [{"재료": item['name'], "수량": item['quantity'], "단위": item['unit'], "추가일": item['added_date'][:10],
+                  "유통기한": str(item.get('expiry_date') or '')[:10]} for item in items[start:end]],
+                use_container_width=True, hide_index=True
+            )
+        else:
+            for item in items[start:end]:
+                col1, col2, col3 = st.columns([3, 1, 1])
+                with col1:
+                    st.write(f"**{item['name']}** - {item['quantity']}{item['unit']}")
+                with col2:
+                    st.write(f"기한: {str(item.get('expiry_date') or '-')[:10]}")
+                with col3:
+                    st.button("삭제", key=f"del_{item['id']}", on_click=FragmentScope.on_click(
+                        "inventory", action=remove_inventory_item, args=(item['id'],)
+                    ))
     else:
         st.info("재고가 비어있습니다. 위에서 재고를 추가해주세요.")
-    
+
+def remove_inventory_item(item_id: str):
+    st.session_state.inventory.remove(item_id)
+
+@FragmentScope.fragment("expense_list")
+def render_expense_list():
     st.subheader("💰 지출 내역")
+    summary = st.session_state.expense_summary
     if st.session_state.expenses:
-        total = sum(exp['amount'] for exp in st.session_state.expenses)
-        st.metric("총 지출", f"{total:,}원")
+        # 합계/차트/단가는 모두 증분 집계에서 읽음
+        meals = summary['meals']
+        col1, col2, col3 = st.columns(3)
+        col1.metric("총 지출", f"{summary['total']:,.0f}원")
+        col2.metric("이번 달", f"{summary['monthly'].get(datetime.now().strftime('%Y-%m'), 0):,.0f}원")
+        col3.metric("한 끼 평균 재료비", f"{meals['total'] / meals['count']:,.0f}원" if meals['count'] else "-")
+        
+        period_labels = {"daily": "일별", "weekly": "주별", "monthly": "월별"}
+        period = st.radio("집계 단위", list(period_labels), format_func=period_labels.get, horizontal=True, key="expense_period")
+        buckets = ExpenseLedger.recent_buckets(summary, period, EXPENSE_CHART_BUCKETS[period])
+        if buckets:
+            st.bar_chart({"기간": [bucket for bucket, _ in buckets], "지출": [amount for _, amount in buckets]}, x="기간", y="지출")
         
-        for exp in st.session_state.expenses[-5:]:
-            st.write(f"**{exp['date'][:10]}** - {exp['amount']:,}원 ({exp['items']})")
+        if summary['prices']:
+            with st.expander("재료별 구매 단가", expanded=False):
+                rows = []
+                for units in summary['prices'].values():
+                    for unit, entry in units.items():
+                        per = PRICE_DISPLAY_QUANTITY[unit]
+                        rows.append({
+                            "재료": entry['name'], "기준": f"{per}{unit}",
+                            "최근가": round(entry['last'] * per), "평균가": round(entry['total_price'] / entry['total_quantity'] * per),
+                            "최저가": round(entry['min'] * per), "구매 횟수": entry['count'], "최근 구매일": entry['last_date'][:10],
+                        })
+                st.dataframe(sorted(rows, key=lambda row: row['최근 구매일'], reverse=True), use_container_width=True, hide_index=True)
+        
+        page, table_mode = ListView.history("expense_view", "expenses")
+        if table_mode:
+            st.dataframe(
+                [{"날짜": exp['date'][:10], "금액": exp['amount'], "품목": exp['items']} for exp in page],
+                use_container_width=True, hide_index=True
+            )
+        else:
+            for exp in page:
+                st.write(f"**{exp['date'][:10]}** - {exp['amount']:,}원 ({exp['items']})")
     else:
         st.info("지출 내역이 없습니다.")
 
 def render_nutrition_page(gpt_client: GPTClient):
     st.header("📊 영양 분석")
     
+    render_profile_settings(gpt_client)
+    render_nutrition_summary(gpt_client)
+    render_meal_history()
+
+@FragmentScope.fragment("profile")
+def render_profile_settings(gpt_client: GPTClient):
     with st.expander("프로필 설정", expanded=False):
         col1, col2 = st.columns(2)
         with col1:
             age = st.number_input("나이", min_value=1, max_value=120, value=st.session_state.user_profile['age'])
             height = st.number_input("키 (cm)", min_value=100, max_value=250, value=st.session_state.user_profile['height'])
         with col2:
-            gender = st.selectbox("성별", ["남성", "여성"], index=0 if st.session_state.user_profile['gender'] == "male" else 1)
+            gender = st.selectbox("성별", ["남성", "여성"], index=0 if GENDER_ALIASES.get(st.session_state.user_profile['gender']) == "male" else 1)
             weight = st.number_input("몸무게 (kg)", min_value=30, max_value=200, value=st.session_state.user_profile['weight'])
         
+        saved_activity = st.session_state.user_profile['activity_level']
         activity_level = st.selectbox(
             "활동량",
-            ["매우 적음", "적음", "보통", "활동적", "매우 활동적"],
-            index=2
+            ACTIVITY_LEVELS,
+            index=ACTIVITY_LEVELS.index(saved_activity) if saved_activity in ACTIVITY_LEVELS else 2
         )
         
-        if st.button("프로필 저장 및 영양 목표 계산"):
+        if st.button("프로필 저장 및 영양 목표 계산", on_click=FragmentScope.on_click("user_profile", "nutrition_status")):
             st.session_state.user_profile.update({
                 'age': age,
                 'gender': gender,
@@ -507,14 +3531,29 @@ def render_nutrition_page(gpt_client: GPTClient):
                 'activity_level': activity_level
             })
             
-            with st.spinner("영양 목표를 계산중입니다..."):
+            target = NutritionCalculator.calculate(st.session_state.user_profile)
+            st.session_state.user_profile['daily_calories'] = target['calories']
+            st.session_state.nutrition_status['daily_target'] = target
+            st.session_state.nutrition_explanation = None
+            NutritionTracker.refresh(st.session_state.daily_intake, st.session_state.nutrition_status)
+            st.success("영양 목표가 업데이트되었습니다!")
+        
+        if st.button("AI에게 계산 근거 설명 듣기"):
+            with st.spinner("설명을 생성중입니다..."):
                 try:
-                    target = gpt_client.calculate_nutrition_target(st.session_state.user_profile)
-                    st.session_state.nutrition_status['daily_target'] = target
-                    st.success("영양 목표가 업데이트되었습니다!")
-                    st.rerun()
+                    st.session_state.nutrition_explanation = gpt_client.explain_nutrition_target(
+                        st.session_state.user_profile,
+                        st.session_state.nutrition_status['daily_target']
+                    )
                 except Exception as e:
                     st.error(f"오류 발생: {str(e)}")
+        
+        if st.session_state.get('nutrition_explanation'):
+            st.caption(f"💡 {st.session_state.nutrition_explanation}")
+
+@FragmentScope.fragment("nutrition_summary")
+def render_nutrition_summary(gpt_client: GPTClient):
+    NutritionTracker.refresh(st.session_state.daily_intake, st.session_state.nutrition_status)
     
     st.subheader("일일 권장 섭취량")
     target = st.session_state.nutrition_status['daily_target']
@@ -555,42 +3594,82 @@ def render_nutrition_page(gpt_client: GPTClient):
                     st.progress(ratio, text=f"현재 섭취: {ratio*100:.0f}%")
 
         st.write("") 
-        if st.button("✨ 부족한 영양소를 채워줄 메뉴 추천받기", type="primary", use_container_width=True):
-            with st.spinner("영양 밸런스를 위한 최적의 메뉴를 찾고 있습니다..."):
-                try:
-                    recipes = gpt_client.recommend_nutrient_rich_recipes(deficient_items, st.session_state.inventory)
-                    st.session_state.nutrient_recipes = recipes
-                except Exception as e:
-                    st.error(f"추천 중 오류 발생: {str(e)}")
+        streamed = False
+        col_button, col_estimate = st.columns([3, 2])
+        with col_estimate:
+            render_call_estimate(gpt_client.estimate_nutrient_rich_recipes(deficient_items, st.session_state.inventory.to_list()))
+        with col_button:
+            clicked = st.button("✨ 부족한 영양소를 채워줄 메뉴 추천받기", type="primary", use_container_width=True)
+        if clicked:
+            st.session_state.nutrient_recipes = []
+            st.write("---")
+            st.write("### 🥗 추천 보양 메뉴")
+            inventory = st.session_state.inventory.to_list()
+            # 로컬 카탈로그에서 먼저 고르고, 모자란 개수만 GPT로 새로 생성
+            for recipe in get_recipe_catalog().rank(
+                inventory, deficient_items, st.session_state.meal_history,
+                k=NUTRIENT_RECIPE_COUNT, weights=NUTRIENT_SCORE_WEIGHTS, min_overlap=0.0
+            ):
+                recipe = RecipeCatalog.annotate_for_deficiency(recipe, deficient_items, inventory)
+                render_recipe_ui(gpt_client, recipe, len(st.session_state.nutrient_recipes), "nutrient", origin_list_key='nutrient_recipes', show_use_btn=True, show_delete_btn=False)
+                st.session_state.nutrient_recipes.append(recipe)
+                streamed = True
 
-        if 'nutrient_recipes' in st.session_state and st.session_state.nutrient_recipes:
+            remaining = NUTRIENT_RECIPE_COUNT - len(st.session_state.nutrient_recipes)
+            if remaining > 0:
+                with st.spinner("영양 밸런스를 위한 최적의 메뉴를 찾고 있습니다..."):
+                    try:
+                        for recipe in gpt_client.stream_nutrient_rich_recipes(
+                            deficient_items, inventory, count=remaining,
+                            exclude=[r['name'] for r in st.session_state.nutrient_recipes]
+                        ):
+                            render_recipe_ui(gpt_client, recipe, len(st.session_state.nutrient_recipes), "nutrient", origin_list_key='nutrient_recipes', show_use_btn=True, show_delete_btn=False)
+                            st.session_state.nutrient_recipes.append(recipe)
+                            streamed = True
+                    except Exception as e:
+                        st.error(f"추천 중 오류 발생: {str(e)}")
+                render_call_usage(gpt_client.last_usage)
+
+        if not streamed and 'nutrient_recipes' in st.session_state and st.session_state.nutrient_recipes:
             st.write("---")
             st.write("### 🥗 추천 보양 메뉴")
             
             for idx, recipe in enumerate(st.session_state.nutrient_recipes):
                 render_recipe_ui(gpt_client, recipe, idx, "nutrient", origin_list_key='nutrient_recipes', show_use_btn=True, show_delete_btn=False)
 
+@FragmentScope.fragment("meal_history")
+def render_meal_history():
     st.divider()
     st.subheader("📅 최근 식사 기록")
     
     if st.session_state.meal_history:
-        for meal in reversed(st.session_state.meal_history):
-            try:
-                dt = datetime.fromisoformat(meal['date'])
-                date_str = dt.strftime("%Y-%m-%d %H:%M")
-            except:
-                date_str = meal['date']
+        page, table_mode = ListView.history("meal_view", "meal_history")
+        if table_mode:
+            st.dataframe(
+                [{"날짜": meal['date'][:16].replace("T", " "), "메뉴": meal['recipe_name'],
+                  "칼로리": meal['nutrition']['calories'], "단백질": meal['nutrition']['protein'],
+                  "탄수화물": meal['nutrition']['carbs'], "지방": meal['nutrition']['fat'], "재료비": meal.get('cost')}
+                 for meal in page],
+                use_container_width=True, hide_index=True
+            )
+        else:
+            for meal in page:
+                try:
+                    dt = datetime.fromisoformat(meal['date'])
+                    date_str = dt.strftime("%Y-%m-%d %H:%M")
+                except:
+                    date_str = meal['date']
             
-            with st.container():
-                c1, c2 = st.columns([3, 1])
-                with c1:
-                    st.write(f"**{meal['recipe_name']}**")
-                    st.caption(f"{date_str}")
-                with c2:
-                    n = meal['nutrition']
-                    st.write(f"{n['calories']} kcal")
-                    st.caption(f"탄수화물:{n['carbs']} 단백질:{n['protein']} 지방:{n['fat']}")
-            st.divider()
+                with st.container():
+                    c1, c2 = st.columns([3, 1])
+                    with c1:
+                        st.write(f"**{meal['recipe_name']}**")
+                        st.caption(f"{date_str}" + (f" · 재료비 약 {meal['cost']:,}원" if meal.get('cost') is not None else ""))
+                    with c2:
+                        n = meal['nutrition']
+                        st.write(f"{n['calories']} kcal")
+                        st.caption(f"탄수화물:{n['carbs']} 단백질:{n['protein']} 지방:{n['fat']}")
+                st.divider()
     else:
         st.info("아직 식사 기록이 없습니다. 메뉴 추천에서 요리를 완료해보세요!")
 
@@ -601,20 +3680,89 @@ def render_recommendation_page(gpt_client: GPTClient):
         st.warning("재고가 없습니다. 먼저 재고를 추가해주세요.")
         return
     
-    if st.button("레시피 추천받기", type="primary"):
-        with st.spinner("맞춤 레시피를 생성중입니다..."):
-            try:
-                recipes = gpt_client.recommend_recipes(
-                    st.session_state.inventory,
-                    st.session_state.nutrition_status['deficiency'],
-                    st.session_state.meal_history
+    render_recommendations(gpt_client)
+
+@FragmentScope.fragment("recommendations")
+def render_recommendations(gpt_client: GPTClient):
+    streamed = False
+    col_button, col_estimate = st.columns([1, 3])
+    with col_estimate:
+        render_call_estimate(gpt_client.estimate_recipes(
+            st.session_state.inventory.to_list(),
+            st.session_state.nutrition_status['deficiency'],
+            st.session_state.meal_history,
+            urgent=st.session_state.inventory.expiring(limit=RECOMMEND_URGENT_COUNT)
+        ))
+    with col_button:
+        clicked = st.button("레시피 추천받기", type="primary")
+    if clicked:
+        st.session_state.recommended_recipes = []
+        st.session_state.selected_recipe_index = None
+        inventory = st.session_state.inventory.to_list()
+        deficiency = st.session_state.nutrition_status['deficiency']
+
+        # 로컬 카탈로그에서 먼저 고르고, 조건에 맞는 레시피가 모자랄 때만 GPT로 생성
+        catalog_recipes, remaining, exclude = RecommendationPrefetcher.plan(inventory, deficiency, st.session_state.meal_history)
+        for recipe in catalog_recipes:
+            render_recipe_ui(
+                gpt_client,
+                recipe,
+                len(st.session_state.recommended_recipes),
+                "recommend",
+                origin_list_key='recommended_recipes',
+                show_use_btn=True,
+                show_delete_btn=False
+            )
+            st.session_state.recommended_recipes.append(recipe)
+            streamed = True
+
+        prefetched = None
+        if remaining > 0:
+            # 재고가 바뀔 때 백그라운드에서 미리 만들어 둔 결과가 있으면 바로 사용
+            prefetched = get_recommendation_prefetcher().take(
+                st.session_state.user_id, inventory, deficiency, st.session_state.meal_history, remaining, exclude
+            )
+        if prefetched:
+            for recipe in prefetched:
+                render_recipe_ui(
+                    gpt_client,
+                    recipe,
+                    len(st.session_state.recommended_recipes),
+                    "recommend",
+                    origin_list_key='recommended_recipes',
+                    show_use_btn=True,
+                    show_delete_btn=False
                 )
-                st.session_state.recommended_recipes = recipes
-                st.session_state.selected_recipe_index = None
-            except Exception as e:
-                st.error(f"오류 발생: {str(e)}")
+                st.session_state.recommended_recipes.append(recipe)
+                streamed = True
+        elif remaining > 0:
+            with st.spinner("맞춤 레시피를 생성중입니다..."):
+                try:
+                    # 레시피가 하나 완성될 때마다 바로 카드로 표시
+                    for recipe in gpt_client.stream_recipes(
+                        inventory,
+                        deficiency,
+                        st.session_state.meal_history,
+                        count=remaining,
+                        exclude=exclude,
+                        urgent=st.session_state.inventory.expiring(limit=RECOMMEND_URGENT_COUNT)
+                    ):
+                        render_recipe_ui(
+                            gpt_client,
+                            recipe,
+                            len(st.session_state.recommended_recipes),
+                            "recommend",
+                            origin_list_key='recommended_recipes',
+                            show_use_btn=True,
+                            show_delete_btn=False
+                        )
+                        st.session_state.recommended_recipes.append(recipe)
+                        streamed = True
+                except Exception as e:
+                    st.error(f"오류 발생: {str(e)}")
+            render_call_usage(gpt_client.last_usage)
     
-    if 'recommended_recipes' in st.session_state and st.session_state.recommended_recipes:
+    if not streamed and 'recommended_recipes' in st.session_state and st.session_state.recommended_recipes:
         selected_idx = st.session_state.selected_recipe_index
         
         if selected_idx is None:
@@ -642,7 +3790,75 @@ def render_recommendation_page(gpt_client: GPTClient):
                 )
             else:
                 st.session_state.selected_recipe_index = None
+                for idx, recipe in enumerate(st.session_state.recommended_recipes):
+                    render_recipe_ui(gpt_client, recipe, idx, "recommend", origin_list_key='recommended_recipes')
+
+# 진단 화면은 프로세스 전체(모든 사용자)의 호출 기록과 세션 정보를 보여주므로 운영자에게만 노출
+ADMIN_MODE = os.environ.get("TAISTE_ADMIN", "").lower() in ("1", "true", "yes")
+
+def render_diagnostics_page():
+    st.header("🛠️ 진단")
+    if not ADMIN_MODE:
+        st.error("진단 화면은 관리자 모드(TAISTE_ADMIN)에서만 볼 수 있습니다.")
+        return
+    
+    metrics = get_call_metrics()
+    records = metrics.records()
+    
+    st.subheader("GPT 호출 통계")
+    if records:
+        summary = metrics.summary()
+        live_calls = sum(row['calls'] - row['cache_hits'] for row in summary)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("전체 호출", f"{len(records):,}")
+        with col2:
+            st.metric("API 호출", f"{live_calls:,}")
+        with col3:
+            st.metric("예상 비용", f"${sum(row['cost_usd'] for row in summary):.4f}")
+        
+        st.dataframe(summary, use_container_width=True)
+        
+        st.subheader("최근 호출")
+        st.dataframe(list(reversed(records[-50:])), use_container_width=True)
+        
+        col_export, col_clear = st.columns(2)
+        with col_export:
+            st.download_button(
+                "JSON Lines로 내보내기",
+                data=metrics.to_jsonl(),
+                file_name="gpt_calls.jsonl",
+                mime="application/jsonl"
+            )
+        with col_clear:
+            if st.button("기록 초기화"):
+                metrics.clear()
                 st.rerun()
+    else:
+        st.info("아직 기록된 GPT 호출이 없습니다.")
+    
+    st.subheader("응답 캐시")
+    st.json(get_response_cache().stats())
+    
+    st.subheader("세션 메모리")
+    gauge = get_user_state_registry().gauge()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("세션 (메모리 상주)", f"{gauge['resident_sessions']} / {gauge['sessions']}")
+    with col2:
+        st.metric("사용자 상태", f"{gauge['tracked_bytes'] / 1024:,.0f} KB")
+    with col3:
+        st.metric("내린 세션", f"{gauge['evicted']:,}")
+    with col4:
+        rss = gauge['rss_bytes']
+        st.metric("프로세스 RSS", f"{rss / 1024 / 1024:,.0f} MB" if rss else "-")
+    st.progress(min(1.0, gauge['tracked_bytes'] / gauge['budget_bytes']), text=f"상한 {gauge['budget_bytes'] / 1024 / 1024:.0f} MB 대비")
+    if gauge['by_session']:
+        st.dataframe(
+            [{"사용자": s['user_id'][:4] + "…", "상태 크기(KB)": round(s['bytes'] / 1024, 1),
+              "유휴(초)": round(s['idle_seconds']), "메모리 상주": s['resident']} for s in gauge['by_session']],
+            use_container_width=True, hide_index=True
+        )
 
 def main():
     st.set_page_config(
@@ -651,7 +3867,10 @@ def main():
         layout="wide"
     )
     
-    StateManager.initialize()
+    storage = get_storage()
+    # 다른 세션의 정리 작업이 실행 도중 상태를 내리지 않도록 먼저 실행 중으로 표시
+    get_user_state_registry().begin()
+    StateManager.initialize(storage, StateManager.resolve_user_id())
     
     if 'api_key' not in st.session_state:
         st.session_state.api_key = None
@@ -659,6 +3878,7 @@ def main():
     with st.sidebar:
         st.title("tAIste")
         st.caption("똑똑한 냉장고 관리 & 맞춤 메뉴 추천")
+        st.caption(f"사용자 ID: `{st.session_state.user_id}` (주소를 저장하면 기록이 유지됩니다)")
         
         # [수정됨] 사이드바에서 API 키 입력 (기본값 제거)
         api_key = st.text_input(
@@ -670,18 +3890,12 @@ def main():
         
         if api_key and api_key != st.session_state.api_key:
             if api_key.startswith("sk-"):
-                try:
-                    test_client = OpenAI(api_key=api_key)
-                    # 간단한 테스트 호출로 유효성 검사
-                    test_client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[{"role": "user", "content": "Hi"}],
-                        max_tokens=5
-                    )
+                valid, error = get_client_registry().validate(api_key)
+                if valid:
                     st.session_state.api_key = api_key
                     st.success("✅ API 키가 확인되었습니다!")
-                except Exception as e:
-                    st.error(f"❌ API 키가 올바르지 않습니다: {str(e)}")
+                else:
+                    st.error(f"❌ API 키가 올바르지 않습니다: {error}")
                     st.session_state.api_key = None
             else:
                 st.error("❌ API 키는 'sk-'로 시작해야 합니다")
@@ -691,16 +3905,61 @@ def main():
         
         page = st.radio(
             "메뉴",
-            ["재고 관리", "메뉴 추천", "영양 분석"], 
+            ["재고 관리", "메뉴 추천", "영양 분석"] + (["진단"] if ADMIN_MODE else []), 
             index=0
         )
+        
+        st.session_state.sufficiency_tolerance = st.slider(
+            "재고 판단 허용 오차",
+            min_value=0.0,
+            max_value=0.5,
+            value=st.session_state.sufficiency_tolerance,
+            step=0.05,
+            help="레시피 필요량보다 이 비율만큼 부족해도 만들 수 있다고 판단합니다"
+        )
+        
+        if ADMIN_MODE:
+            cache_stats = get_response_cache().stats()
+            st.caption(
+                f"응답 캐시: 적중 {cache_stats['hits'] + cache_stats['disk_hits']} / "
+                f"미스 {cache_stats['misses']} ({cache_stats['hit_rate']*100:.0f}%)"
+            )
+            gauge = get_user_state_registry().gauge()
+            st.caption(
+                f"메모리: 세션 {gauge['resident_sessions']}개 · 사용자 상태 {gauge['tracked_bytes'] / 1024:,.0f} KB"
+                + (f" · RSS {gauge['rss_bytes'] / 1024 / 1024:,.0f} MB" if gauge['rss_bytes'] else "")
+            )
+    
+    if page == "진단":
+        get_user_state_registry().track(storage)
+        render_diagnostics_page()
+        return
     
     if not st.session_state.api_key:
+        get_user_state_registry().track(storage)
         st.warning("👈 사이드바에서 OpenAI API 키를 입력해주세요.")
         return
 
+    # 프래그먼트만 다시 실행되는 경우와 구분하기 위한 표시. 이번 페이지에 그려진 프래그먼트를 다시 모음
+    st.session_state._full_run = True
+    st.session_state._page_fragments = []
+    st.session_state.pop('_rerun_queue', None)
     try:
-        gpt_client = GPTClient(st.session_state.api_key)
+        gpt_client = GPTClient(
+            st.session_state.api_key,
+            cache=get_response_cache(),
+            client=get_client_registry().get(st.session_state.api_key),
+            metrics=get_call_metrics()
+        )
+        
+        # 추천 입력(재고, 부족 영양소, 최근 식사)이 바뀌었으면 백그라운드에서 추천을 미리 생성
+        get_recommendation_prefetcher().schedule(
+            st.session_state.user_id,
+            gpt_client,
+            st.session_state.inventory.to_list(),
+            st.session_state.nutrition_status['deficiency'],
+            st.session_state.meal_history
+        )
         
         if page == "재고 관리":
             render_inventory_page(gpt_client)
@@ -711,6 +3970,12 @@ def main():
             
     except Exception as e:
         st.error(f"API 연결 오류: {str(e)}")
+    finally:
+        # st.rerun()으로 실행이 중단되어도 변경 내용을 저장소에 기록
+        st.session_state._full_run = False
+        StateManager.persist(storage)
+        # 기록 목록 상한 적용, 메모리 집계, 유휴 세션 정리
+        get_user_state_registry().track(storage)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit_app
+
+SCRIPT = """
+import streamlit as st
+import streamlit_app
+st.session_state['full_runs'] = st.session_state.get('full_runs', 0) + 1
+streamlit_app.main()
+"""
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    monkeypatch.setattr(streamlit_app, "STORAGE_DB_PATH", str(tmp_path / "taiste.db"))
+    streamlit_app.get_storage.clear()
+    at = AppTest.from_string(SCRIPT, default_timeout=60)
+    at.query_params["uid"] = "fragments"
+    at.session_state["api_key"] = "sk-test"
+    at.run()
+    yield at
+    streamlit_app.get_storage.clear()
+
+
+def button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+def test_inventory_writes_rerun_only_page_fragments(app):
+    assert app.session_state["_page_fragments"] == ["inventory_input", "expiring_items", "inventory_list", "expense_list"]
+
+    app.text_area[0].input("달걀 10개, 양파 3개")
+    button(app, "텍스트로 재고 추가").click()
+    app.run()
+    assert not app.exception
+    assert app.session_state["full_runs"] == 1
+    assert "**달걀** - 10개" in [m.value for m in app.markdown]
+
+    button(app, "삭제").click()
+    app.run()
+    assert not app.exception
+    assert app.session_state["full_runs"] == 1
+    assert [item["name"] for item in app.session_state["inventory"].to_list()] == ["양파"]
+    # 프래그먼트 실행 끝에 한 번 저장
+    assert [item["name"] for item in streamlit_app.get_storage().load_inventory("fragments")] == ["양파"]
+
+
+def test_profile_save_stays_fragment_scoped(app):
+    app.run()
+    app.sidebar.radio[0].set_value("영양 분석")
+    app.run()
+    full_runs = app.session_state["full_runs"]
+
+    button(app, "프로필 저장 및 영양 목표 계산").click()
+    app.run()
+    assert not app.exception
+    assert app.session_state["full_runs"] == full_runs
+    assert [s.value for s in app.success] == ["영양 목표가 업데이트되었습니다!"]
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit_app import GPTClient
+
+
+def recipe(name, calories=500):
+    return {"name": name, "reason": "", "ingredients": ["양파 1개"], "missing_ingredients": [], "steps": ["볶기"],
+            "nutrition": {"calories": calories, "protein": 10, "carbs": 50, "fat": 10}, "youtube_query": name}
+
+
+class FakeCompletions:
+    def __init__(self, streamed: str):
+        self.streamed = streamed
+        self.repair_requests = []
+
+    def create(self, stream=False, **kwargs):
+        if stream:
+            return [
+                SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=self.streamed[i:i + 7]))])
+                for i in range(0, len(self.streamed), 7)
+            ]
+        # 형식 수정 요청: 고칠 대상을 기록하고 스키마에 맞는 결과를 돌려줌
+        self.repair_requests.append(kwargs['messages'][0]['content'])
+        content = json.dumps({"recipes": [recipe("된장찌개"), recipe("잡채")]}, ensure_ascii=False)
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_stream_repairs_invalid_items():
+    broken_calories = dict(recipe("된장찌개"), nutrition={"calories": "모름"})
+    streamed = "[" + ",".join([
+        json.dumps(recipe("김치볶음밥"), ensure_ascii=False),
+        json.dumps(broken_calories, ensure_ascii=False),
+        '{"name": "잡채", "steps": ["볶기",]}',
+    ]) + "]"
+    completions = FakeCompletions(streamed)
+    client = GPTClient("sk-test", client=SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+    names = [item["name"] for item in client._stream_json_array("recommend_recipes", [{"role": "user", "content": "추천"}], 0.7)]
+
+    assert names == ["김치볶음밥", "된장찌개", "잡채"]
+    assert len(completions.repair_requests) == 1
+    assert "모름" in completions.repair_requests[0] and '"잡채"' in completions.repair_requests[0]
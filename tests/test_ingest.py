@@ -0,0 +1,60 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+import streamlit_app as app
+from streamlit_app import InventoryStore, StateManager, Storage
+
+
+class FakeGPTClient:
+    def parse_inventory_from_text(self, text):
+        return [dict(item, price=1000) for item in app.InventoryEngine.parse_inventory_text(text)[0]]
+
+
+def unit(key, text, date=None):
+    return {"key": key, "kind": "text", "path": "purchases.txt", "line": 1, "text": text, "date": date}
+
+
+def live_session(storage, user_id):
+    # 앱 세션이 저장소에서 읽어 온 상태 (StateManager.initialize와 같은 구성)
+    items, rows = storage.load_inventory_rows(user_id)
+    state = {
+        "user_id": user_id, "user_profile": {}, "nutrition_status": {"daily_target": {}},
+        "inventory": InventoryStore(items), "_inventory_rows": rows, "meal_history": [], "expenses": [],
+    }
+    state["_persisted"] = StateManager._snapshot(state)
+    return state
+
+
+def run_ingest(storage, units):
+    checkpoint = ingest.Checkpoint("")
+    return ingest.ingest(app, FakeGPTClient(), iter(units), [ingest.StoreSink(storage, "u1")], checkpoint, 1, {})
+
+
+def test_ingest_does_not_overwrite_live_session(tmp_path):
+    storage = Storage(str(tmp_path / "taiste.db"))
+    storage.write_batch("u1", inventory=[{"name": "양파", "quantity": 3, "unit": "개"}])
+    state = live_session(storage, "u1")
+
+    run_ingest(storage, [unit("a", "우유 1L")])
+    # 세션은 ingest 이전에 읽은 재고로 요리한 뒤 저장
+    state["inventory"].replace_all([{"name": "양파", "quantity": 1, "unit": "개"}])
+    StateManager.persist(storage, state)
+
+    stored = {item["name"]: item["quantity"] for item in storage.load_inventory("u1")}
+    assert stored == {"양파": 1, "우유": 1}
+
+
+def test_ingest_keeps_expired_backfill_out_of_inventory(tmp_path):
+    storage = Storage(str(tmp_path / "taiste.db"))
+    stats = run_ingest(storage, [
+        unit("old", "우유 1L", date=datetime.now() - timedelta(days=30)),
+        unit("new", "달걀 10개"),
+    ])
+    assert stats["expired"] == 1
+    assert [item["name"] for item in storage.load_inventory("u1")] == ["달걀"]
+    # 지난 영수증의 지출은 그대로 기록
+    assert [expense["items"] for expense in storage.load_recent_expenses("u1", 10)] == ["우유", "달걀"]
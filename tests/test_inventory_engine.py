@@ -0,0 +1,104 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit_app import InventoryEngine
+
+
+def item(name, quantity, unit):
+    return {"name": name, "quantity": quantity, "unit": unit}
+
+
+def test_deduct_skips_compound_ingredients():
+    updated, unresolved = InventoryEngine.deduct([item("고추", 5, "개")], ["고추장 30g"])
+    assert updated == [item("고추", 5, "개")]
+    assert unresolved == []
+
+    updated, _ = InventoryEngine.deduct([item("감자", 2, "개")], ["감자전분 30g"])
+    assert updated == [item("감자", 2, "개")]
+
+
+def test_deduct_matches_cut_of_same_item():
+    updated, _ = InventoryEngine.deduct([item("돼지고기", 500, "g")], ["돼지고기 앞다리살 200g"])
+    assert updated[0]["quantity"] == 300
+
+
+def test_sufficiency_does_not_count_compound_as_stock():
+    # 재고와 맞지 않는 재료는 로컬에서 충분하다고 하지 않고 GPT 판단으로 넘김
+    result, unresolved = InventoryEngine.check_sufficiency([item("고추", 5, "개")], ["고추장 100g"])
+    assert unresolved == ["고추장 100g"]
+
+    result, unresolved = InventoryEngine.check_sufficiency([item("감자", 2, "개")], ["감자전분 30g"])
+    assert unresolved == ["감자전분 30g"]
+
+
+def test_sufficiency_uses_synonyms_and_cuts():
+    inventory = [item("달걀", 6, "개"), item("돼지고기", 500, "g")]
+    result, unresolved = InventoryEngine.check_sufficiency(inventory, ["계란 2개", "돼지고기 앞다리살 300g"])
+    assert result["sufficient"] is True
+    assert unresolved == []
+
+
+def test_sufficiency_resolves_wordy_amounts_elsewhere():
+    result, unresolved = InventoryEngine.check_sufficiency([item("양파", 3, "개")], ["닭고기 반 마리", "달걀 두 개"])
+    assert unresolved == ["닭고기 반 마리", "달걀 두 개"]
+
+    result, unresolved = InventoryEngine.check_sufficiency([item("양파", 3, "개")], ["참기름 약간", "소금 두 꼬집", "양파 1개"])
+    assert result["sufficient"] is True
+    assert unresolved == []
+
+
+def test_sufficiency_strips_prep_modifiers():
+    inventory = [item("마늘", 5, "개"), item("대파", 2, "개")]
+    result, unresolved = InventoryEngine.check_sufficiency(inventory, ["다진 마늘 1큰술", "송송 썬 대파 1대"])
+    assert result == {"sufficient": True, "missing_items": []}
+    assert unresolved == []
+
+    result, _ = InventoryEngine.check_sufficiency([item("마늘", 1, "개")], ["다진 마늘 3큰술"])
+    assert result["sufficient"] is False
+
+
+def test_sufficiency_is_lenient_with_small_seasoning_amounts():
+    result, unresolved = InventoryEngine.check_sufficiency([item("양파", 3, "개")], ["간장 2큰술", "참기름 1작은술", "양파 1개"])
+    assert result["sufficient"] is True
+    assert unresolved == []
+
+    # 양념이라도 많이 쓰면 재고를 확인
+    _, unresolved = InventoryEngine.check_sufficiency([item("양파", 3, "개")], ["간장 200ml"])
+    assert unresolved == ["간장 200ml"]
+
+
+def test_sufficiency_sends_unmatched_names_to_fallback():
+    result, unresolved = InventoryEngine.check_sufficiency([item("닭고기", 500, "g")], ["계육 300g"])
+    assert result["missing_items"] == []
+    assert unresolved == ["계육 300g"]
+
+
+def test_deduct_strips_prep_modifier():
+    updated, unresolved = InventoryEngine.deduct([item("마늘", 100, "g")], ["다진 마늘 10g"])
+    assert updated[0]["quantity"] == 90
+    assert unresolved == []
+
+
+def test_deduct_sends_unmatched_to_fallback():
+    # 재고 이름과 맞추지 못한 재료는 버리지 않고 GPT 차감으로 넘김
+    updated, unresolved = InventoryEngine.deduct([item("양파", 2, "개")], ["대파 1대", "양파 1개"])
+    assert updated[0]["quantity"] == 1
+    assert unresolved == ["대파 1대"]
+
+
+def test_deduct_skips_missing_seasoning_and_optional():
+    updated, unresolved = InventoryEngine.deduct([item("양파", 2, "개")], ["간장 1큰술", "참기름 약간", "소금 1꼬집"])
+    assert updated == [item("양파", 2, "개")]
+    assert unresolved == []
+
+
+def test_parse_multiplies_pack_size_into_quantity():
+    items, unparsed = InventoryEngine.parse_inventory_text("닭가슴살 1kg 2팩, 콜라 500ml 6캔, 비타500 2병")
+    assert items == [
+        {"name": "닭가슴살", "quantity": 2, "unit": "kg"},
+        {"name": "콜라", "quantity": 3000, "unit": "ml"},
+        {"name": "비타500", "quantity": 2, "unit": "개"},
+    ]
+    assert unparsed == []
@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit_app import InventoryStore
+
+
+def item(name, quantity, unit):
+    return {"name": name, "quantity": quantity, "unit": unit}
+
+
+def test_add_merges_convertible_units():
+    store = InventoryStore([item("우유", 1, "L"), item("우유", 500, "ml")])
+    assert store.to_list() == [item("우유", 1.5, "L")]
+
+
+def test_add_keeps_separate_entry_per_unit_dimension():
+    store = InventoryStore([item("우유", 1, "L"), item("우유", 2, "개")])
+    assert store.to_list() == [item("우유", 1, "L"), item("우유", 2, "개")]
+
+    store = InventoryStore([item("닭고기", 500, "g"), item("닭고기", 1, "개")])
+    assert store.to_list() == [item("닭고기", 500, "g"), item("닭고기", 1, "개")]
+
+    store.add(item("닭고기", 300, "g"))
+    assert store.to_list() == [item("닭고기", 800, "g"), item("닭고기", 1, "개")]
+
+
+def test_remove_and_replace_all_keep_ids_per_entry():
+    store = InventoryStore([item("우유", 1, "L"), item("우유", 2, "개")])
+    ids = {entry["unit"]: entry["id"] for entry in store.to_list(include_id=True)}
+
+    store.replace_all([item("우유", 1, "개"), item("우유", 0.5, "L")])
+    assert {entry["unit"]: entry["id"] for entry in store.to_list(include_id=True)} == ids
+
+    removed = store.remove(ids["L"])
+    assert removed["unit"] == "L"
+    store.add(item("우유", 1, "L"))
+    assert len(store) == 2
+
+
+def test_rows_added_during_live_session_merge_on_load():
+    # ingest.py가 앱 사용 중에 따로 추가한 행은 다음에 읽을 때 기존 항목(ID 유지)에 합쳐짐
+    stored = [dict(item("닭가슴살", 500, "g"), id="a1"), item("닭가슴살", 2, "kg"), dict(item("우유", 1, "L"), id="b2")]
+    store = InventoryStore(stored)
+    assert store.to_list(include_id=True) == [dict(item("닭가슴살", 2500, "g"), id="a1"), dict(item("우유", 1, "L"), id="b2")]
@@ -0,0 +1,31 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit_app import RecipeCatalog
+
+
+def recipe(name, ingredients):
+    return {"name": name, "ingredients": ingredients, "steps": [], "youtube_query": name,
+            "nutrition": {"calories": 400, "protein": 20, "carbs": 40, "fat": 10}}
+
+
+def item(name):
+    return {"name": name, "quantity": 1, "unit": "개"}
+
+
+def test_inventory_vector_matches_cuts_but_not_compounds():
+    catalog = RecipeCatalog([
+        recipe("제육볶음", ["돼지고기 앞다리살 300g", "고추장 2큰술", "다진 마늘 1큰술"]),
+        recipe("감자조림", ["감자 2개", "간장 3큰술"]),
+    ])
+    vector = catalog._inventory_vector([item("돼지고기"), item("고추"), item("마늘"), item("감자전분")])
+    owned = {key for key, value in zip(catalog.vocabulary, vector) if value}
+    assert owned == {"돼지고기앞다리살", "마늘"}
+
+
+def test_rank_lists_missing_ingredients():
+    catalog = RecipeCatalog([recipe("감자조림", ["감자 2개", "양파 1개", "간장 3큰술", "물 200ml"])])
+    ranked = catalog.rank([item("감자"), item("양파")], {}, [], k=1, min_overlap=0.0)
+    assert ranked[0]["missing_ingredients"] == ["간장 3큰술"]
@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit_app import Storage
+
+
+def meal(day, name):
+    return {"date": f"2026-03-{day:02d}T12:00:00", "recipe_name": name, "nutrition": {"calories": 500}}
+
+
+def test_meal_page_continues_past_recent_window(tmp_path):
+    storage = Storage(str(tmp_path / "taiste.db"))
+    storage.write_batch("u1", new_meals=[meal(day, f"메뉴{day}") for day in range(1, 11)])
+    assert [m["recipe_name"] for m in storage.load_recent_meals("u1", 3)] == ["메뉴8", "메뉴9", "메뉴10"]
+    # 최근 3개 다음 페이지는 최신순으로 이어짐
+    page = storage.load_meal_page("u1", "2026-03-01", "2026-03-10", 3, 4)
+    assert [m["recipe_name"] for m in page] == ["메뉴7", "메뉴6", "메뉴5", "메뉴4"]
+    assert storage.count_history("meal_history", "u1", "2026-03-02", "2026-03-05") == 4
+    assert storage.first_history_date("meal_history", "u1") == "2026-03-01T12:00:00"
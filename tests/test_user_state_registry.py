@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit_app
+from streamlit_app import Storage, UserStateRegistry
+
+
+def make_registry(monkeypatch, tmp_path):
+    # 메모리 상한을 넘긴 상태에서 다른 세션("other")이 정리를 시도하는 상황
+    registry = UserStateRegistry(idle_seconds=600, memory_budget=1)
+    state = {"user_id": "u1", "meal_history": [{"name": "김치찌개"}]}
+    registry._sessions["other"] = {
+        "user_id": "u1", "state": state, "bytes": 100, "last_seen": time.time(), "running": False,
+    }
+    monkeypatch.setattr(streamlit_app, "get_script_run_ctx", lambda: SimpleNamespace(session_id="other"))
+    return registry, state, Storage(str(tmp_path / "state.db"))
+
+
+def test_evict_skips_session_during_run(monkeypatch, tmp_path):
+    registry, state, storage = make_registry(monkeypatch, tmp_path)
+    registry.begin()
+    # GPT 호출 등으로 실행이 오래 걸려 최소 유휴 시간이 지난 경우
+    registry._sessions["other"]["last_seen"] -= 120
+    assert registry.evict(storage, "current") == 0
+    assert state["meal_history"] == [{"name": "김치찌개"}]
+
+
+def test_evict_after_run_ends(monkeypatch, tmp_path):
+    registry, state, storage = make_registry(monkeypatch, tmp_path)
+    registry._sessions["other"]["last_seen"] -= 120
+    assert registry.evict(storage, "current") == 1
+    assert "meal_history" not in state
+
+
+def test_stale_running_mark_expires(monkeypatch, tmp_path):
+    # 중단된 실행으로 남은 표시는 유휴 한도가 지나면 무시
+    registry, state, storage = make_registry(monkeypatch, tmp_path)
+    registry.begin()
+    registry._sessions["other"]["last_seen"] -= 601
+    assert registry.evict(storage, "current") == 1
+    assert "meal_history" not in state